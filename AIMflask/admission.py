@@ -0,0 +1,280 @@
+# admission.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a stage's queue or the memory budget cannot take more work."""
+
+    def __init__(self, stage, reason, retry_after, message):
+        """
+        Initializes the AdmissionRejected.
+
+        Parameters:
+            stage (str): Stage that rejected the work, or 'memory' for the memory budget.
+            reason (str): 'queue_full', 'queue_timeout', 'memory' or 'too_large'.
+            retry_after (float): Seconds the client should wait before retrying.
+            message (str): Human-readable description.
+        """
+        super().__init__(message)
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """False when the work could never be admitted, however idle the server is."""
+        return self.reason != 'too_large'
+
+
+class _StageLimiter:
+    """Concurrency limit for one stage, with a bounded queue of callers waiting for a slot."""
+
+    def __init__(self, name, concurrency, max_queue, on_change=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.on_change = on_change or (lambda limiter: None)
+        self._condition = threading.Condition()
+        self.active = 0
+        self.queued = 0  # Callers that may be rejected from the queue
+        self.waiting = 0  # All callers waiting for a slot, including patient ones
+
+    def acquire(self, timeout, patient):
+        """
+        Takes a slot, waiting up to `timeout` seconds (indefinitely when `patient`).
+
+        Returns:
+            str: None once a slot is taken, or the rejection reason.
+        """
+        with self._condition:
+            if self.concurrency is None or (self.active < self.concurrency and not self.waiting):
+                self.active += 1
+                self.on_change(self)
+                return None
+            if not patient and self.max_queue is not None and self.queued >= self.max_queue:
+                return 'queue_full'
+
+            deadline = None if patient else time.monotonic() + timeout
+            self.waiting += 1
+            if not patient:
+                self.queued += 1
+            self.on_change(self)
+            try:
+                while self.active >= self.concurrency:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return 'queue_timeout'
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+                if not patient:
+                    self.queued -= 1
+                self.on_change(self)
+            self.active += 1
+            self.on_change(self)
+            return None
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self.on_change(self)
+            # Waiters that timed out may have been the ones woken, so wake them all
+            self._condition.notify_all()
+
+
+class AdmissionController:
+    """
+    Bounds the work admitted into the serving pipeline so bursts are turned away
+    early instead of exhausting memory. Each stage (ingest, download, decode,
+    inference) has a concurrency limit and a bounded queue of requests waiting
+    for a slot; a request finding the queue full, or still waiting after
+    `queue_timeout`, is rejected with AdmissionRejected. A byte budget is shared
+    by request bodies held in memory and the audio being decoded, using
+    estimates reserved before the memory is allocated.
+
+    Work that has already been accepted, such as background jobs and the tracks
+    of a batch request, runs inside `patient()` and waits for capacity instead
+    of being rejected.
+    """
+
+    def __init__(self, stages, memory_budget=None, queue_timeout=1.0, retry_after=2, registry=None):
+        """
+        Initializes the AdmissionController.
+
+        Parameters:
+            stages (dict): Stage name -> (concurrency, max queue depth); None for either means unbounded.
+            memory_budget (int): Bytes that may be reserved at once, or None for no budget.
+            queue_timeout (float): Seconds a request waits in a stage queue before being rejected.
+            retry_after (float): Retry-After seconds suggested to rejected clients.
+            registry (MetricsRegistry): Optional registry the queue depths and rejections are exported to.
+        """
+        self.stages = {
+            name: _StageLimiter(name, concurrency, max_queue, on_change=self._export)
+            for name, (concurrency, max_queue) in stages.items()
+        }
+        self.memory_budget = memory_budget
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._memory_condition = threading.Condition()
+        self._memory_reserved = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        # Counters
+        self._admitted = {name: 0 for name in self.stages}
+        self._rejected = {}
+        self._peak_memory_reserved = 0
+
+        self._queue_depth = self._in_flight = self._rejections = self._reserved_bytes = None
+        if registry is not None:
+            self._queue_depth = registry.gauge(
+                'aim_admission_queue_depth', 'Requests waiting for a slot in each pipeline stage.', ('stage',)
+            )
+            self._in_flight = registry.gauge('aim_admission_in_flight', 'Requests holding a slot in each pipeline stage.', ('stage',))
+            self._rejections = registry.counter(
+                'aim_admission_rejected_total', 'Requests turned away by admission control, by stage and reason.', ('stage', 'reason')
+            )
+            self._reserved_bytes = registry.gauge('aim_admission_memory_reserved_bytes', 'Bytes reserved against the memory budget.')
+            budget = registry.gauge('aim_admission_memory_budget_bytes', 'Memory budget for request bodies and decoded audio.')
+            budget.set(memory_budget or 0)
+        logger.info(
+            "Admission control: " + ', '.join(
+                f"{name} {limiter.concurrency}/{limiter.max_queue}" for name, limiter in self.stages.items()
+            ) + f" (concurrency/queue), memory budget {memory_budget} bytes"
+        )
+
+    @property
+    def patient_caller(self):
+        return getattr(self._local, 'patient', False)
+
+    @contextmanager
+    def patient(self):
+        """Makes the calling thread wait for capacity instead of being rejected."""
+        previous = self.patient_caller
+        self._local.patient = True
+        try:
+            yield
+        finally:
+            self._local.patient = previous
+
+    def _reject(self, stage, reason, message):
+        with self._lock:
+            self._rejected[(stage, reason)] = self._rejected.get((stage, reason), 0) + 1
+        if self._rejections is not None:
+            self._rejections.labels(stage=stage, reason=reason).inc()
+        logger.warning(f"Admission rejected ({stage}, {reason}): {message}")
+        raise AdmissionRejected(stage, reason, self.retry_after, message)
+
+    def _export(self, limiter):
+        if self._queue_depth is not None:
+            self._queue_depth.labels(stage=limiter.name).set(limiter.waiting)
+            self._in_flight.labels(stage=limiter.name).set(limiter.active)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Holds a slot in a pipeline stage for the enclosed block.
+
+        Parameters:
+            name (str): Stage name. Stages without configured limits are not bounded.
+        """
+        limiter = self.stages.get(name)
+        if limiter is None:
+            yield
+            return
+
+        reason = limiter.acquire(self.queue_timeout, self.patient_caller)
+        if reason is not None:
+            self._reject(name, reason, f"The {name} stage is at capacity ({limiter.concurrency} running, {limiter.max_queue} queued).")
+        with self._lock:
+            self._admitted[name] += 1
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def reserve(self, nbytes):
+        """
+        Reserves bytes against the memory budget. Must be paired with `release`.
+
+        Parameters:
+            nbytes (int): Estimated bytes the caller is about to hold in memory.
+
+        Returns:
+            int: The bytes reserved, to pass to `release`.
+        """
+        nbytes = int(nbytes)
+        if self.memory_budget is None or nbytes <= 0:
+            return 0
+        if nbytes > self.memory_budget:
+            self._reject('memory', 'too_large', f"Request needs about {nbytes} bytes, above the {self.memory_budget} byte budget.")
+
+        with self._memory_condition:
+            exhausted = self._memory_reserved + nbytes > self.memory_budget and not self.patient_caller
+            if not exhausted:
+                while self._memory_reserved + nbytes > self.memory_budget:
+                    self._memory_condition.wait()
+                self._memory_reserved += nbytes
+                self._peak_memory_reserved = max(self._peak_memory_reserved, self._memory_reserved)
+            reserved = self._memory_reserved
+        if exhausted:
+            self._reject('memory', 'memory', f"Memory budget exhausted ({reserved} of {self.memory_budget} bytes reserved).")
+        if self._reserved_bytes is not None:
+            self._reserved_bytes.set(reserved)
+        return nbytes
+
+    def release(self, nbytes):
+        """Returns bytes reserved with `reserve` to the budget."""
+        if not nbytes:
+            return
+        with self._memory_condition:
+            self._memory_reserved -= nbytes
+            reserved = self._memory_reserved
+            self._memory_condition.notify_all()
+        if self._reserved_bytes is not None:
+            self._reserved_bytes.set(reserved)
+
+    @contextmanager
+    def memory(self, nbytes):
+        """Reserves `nbytes` of the memory budget for the enclosed block."""
+        reserved = self.reserve(nbytes)
+        try:
+            yield
+        finally:
+            self.release(reserved)
+
+    def stats(self):
+        """
+        Returns admission counters.
+
+        Returns:
+            dict: Per-stage limits, occupancy, admissions and rejections, and memory budget usage.
+        """
+        with self._lock:
+            rejected = dict(self._rejected)
+            admitted = dict(self._admitted)
+        stages = {}
+        for name, limiter in self.stages.items():
+            stages[name] = {
+                'concurrency': limiter.concurrency,
+                'max_queue': limiter.max_queue,
+                'active': limiter.active,
+                'waiting': limiter.waiting,
+                'admitted': admitted[name],
+                'rejected': {reason: count for (stage, reason), count in rejected.items() if stage == name},
+            }
+        return {
+            'stages': stages,
+            'memory': {
+                'budget_bytes': self.memory_budget,
+                'reserved_bytes': self._memory_reserved,
+                'peak_reserved_bytes': self._peak_memory_reserved,
+                'rejected': {reason: count for (stage, reason), count in rejected.items() if stage == 'memory'},
+            },
+        }
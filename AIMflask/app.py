@@ -1,19 +1,48 @@
+import functools
+import hashlib
+import hmac
+import json
 import logging
-from flask import Flask, request, jsonify, send_from_directory
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from flask import Flask, Response, g, request, jsonify, send_file, send_from_directory, stream_with_context, url_for
 from flask_cors import CORS
 import os
+from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
-import yt_dlp
-from moviepy import *
-import uuid
-from datetime import datetime
-import tensorflow as tf
+import tempfile
 from tensorflow.keras.models import load_model
 import numpy as np
-import librosa
 import io
 import boto3
 from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
+from batching import BatchScheduler
+from prediction_cache import PredictionCache, file_digest, hash_stream
+from audio_ingest import IngestRequest, decode_for_model, decoded_audio_bytes, ingest_options
+from batch_ingest import bounded_map, iter_request_tracks
+from spectrogram_ingest import SpectrogramPayloadError, load_spectrograms
+from audio_features import (
+    AGGREGATION_METHODS, TARGET_HEIGHT, TARGET_WIDTH, aggregate_predictions, compute_spectrogram_db, fit_spectrogram,
+    split_windows
+)
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from downloaders import DownloadError, create_downloader
+from download_cache import DownloadCache
+from upload_janitor import UploadJanitor
+from media_delivery import FileDigests, PreviewRenditions
+from jobs import JobManager, JobQueueFull
+from admission import AdmissionController, AdmissionRejected
+from preprocess_pool import PreprocessPool, StageUtilization, shared_input_bytes
+from model_loader import DOWNLOADING, LOADING, ModelLoader
+from model_watcher import ModelWatcher, file_fingerprint, s3_fingerprint
+from aim_common.model_registry import LocalStore, ModelRegistry, S3Store
+from aim_common.inference_backends import TFLiteModel
+from inference_engine import InferenceEngine, with_embedding_output
+from embedding_index import EmbeddingIndex
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, StageMetrics, WorkerSnapshots
 
 # Initialize global model variable
 model = None
@@ -41,6 +70,10 @@ genre_map = {
     'Tollywood': 9
 }
 index_to_genre = {v: k for k, v in genre_map.items()}
+NUM_CLASSES = len(genre_map)
+
+# Bytes of one model-ready (128, 1024, 3) float32 window
+WINDOW_BYTES = TARGET_HEIGHT * TARGET_WIDTH * 3 * np.dtype(np.float32).itemsize
 
 class Config:
     UPLOADED_AUDIO_ALLOW = {'mp3', 'wav', 'ogg'}
@@ -51,73 +84,657 @@ class Config:
     MODEL_LOCAL_PATH = os.path.join('models', 'music_genre_cnn_final.keras')
     MAX_CONTENT_LENGTH = 200 * 1024 * 1024  # Increased to 200 MB
     AWS_REGION = 'us-east-1'  # Set to your S3 bucket's region
+    INFERENCE_BATCHING = True  # Batch spectrograms from concurrent requests into one forward pass
+    BATCH_MAX_SIZE = 16  # Maximum number of spectrograms per forward pass
+    BATCH_MAX_WAIT_MS = 10  # Maximum time a spectrogram waits for others to join its batch
+    MODEL_VERSION = None  # Defaults to a digest of the model file when not set
+    PREDICTION_CACHE = True  # Reuse predictions for previously seen audio content
+    PREDICTION_CACHE_DIR = os.path.join('cache', 'predictions')
+    PREDICTION_CACHE_MAX_ENTRIES = 1024  # Size of the in-memory LRU tier
+    PREDICTION_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Least recently used entries on disk are evicted above this
+    INGEST_IN_MEMORY = True  # Decode uploads from the request buffer instead of a saved copy
+    INGEST_SPOOL_MAX_MEMORY = 32 * 1024 * 1024  # Uploads larger than this spill to a temporary file
+    INGEST_SPOOL_DIR = None  # Directory for spilled uploads (system default when None)
+    INGEST_MAX_FILE_BYTES = None  # Per-file limit enforced while streaming (defaults to MAX_CONTENT_LENGTH)
+    PERSIST_UPLOADS = False  # Keep a copy of uploaded files in UPLOADED_AUDIO_DEST for playback
+    WINDOW_MODE = 'first'  # 'first' classifies the first 1024 frames, 'full' covers the whole track
+    WINDOW_HOP = 512  # Frames between consecutive 1024-frame windows in 'full' mode
+    WINDOW_MAX_COUNT = 16  # Upper bound on windows per track; requests may ask for fewer
+    WINDOW_AGGREGATION = 'mean'  # How window predictions are combined: 'mean', 'max' or 'vote'
+    AUDIO_DOWNLOADER = 'youtube'  # 'youtube' uses yt-dlp, 'local' serves files from LOCAL_MEDIA_DIR offline
+    LOCAL_MEDIA_DIR = 'media'  # Stand-in media for the local downloader, named <video id>.<ext>
+    DOWNLOAD_NATIVE_AUDIO = False  # Keep YouTube's opus/m4a stream and decode it directly instead of transcoding to mp3
+    DOWNLOAD_CACHE = True  # Reuse downloaded audio for URLs with the same video id
+    DOWNLOAD_CACHE_DIR = None  # Defaults to UPLOADED_AUDIO_DEST so cached tracks stay playable
+    DOWNLOAD_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Least recently used downloads are evicted above this
+    DOWNLOAD_CACHE_TTL = 24 * 3600  # Seconds before a cached download is fetched again
+    UPLOAD_JANITOR = True  # Delete stale files from UPLOADED_AUDIO_DEST in the background
+    UPLOAD_MAX_AGE = 24 * 3600  # Seconds since last access before an uploaded file is deleted
+    UPLOAD_MAX_BYTES = 5 * 1024 * 1024 * 1024  # Least recently used uploads are evicted above this
+    UPLOAD_JANITOR_INTERVAL = 60  # Seconds between janitor sweeps
+    UPLOAD_JANITOR_RECONCILE_INTERVAL = None  # Seconds between rescans of the directory to resync the janitor's index; None scans only at startup
+    UPLOADS_CACHE_MAX_AGE = 3600  # Cache-Control max-age for /uploads responses; ETags revalidate after that
+    PREVIEW_RENDITIONS = True  # Serve a small mp3 rendition from /uploads unless ?rendition=original is requested
+    PREVIEW_DIR = os.path.join('cache', 'previews')
+    PREVIEW_BITRATE = '64k'  # Bitrate of the mono preview rendition
+    PREVIEW_SAMPLE_RATE = 22050
+    PREVIEW_WORKERS = 1  # Background transcodes creating previews of newly saved files
+    PREVIEW_MAX_BYTES = 1024 * 1024 * 1024  # Least recently used previews are evicted above this
+    BATCH_MAX_CONTENT_LENGTH = 4 * 1024 * 1024 * 1024  # Request size limit for /classify/batch (archives spool to disk)
+    BATCH_WORKERS = 4  # Tracks from /classify/batch requests decoded and classified at once
+    BATCH_MAX_IN_FLIGHT = 8  # Tracks per batch request held in memory before their result line is sent
+    SPECTROGRAM_MAX_ARRAYS = 64  # Spectrograms accepted in one /classify/spectrogram payload
+    SPECTROGRAM_MAX_FRAMES = 64 * 1024  # Frames per submitted spectrogram (about 25 minutes of audio)
+    JOBS_DIR = 'jobs'  # Uploaded files waiting for a background job
+    JOBS_MAX_WORKERS = 2  # Background jobs running at once
+    JOBS_MAX_QUEUE_DEPTH = 32  # Queued plus running jobs before new ones are rejected
+    JOBS_RESULT_TTL = 600  # Seconds a finished job's result stays available
+    JOBS_RETRY_AFTER = 5  # Retry-After seconds sent when the job queue is full
+    PREPROCESS_WORKERS = 2  # Processes for decode and feature extraction (0 runs them in the request thread)
+    DECODE_SAMPLE_RATE = 22050  # Every upload is resampled to this rate; mel settings are derived from it
+    DECODE_RES_TYPE = 'kaiser_fast'  # librosa resampler used during decode
+    DECODE_OFFSET = 0.0  # Seconds skipped at the start of each track before decoding
+    INFERENCE_BACKEND = 'keras'  # 'keras' serves the .keras model, 'tflite' the exported flatbuffer
+    TFLITE_S3_KEY = 'trained_models/music_genre_cnn_final.tflite'
+    TFLITE_LOCAL_PATH = os.path.join('models', 'music_genre_cnn_final.tflite')
+    TFLITE_NUM_THREADS = None  # Interpreter threads for the TFLite backend (runtime default when None)
+    INFERENCE_ENGINE = True  # Serve Keras models through fixed-signature traced functions instead of model.predict
+    INFERENCE_BUCKETS = (1, 2, 4, 8, 16)  # Padded batch sizes traced by the inference engine
+    INFERENCE_JIT_COMPILE = False  # Compile the engine's forward pass with XLA
+    WARMUP_BATCH_SIZES = None  # Batch sizes run once after loading (defaults to 1 and the largest batch)
+    MODEL_RETRY_AFTER = 5  # Retry-After seconds sent while the model is still loading
+    MODEL_WATCH = False  # Poll the published model and hot-swap new versions without a restart
+    MODEL_WATCH_INTERVAL = 60  # Seconds between polls of the published model
+    MODEL_WATCH_PATH = None  # Watch this local file instead of the S3 object (a stand-in for S3 in development)
+    MODEL_WATCH_MAX_BACKOFF = 3600  # Longest wait in seconds before retrying a published model that failed to load
+    MODEL_KEEP_PREVIOUS = 1  # Replaced models kept in memory for /admin/model/rollback
+    ADMIN_TOKEN = None  # Bearer token for the /admin endpoints; they are disabled when not set
+    MODEL_REGISTRY = False  # Fetch models from the content-addressed registry instead of a single S3 object
+    MODEL_REGISTRY_ROOT = None  # Local directory standing in for the registry bucket (S3 when None)
+    MODEL_REGISTRY_PREFIX = 'trained_models/registry'  # Key prefix of the registry in MODEL_S3_BUCKET
+    MODEL_REGISTRY_VERSION = 'latest'  # Version served; 'latest' follows new publishes when MODEL_WATCH is on
+    MODEL_REGISTRY_CACHE_DIR = os.path.join('cache', 'models')  # Verified artifacts, shared by app processes on a host
+    MODEL_REGISTRY_PART_SIZE = 16 * 1024 * 1024  # Bytes per ranged download request
+    MODEL_REGISTRY_WORKERS = 8  # Parts downloaded in parallel
+    EMBEDDINGS = False  # Also compute the pooled 2048-d track embedding (Keras backend only); requests opt in with embedding=true
+    EMBEDDING_DIM = 2048  # Width of the GlobalAveragePooling2D output of the transfer model
+    EMBEDDING_INDEX = False  # Index embeddings of classified tracks and serve /similar (requires EMBEDDINGS)
+    EMBEDDING_INDEX_DIR = os.path.join('cache', 'embeddings')
+    EMBEDDING_INDEX_IVF_THRESHOLD = 1_000_000  # Tracks above which the index is partitioned and searched approximately
+    EMBEDDING_INDEX_NPROBE = 8  # Partitions scanned per query in approximate mode
+    SIMILAR_MAX_K = 100  # Most results one /similar query may ask for
+    ADMISSION_CONTROL = True  # Bound concurrency, queueing and memory per pipeline stage; bursts get a fast 429
+    ADMISSION_LIMITS = {  # Stage -> (requests running at once, requests queued for a slot); None is unbounded
+        'ingest': (16, 32),
+        'download': (4, 16),
+        'decode': (4, 16),
+        'inference': (32, 64),
+    }
+    ADMISSION_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024  # Bytes of buffered request bodies and estimated decoded audio
+    ADMISSION_QUEUE_TIMEOUT = 2.0  # Seconds a request waits for a stage slot before it is rejected
+    ADMISSION_RETRY_AFTER = 2  # Retry-After seconds sent with admission rejections
+    SERVING_WORKERS = 1  # Processes serving this app (set by serve.py); above 1, jobs are shared through JOBS_DIR and per-process features are refused
+    METRICS_DIR = os.path.join('cache', 'metrics')  # Where each of several serving processes publishes its metrics and stats
+    METRICS_PUBLISH_INTERVAL = 5.0  # Seconds between those snapshots; /metrics and /stats report other workers this far behind
 
-def create_app():
-    global model  # Declare as global to modify the global model variable
-    app = Flask(__name__)
-    app.config.from_object(Config)
-
-    # Initialize CORS
-    CORS(app, resources={r"/*": {"origins": "*"}}, methods=["GET", "POST", "DELETE"])
-
-    # Ensure the upload and models directories exist
-    upload_dir = os.path.abspath(app.config['UPLOADED_AUDIO_DEST'])
-    models_dir = os.path.abspath(app.config['MODELS_DIR'])
-    os.makedirs(upload_dir, exist_ok=True)
-    os.makedirs(models_dir, exist_ok=True)
-    logging.debug(f"Upload directory is set to: {upload_dir}")
-    logging.debug(f"Models directory is set to: {models_dir}")
-
+def create_s3_client(config):
+    """
+    Create the S3 client used to fetch models, or None if AWS is not configured.
+    """
     # Initialize S3 client with the correct region and SSL verification
     try:
         s3_client = boto3.client(
             's3',
-            region_name=app.config['AWS_REGION'],
+            region_name=config['AWS_REGION'],
             verify=True  # Ensures SSL certificates are verified
         )
         logging.info("S3 client initialized successfully.")
+        return s3_client
     except (NoCredentialsError, PartialCredentialsError) as cred_err:
         logging.error(f"AWS Credentials error: {cred_err}")
-        s3_client = None
     except Exception as e:
         logging.exception(f"Failed to initialize S3 client: {e}")
-        s3_client = None
+    return None
+
+def model_artifact(config):
+    """
+    Return the S3 key and local path of the artifact for the configured inference backend.
+    """
+    backend = config['INFERENCE_BACKEND']
+    if backend == 'tflite':
+        return config['TFLITE_S3_KEY'], config['TFLITE_LOCAL_PATH']
+    if backend == 'keras':
+        return config['MODEL_S3_KEY'], config['MODEL_LOCAL_PATH']
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {backend}")
+
+def create_model_registry(config):
+    """
+    Create the model registry client for the configured bucket or local stand-in.
+    """
+    if config['MODEL_REGISTRY_ROOT']:
+        registry_store = LocalStore(os.path.abspath(config['MODEL_REGISTRY_ROOT']))
+    else:
+        registry_store = S3Store(create_s3_client(config), config['MODEL_S3_BUCKET'])
+    return ModelRegistry(
+        registry_store,
+        prefix=config['MODEL_REGISTRY_PREFIX'],
+        cache_dir=os.path.abspath(config['MODEL_REGISTRY_CACHE_DIR']),
+        part_size=config['MODEL_REGISTRY_PART_SIZE'],
+        workers=config['MODEL_REGISTRY_WORKERS']
+    )
+
+def fetch_model_artifact(config, set_state=lambda state: None, model_registry=None):
+    """
+    Make sure the configured model file is available locally, downloading it from the
+    registry or S3 if needed. Returns the local path and the model version.
+    """
+    MODEL_KEY, MODEL_PATH = model_artifact(config)
+    if model_registry is not None:
+        set_state(DOWNLOADING)
+        model_path, manifest = model_registry.fetch(os.path.basename(MODEL_KEY), config['MODEL_REGISTRY_VERSION'])
+        return model_path, config['MODEL_VERSION'] or manifest['version']
+
+    s3_client = create_s3_client(config)
 
     # Download the model from S3 if it doesn't exist locally
-    if s3_client and not os.path.exists(app.config['MODEL_LOCAL_PATH']):
-        logging.info(f"Model not found locally. Downloading from S3: {app.config['MODEL_S3_KEY']}")
+    if s3_client and not os.path.exists(MODEL_PATH):
+        logging.info(f"Model not found locally. Downloading from S3: {MODEL_KEY}")
+        set_state(DOWNLOADING)
         try:
             s3_client.download_file(
-                Bucket=app.config['MODEL_S3_BUCKET'],
-                Key=app.config['MODEL_S3_KEY'],
-                Filename=app.config['MODEL_LOCAL_PATH']
+                Bucket=config['MODEL_S3_BUCKET'],
+                Key=MODEL_KEY,
+                Filename=MODEL_PATH
             )
-            logging.info(f"Model downloaded successfully to {app.config['MODEL_LOCAL_PATH']}")
+            logging.info(f"Model downloaded successfully to {MODEL_PATH}")
+            if config['MODEL_WATCH'] and not config['MODEL_WATCH_PATH']:
+                # Remember which object version was downloaded so the watcher doesn't reload it
+                with open(MODEL_PATH + '.fingerprint', 'w') as f:
+                    f.write(s3_fingerprint(s3_client, config['MODEL_S3_BUCKET'], MODEL_KEY)())
         except ClientError as e:
             if e.response['Error']['Code'] == '404':
                 logging.error("The model file does not exist in the specified S3 bucket.")
             else:
                 logging.exception(f"Failed to download model from S3: {e}")
-            model = None
         except Exception as e:
             logging.exception(f"An unexpected error occurred while downloading the model: {e}")
-            model = None
     elif s3_client:
-        logging.info(f"Model already exists at {app.config['MODEL_LOCAL_PATH']}")
+        logging.info(f"Model already exists at {MODEL_PATH}")
     else:
         logging.error("S3 client is not initialized. Cannot download the model.")
 
-    # Load the trained model if the model file exists
-    MODEL_PATH = app.config['MODEL_LOCAL_PATH']
-    if os.path.exists(MODEL_PATH):
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Model file does not exist at {MODEL_PATH}. Ensure the model is downloaded correctly.")
+
+    # Identify the model so cached predictions from other models are never reused
+    return MODEL_PATH, config['MODEL_VERSION'] or file_digest(MODEL_PATH)[:12]
+
+def create_app(config=None, model_factory=None):
+    """
+    Create the Flask app.
+
+    Parameters:
+        config (dict): Optional settings applied on top of Config.
+        model_factory (callable): Optional; returns a model with a Keras-style `predict(batch, verbose=0)`
+            to serve instead of downloading and loading the configured artifact.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+
+    # Buffer uploads in a sniffing spool so bad files are rejected on their first bytes
+    app.request_class = IngestRequest
+
+    # Initialize CORS
+    CORS(app, resources={r"/*": {"origins": "*"}}, methods=["GET", "POST", "DELETE"])
+
+    # Ensure the upload and models directories exist
+    upload_dir = os.path.abspath(app.config['UPLOADED_AUDIO_DEST'])
+    models_dir = os.path.abspath(app.config['MODELS_DIR'])
+    jobs_dir = os.path.abspath(app.config['JOBS_DIR'])
+    os.makedirs(upload_dir, exist_ok=True)
+    os.makedirs(models_dir, exist_ok=True)
+    os.makedirs(jobs_dir, exist_ok=True)
+    logging.debug(f"Upload directory is set to: {upload_dir}")
+    logging.debug(f"Models directory is set to: {models_dir}")
+
+    def build_model(path):
+        """
+        Load a model file for the configured inference backend.
+        """
+        backend = app.config['INFERENCE_BACKEND']
+        if backend == 'tflite':
+            loaded_model = TFLiteModel(path, num_threads=app.config['TFLITE_NUM_THREADS'])
+        elif app.config['INFERENCE_ENGINE']:
+            keras_model = load_model(path)
+            loaded_model = InferenceEngine(
+                with_embedding_output(keras_model) if app.config['EMBEDDINGS'] else keras_model,
+                bucket_sizes=app.config['INFERENCE_BUCKETS'],
+                jit_compile=app.config['INFERENCE_JIT_COMPILE']
+            )
+        else:
+            loaded_model = load_model(path)
+            if app.config['EMBEDDINGS']:
+                loaded_model = with_embedding_output(loaded_model)
+        logging.info(f"Model loaded successfully from {path} ({backend} backend)")
+        return loaded_model
+
+    # Versioned, checksummed artifacts downloaded in parallel ranges into a cache shared across processes
+    model_registry = None
+    if app.config['MODEL_REGISTRY'] and model_factory is None:
+        model_registry = create_model_registry(app.config)
+
+    def load_model_artifact(set_state):
+        """
+        Download the model if needed and load it. Runs on the model loader thread
+        and returns the loaded model and its version.
+        """
+        model_path, version = fetch_model_artifact(app.config, set_state, model_registry)
+        set_state(LOADING)
+        loaded_model = build_model(model_path)
+        logging.info(f"Model version: {version}")
+        return loaded_model, version
+
+    def load_published_model(fingerprint):
+        """
+        Fetch the currently published model into a versioned file beside the active one and load it.
+        Runs on the model watcher thread and returns the loaded model and its version.
+        """
+        if model_registry is not None and not app.config['MODEL_WATCH_PATH']:
+            # Registry fingerprints are version labels
+            model_path, manifest = model_registry.fetch(os.path.basename(model_artifact(app.config)[0]), fingerprint)
+            return build_model(model_path), manifest['version']
+
+        _, MODEL_PATH = model_artifact(app.config)
+        base, extension = os.path.splitext(os.path.basename(MODEL_PATH))
+        # A name of its own, since every worker of a pre-forked server runs a watcher
+        fd, candidate_path = tempfile.mkstemp(dir=models_dir, prefix=f"{base}.", suffix=f".candidate{extension}")
+        os.close(fd)
         try:
-            model = load_model(MODEL_PATH)
-            logging.info(f"Model loaded successfully from {MODEL_PATH}")
-        except Exception as e:
-            logging.exception(f"Failed to load model: {e}")
-            model = None
-    else:
-        logging.error(f"Model file does not exist at {MODEL_PATH}. Ensure the model is downloaded correctly.")
+            if app.config['MODEL_WATCH_PATH']:
+                shutil.copyfile(app.config['MODEL_WATCH_PATH'], candidate_path)
+            else:
+                watch_s3_client.download_file(
+                    Bucket=app.config['MODEL_S3_BUCKET'],
+                    Key=model_artifact(app.config)[0],
+                    Filename=candidate_path
+                )
+
+            # Content-addressed so earlier versions stay on disk for rollback after a restart;
+            # workers fetching the same version replace the file with identical bytes
+            version = file_digest(candidate_path)[:12]
+            versioned_path = os.path.join(models_dir, f"{base}.{version}{extension}")
+            os.replace(candidate_path, versioned_path)
+        except BaseException:
+            if os.path.exists(candidate_path):
+                os.remove(candidate_path)
+            raise
+        logging.info(f"Fetched published model {fingerprint} as version {version}")
+        return build_model(versioned_path), version
+
+    # Prometheus metrics for each stage of the serving path, exposed on /metrics
+    metrics = MetricsRegistry()
+    stage_metrics = StageMetrics(metrics)
+    bytes_ingested = metrics.counter('aim_ingested_bytes_total', 'Audio bytes received, by source.', ('source',))
+    audio_seconds_decoded = metrics.counter('aim_decoded_audio_seconds_total', 'Seconds of audio decoded for the model.')
+    requests_in_flight = metrics.gauge('aim_http_requests_in_flight', 'Requests currently being handled, by endpoint.', ('endpoint',))
+    request_duration = metrics.histogram(
+        'aim_http_request_duration_seconds', 'End-to-end request latency, by endpoint and status.', ('endpoint', 'status')
+    )
+    streams_cancelled = metrics.counter('aim_stream_cancelled_total', 'Streaming classifications abandoned by the client.')
+    model_batch_size = metrics.histogram(
+        'aim_model_batch_size', 'Spectrograms per model forward pass.', buckets=(1, 2, 4, 8, 16, 32, 64)
+    )
+
+    # Per-stage concurrency limits, bounded queues and a memory budget; without ADMISSION_CONTROL nothing is bounded
+    admission = AdmissionController(
+        stages=app.config['ADMISSION_LIMITS'] if app.config['ADMISSION_CONTROL'] else {},
+        memory_budget=app.config['ADMISSION_MEMORY_BUDGET'] if app.config['ADMISSION_CONTROL'] else None,
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+        retry_after=app.config['ADMISSION_RETRY_AFTER'],
+        registry=metrics
+    )
+
+    def load_injected_model(set_state):
+        """
+        Load the model returned by `model_factory`, skipping S3 and the local artifact.
+        """
+        set_state(LOADING)
+        injected_model = model_factory()
+        return injected_model, app.config['MODEL_VERSION'] or type(injected_model).__name__
+
+    def model_activated(active_model, version):
+        """
+        Expose the active model through the module-level global, for code that still reads it.
+        """
+        global model
+        model = active_model
+
+    # Load and warm up the model in the background so the app can answer health checks immediately
+    warmup_batch_sizes = app.config['WARMUP_BATCH_SIZES']
+    if warmup_batch_sizes is None and app.config['INFERENCE_ENGINE'] and app.config['INFERENCE_BACKEND'] == 'keras':
+        warmup_batch_sizes = list(app.config['INFERENCE_BUCKETS'])
+    elif warmup_batch_sizes is None:
+        warmup_batch_sizes = [1]
+        if app.config['INFERENCE_BATCHING']:
+            warmup_batch_sizes.append(app.config['BATCH_MAX_SIZE'])
+        if app.config['WINDOW_MODE'] == 'full':
+            warmup_batch_sizes.append(app.config['WINDOW_MAX_COUNT'])
+    model_loader = ModelLoader(
+        load_fn=load_model_artifact if model_factory is None else load_injected_model,
+        warmup_fn=lambda loaded_model, batch: loaded_model.predict(batch, verbose=0),
+        warmup_batch_sizes=warmup_batch_sizes,
+        keep_previous=app.config['MODEL_KEEP_PREVIOUS'],
+        on_activate=model_activated
+    )
+    model_loader.start()
+    # Lets serving entry points wait for the model before taking traffic
+    app.extensions['model_loader'] = model_loader
+
+    # Poll the published model and swap new versions in once they are loaded and warmed
+    model_watcher = None
+    watch_s3_client = None
+    fingerprint_fn = None
+    if app.config['MODEL_WATCH'] and model_factory is None:
+        baseline = None
+        if app.config['MODEL_WATCH_PATH']:
+            fingerprint_fn = file_fingerprint(app.config['MODEL_WATCH_PATH'])
+        elif model_registry is not None:
+            registry_name = os.path.basename(model_artifact(app.config)[0])
+            fingerprint_fn = lambda: model_registry.resolve(registry_name, app.config['MODEL_REGISTRY_VERSION'])['version']
+            # Registry fingerprints are versions, so the loaded one is the baseline even if 'latest' moved since
+            baseline = lambda: model_loader.version
+        else:
+            watch_s3_client = create_s3_client(app.config)
+            if watch_s3_client is not None:
+                fingerprint_fn = s3_fingerprint(watch_s3_client, app.config['MODEL_S3_BUCKET'], model_artifact(app.config)[0])
+            else:
+                logging.error("S3 client is not initialized. Model watcher disabled.")
+            fingerprint_path = model_artifact(app.config)[1] + '.fingerprint'
+            if os.path.exists(fingerprint_path):
+                with open(fingerprint_path) as f:
+                    baseline = f.read().strip()
+    if fingerprint_fn is not None:
+        model_watcher = ModelWatcher(
+            model_loader,
+            fingerprint_fn=fingerprint_fn,
+            load_fn=load_published_model,
+            interval=app.config['MODEL_WATCH_INTERVAL'],
+            baseline=baseline,
+            max_backoff=app.config['MODEL_WATCH_MAX_BACKOFF']
+        )
+        model_watcher.start()
+
+    def not_ready_response():
+        """
+        Fast 503 returned while the model is still loading or warming up.
+        """
+        status = model_loader.status()
+        return jsonify({
+            'error': 'Model is not ready yet.',
+            'state': status['state']
+        }), 503, {'Retry-After': str(app.config['MODEL_RETRY_AFTER'])}
+
+    @app.errorhandler(AdmissionRejected)
+    def admission_rejected(e):
+        """
+        Fast 429 returned when a stage or the memory budget is at capacity; 413 when the
+        request could never fit in the memory budget.
+        """
+        if not e.retryable:
+            return jsonify({'error': str(e), 'stage': e.stage}), 413
+        return jsonify({'error': str(e), 'stage': e.stage}), 429, {'Retry-After': str(e.retry_after)}
+
+    def admit_request_body(max_in_memory=None):
+        """
+        Reserve memory for the request body before it is read, for the rest of the request.
+        Bodies larger than `max_in_memory` spill to disk, so only that much is counted.
+        """
+        body_bytes = request.content_length or 0
+        if max_in_memory is not None:
+            body_bytes = min(body_bytes, max_in_memory)
+        g.admitted_body_bytes = admission.reserve(body_bytes)
+
+    @app.teardown_request
+    def release_request_body(exc):
+        if 'admitted_body_bytes' in g:
+            admission.release(g.pop('admitted_body_bytes'))
+
+    def detach_uploads(files):
+        """
+        Take ownership of uploaded files for a streamed response. The request closes its files when
+        its context is torn down, which can happen before a streamed body is generated, so the spooled
+        streams are moved to new FileStorage objects the request no longer knows about. Returns the
+        detached files and a function, to run once the response is closed, that closes them and
+        releases the request body's memory reservation.
+        """
+        detached = []
+        for file in files:
+            detached.append(FileStorage(stream=file.stream, filename=file.filename, name=file.name, headers=file.headers))
+            file.stream = io.BytesIO()  # Closed by the request in place of the spool
+        reserved = g.pop('admitted_body_bytes', 0)
+
+        def close_uploads():
+            for file in detached:
+                file.close()
+            admission.release(reserved)
+        return detached, close_uploads
+
+    def decode_memory(source, options):
+        """
+        Estimate the memory held while a track is decoded and classified: its decoded samples,
+        the model-ready windows and, with preprocessing workers, the copy of an in-memory upload
+        they read from. Reserved in one piece before the decode stage slot is taken, so a request
+        never holds a slot while it waits for memory.
+        """
+        windows = options['max_windows'] if options['mode'] == 'full' else 1
+        audio_bytes = decoded_audio_bytes(
+            source, options['mode'], sample_rate=decode_options['sample_rate'], offset=decode_options['offset']
+        )
+        shared_bytes = shared_input_bytes(source) if preprocess_pool is not None else 0
+        return audio_bytes + windows * WINDOW_BYTES + shared_bytes
+
+    def run_patiently(fn, *args, **kwargs):
+        """
+        Run work that was already accepted, waiting for pipeline capacity instead of being rejected.
+        """
+        with admission.patient():
+            return fn(*args, **kwargs)
+
+    # Initialize the content-addressed prediction cache
+    prediction_cache = None
+    if app.config['PREDICTION_CACHE']:
+        prediction_cache = PredictionCache(
+            cache_dir=os.path.abspath(app.config['PREDICTION_CACHE_DIR']),
+            max_memory_entries=app.config['PREDICTION_CACHE_MAX_ENTRIES'],
+            max_disk_bytes=app.config['PREDICTION_CACHE_MAX_BYTES']
+        )
+
+    # Track how busy the inference stage is so it can be sized against preprocessing
+    inference_utilization = StageUtilization('inference', workers=1)
+
+    def run_model(batch):
+        """
+        Run one forward pass over a batch of spectrograms.
+        """
+        # Read the active model once, so a hot swap takes effect between passes and never during one
+        active_model = model_loader.model
+        model_batch_size.observe(len(batch))
+        with stage_metrics.time('predict'):
+            return inference_utilization.timed(active_model.predict, batch, verbose=0)
+
+    # Start the micro-batching scheduler that shares forward passes between concurrent requests
+    batch_scheduler = None
+    if app.config['INFERENCE_BATCHING']:
+        batch_scheduler = BatchScheduler(
+            predict_fn=run_model,
+            max_batch_size=app.config['BATCH_MAX_SIZE'],
+            max_wait_ms=app.config['BATCH_MAX_WAIT_MS']
+        )
+        batch_scheduler.start()
+
+    # Decode only what the classifier needs, at one fixed sample rate
+    decode_options = {
+        'sample_rate': app.config['DECODE_SAMPLE_RATE'],
+        'offset': app.config['DECODE_OFFSET'],
+        'res_type': app.config['DECODE_RES_TYPE']
+    }
+
+    # Move decode and feature extraction into worker processes
+    preprocess_pool = None
+    if app.config['PREPROCESS_WORKERS'] > 0:
+        def observe_preprocess(timings, audio_seconds):
+            stage_metrics.observe('decode', timings['decode'])
+            stage_metrics.observe('mel', timings['features'])
+            audio_seconds_decoded.inc(audio_seconds)
+
+        preprocess_pool = PreprocessPool(
+            workers=app.config['PREPROCESS_WORKERS'],
+            decode_options=decode_options,
+            observer=observe_preprocess
+        )
+
+    # Downloader for URL submissions and the background job pool for slow requests
+    downloader = create_downloader(app.config, upload_dir)
+    download_cache = None
+    if app.config['DOWNLOAD_CACHE']:
+        if app.config['SERVING_WORKERS'] > 1:
+            # Each process would evict files another has pinned, and single-flight would not span processes
+            raise ValueError("DOWNLOAD_CACHE keeps its index in one process; it cannot be used with SERVING_WORKERS > 1")
+        download_cache = DownloadCache(
+            downloader,
+            cache_dir=os.path.abspath(app.config['DOWNLOAD_CACHE_DIR'] or upload_dir),
+            max_bytes=app.config['DOWNLOAD_CACHE_MAX_BYTES'],
+            ttl=app.config['DOWNLOAD_CACHE_TTL']
+        )
+    owned_by_cache = download_cache is not None and download_cache.cache_dir == upload_dir
+
+    def reserved_upload_name(filename):
+        """
+        Whether an upload saved under this name would be taken for a cached download on restart.
+        """
+        return owned_by_cache and filename.startswith(download_cache.prefix)
+
+    # Keep the upload directory bounded; cached downloads are bounded by the download cache itself
+    upload_janitor = None
+    if app.config['UPLOAD_JANITOR']:
+        if app.config['SERVING_WORKERS'] > 1:
+            # serve.py runs one janitor in the parent instead of one per worker over the same directory
+            raise ValueError("UPLOAD_JANITOR runs in one process; it cannot be used with SERVING_WORKERS > 1")
+        upload_janitor = UploadJanitor(
+            upload_dir,
+            max_age=app.config['UPLOAD_MAX_AGE'],
+            max_bytes=app.config['UPLOAD_MAX_BYTES'],
+            interval=app.config['UPLOAD_JANITOR_INTERVAL'],
+            reconcile_interval=app.config['UPLOAD_JANITOR_RECONCILE_INTERVAL'],
+            exclude_prefixes=(download_cache.prefix,) if owned_by_cache else ()
+        )
+        upload_janitor.start()
+
+    # Content digests double as strong ETags; previews are created once per distinct file content
+    file_digests = FileDigests()
+    preview_renditions = None
+    preview_janitor = None
+    if app.config['PREVIEW_RENDITIONS']:
+        preview_dir = os.path.abspath(app.config['PREVIEW_DIR'])
+        os.makedirs(preview_dir, exist_ok=True)
+        if app.config['UPLOAD_JANITOR']:
+            preview_janitor = UploadJanitor(
+                preview_dir,
+                max_age=app.config['UPLOAD_MAX_AGE'],
+                max_bytes=app.config['PREVIEW_MAX_BYTES'],
+                interval=app.config['UPLOAD_JANITOR_INTERVAL'],
+                reconcile_interval=app.config['UPLOAD_JANITOR_RECONCILE_INTERVAL']
+            )
+            preview_janitor.start()
+        preview_renditions = PreviewRenditions(
+            preview_dir,
+            file_digests,
+            bitrate=app.config['PREVIEW_BITRATE'],
+            sample_rate=app.config['PREVIEW_SAMPLE_RATE'],
+            workers=app.config['PREVIEW_WORKERS'],
+            on_created=preview_janitor.add if preview_janitor is not None else None
+        )
+        if not preview_renditions.available:
+            logging.warning("ffmpeg not found; /uploads will serve original files instead of previews.")
+
+    def track_saved(file_path, content_hash):
+        """
+        Register audio written to the upload directory for cleanup, ETags and a preview rendition.
+        """
+        if os.path.dirname(file_path) != upload_dir:
+            return
+        if upload_janitor is not None:
+            upload_janitor.add(os.path.basename(file_path))
+        file_digests.remember(file_path, content_hash)
+        if preview_renditions is not None:
+            preview_renditions.schedule(file_path)
+
+    # Persistent similarity index over the embeddings of classified tracks
+    embedding_index = None
+    if app.config['EMBEDDING_INDEX']:
+        if app.config['SERVING_WORKERS'] > 1:
+            # Every process would append to the same files with its own row numbering
+            raise ValueError("EMBEDDING_INDEX needs a single serving process; it cannot be used with SERVING_WORKERS > 1")
+        if not app.config['EMBEDDINGS']:
+            logging.warning("EMBEDDING_INDEX needs EMBEDDINGS; the index will stay empty.")
+        embedding_index = EmbeddingIndex(
+            os.path.abspath(app.config['EMBEDDING_INDEX_DIR']),
+            dim=app.config['EMBEDDING_DIM'],
+            ivf_threshold=app.config['EMBEDDING_INDEX_IVF_THRESHOLD'],
+            nprobe=app.config['EMBEDDING_INDEX_NPROBE']
+        )
+
+    def index_track(result, metadata):
+        """
+        Add a classified track's embedding to the similarity index, once per track id.
+        """
+        if embedding_index is not None and result.get('embedding') and result.get('track_id'):
+            embedding_index.add([result['track_id']], np.array([result['embedding']]), [metadata])
+
+    def with_embedding(body, result, options):
+        """
+        Add the track id, and the embedding when the request asked for it, to a response body.
+        """
+        body['track_id'] = result.get('track_id')
+        if options is not None and options['embedding']:
+            body['embedding'] = result.get('embedding')
+        return body
+
+    # Threads driving /classify/batch tracks through decode and the shared inference batches
+    batch_executor = ThreadPoolExecutor(max_workers=app.config['BATCH_WORKERS'], thread_name_prefix='batch')
+
+    job_manager = JobManager(
+        max_workers=app.config['JOBS_MAX_WORKERS'],
+        max_queue_depth=app.config['JOBS_MAX_QUEUE_DEPTH'],
+        result_ttl=app.config['JOBS_RESULT_TTL'],
+        # Any worker may be asked for a job another one is running
+        store_dir=os.path.join(jobs_dir, 'status') if app.config['SERVING_WORKERS'] > 1 else None
+    )
+
+    # Requests to the metrics and health endpoints are not tracked so scrapes don't skew the numbers
+    untracked_endpoints = {'metrics', 'livez', 'readyz'}
+
+    @app.before_request
+    def start_request_metrics():
+        if request.endpoint in untracked_endpoints:
+            return
+        g.request_started_at = time.perf_counter()
+        requests_in_flight.labels(endpoint=request.endpoint).inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started_at' in g:
+            request_duration.labels(endpoint=request.endpoint, status=response.status_code).observe(
+                time.perf_counter() - g.request_started_at
+            )
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if 'request_started_at' in g:
+            requests_in_flight.labels(endpoint=request.endpoint).dec()
 
     @app.route('/')
     def home():
@@ -127,13 +744,15 @@ def create_app():
     def upload_file():
         logging.debug("Received upload request")
 
-        # Access the global model variable
-        if model is None:
-            logging.error("Model is not loaded.")
-            return jsonify({'error': 'Model not loaded.'}), 500
+        # Reject quickly until the model has loaded and warmed up
+        if not model_loader.ready:
+            logging.warning(f"Model is not ready (state: {model_loader.state}).")
+            return not_ready_response()
 
-        # Initialize variables
-        file = request.files.get('file')
+        # Initialize variables; reading the form streams the upload into the ingest spool
+        admit_request_body(app.config['INGEST_SPOOL_MAX_MEMORY'])
+        with admission.stage('ingest'), stage_metrics.time('ingest'):
+            file = request.files.get('file')
         url = None
         song_name = None
         artist = None
@@ -147,33 +766,43 @@ def create_app():
             logging.debug(f"Received JSON data: {data}")
         else:
             # Handle form data
+            data = request.form
             url = request.form.get('url')
             song_name = request.form.get('song_name')
             artist = request.form.get('artist')
             logging.debug(f"Received form data: song_name={song_name}, artist={artist}, url={url}")
 
+        # Resolve how much of the track to analyse
+        try:
+            options = window_options(data)
+        except ValueError as e:
+            logging.error(f"Invalid windowing options: {e}")
+            return jsonify({'error': str(e)}), 400
+
         # Determine if it's a file upload or a YouTube URL submission
         if file:
             logging.debug(f"Processing file: {file.filename}")
             filename = secure_filename(file.filename)
+            if reserved_upload_name(filename):
+                logging.error(f"Upload name {filename} is reserved for cached downloads")
+                return jsonify({'error': f'Filenames starting with {download_cache.prefix} are reserved.'}), 400
             if '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['UPLOADED_AUDIO_ALLOW']:
-                filepath = os.path.join(upload_dir, filename)
                 try:
-                    file.save(filepath)
-                    logging.debug(f"File saved to {filepath}")
+                    audio_source, content_hash, saved_filename = ingest_upload(file, filename)
+                except AdmissionRejected:
+                    raise
                 except Exception as e:
                     logging.exception(f"Failed to save uploaded file: {e}")
                     return jsonify({'error': 'Failed to save uploaded file.'}), 500
 
-                # Preprocess and predict
+                # Preprocess and predict, reusing the cached result for previously seen content
                 try:
-                    spectrogram = preprocess_audio(filepath)
-                    if spectrogram.shape != (128, 1024, 3):
-                        logging.error(f"Preprocessed spectrogram has incorrect shape: {spectrogram.shape}")
-                        return jsonify({'error': 'Internal server error during preprocessing.'}), 500
-                    predictions = model.predict(np.expand_dims(spectrogram, axis=0))
-                    genres = format_predictions(predictions[0])
-                    logging.debug(f"Predictions: {genres}")
+                    result, cache_source = classify_cached(
+                        content_hash, options, lambda: classify_file(audio_source, options)
+                    )
+                    logging.debug(f"Predictions ({cache_source}): {result['genres']}")
+                except AdmissionRejected:
+                    raise
                 except Exception as e:
                     logging.exception(f"Error during prediction: {e}")
                     return jsonify({'error': f'Error during prediction: {str(e)}'}), 500
@@ -183,148 +812,599 @@ def create_app():
                     logging.error("Song name or artist missing")
                     return jsonify({'error': 'Song name and artist are required for file uploads'}), 400
 
-                # Optionally, extract or set a cover image
-                cover_image_url = "https://via.placeholder.com/300?text=Cover+Image"
-
                 return jsonify({
                     'message': 'File uploaded and processed successfully',
-                    'filename': filename,
-                    'song_name': song_name,
-                    'artist': artist,
-                    'cover_image_url': cover_image_url,
-                    'genres': genres
+                    **track_description(saved_filename, song_name, artist, result, options)
                 }), 200
             else:
                 logging.error("File type not allowed")
                 return jsonify({'error': 'File type not allowed'}), 400
         elif url:
             logging.debug("Processing YouTube URL")
-            try:
-                # Validate presence of song_name and artist
-                if not song_name or not artist:
-                    logging.error("Song name or artist missing")
-                    return jsonify({'error': 'Song name and artist are required for YouTube URL processing'}), 400
-
-                # Generate unique filenames
-                unique_id = uuid.uuid4().hex
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                safe_song_name = secure_filename(song_name)
-                safe_artist = secure_filename(artist)
-                audio_filename_template = f"{safe_song_name}-{safe_artist}_{timestamp}_{unique_id}.%(ext)s"
-                audio_filepath_template = os.path.join(upload_dir, audio_filename_template)
-
-                # Use yt-dlp to download and extract audio
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': audio_filepath_template,  # Use template with %(ext)s
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                    'quiet': True,
-                    'no_warnings': True,
-                    'noplaylist': True,
-                }
-
-                logging.debug(f"Downloading audio from URL to {audio_filepath_template}")
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                final_audio_filepath = audio_filepath_template.replace('.%(ext)s', '.mp3')
-                logging.debug(f"Audio downloaded to {final_audio_filepath}")
-
-                # Check if the file exists
-                if not os.path.exists(final_audio_filepath):
-                    logging.error(f"Downloaded audio file does not exist at path: {final_audio_filepath}")
-                    return jsonify({'error': 'Failed to download audio file.'}), 500
-
-                # Preprocess and predict
-                try:
-                    spectrogram = preprocess_audio(final_audio_filepath)
-                    if spectrogram.shape != (128, 1024, 3):
-                        logging.error(f"Preprocessed spectrogram has incorrect shape: {spectrogram.shape}")
-                        return jsonify({'error': 'Internal server error during preprocessing.'}), 500
-                    predictions = model.predict(np.expand_dims(spectrogram, axis=0))
-                    genres = format_predictions(predictions[0])
-                    logging.debug(f"Predictions: {genres}")
-                except Exception as e:
-                    logging.exception(f"Error during prediction: {e}")
-                    return jsonify({'error': f'Error during prediction: {str(e)}'}), 500
-
-                # Optionally, extract or set a cover image
-                cover_image_url = "https://via.placeholder.com/300?text=Cover+Image"
+            # Validate presence of song_name and artist
+            if not song_name or not artist:
+                logging.error("Song name or artist missing")
+                return jsonify({'error': 'Song name and artist are required for YouTube URL processing'}), 400
 
-                return jsonify({
-                    'message': 'YouTube URL processed and audio analyzed successfully',
-                    'filename': os.path.basename(final_audio_filepath),
-                    'song_name': song_name,
-                    'artist': artist,
-                    'cover_image_url': cover_image_url,
-                    'genres': genres
-                }), 200
-
-            except yt_dlp.utils.DownloadError as e:
-                logging.exception(f"yt-dlp DownloadError: {str(e)}")
+            try:
+                track = process_url(url, song_name, artist, options)
+            except AdmissionRejected:
+                raise
+            except DownloadError as e:
+                logging.exception(f"Download error: {str(e)}")
                 return jsonify({'error': f'Failed to download audio: {str(e)}'}), 400
             except Exception as e:
                 logging.exception(f"Error processing YouTube URL: {str(e)}")
                 return jsonify({'error': f'Failed to process YouTube URL: {str(e)}'}), 500
+
+            return jsonify({
+                'message': 'YouTube URL processed and audio analyzed successfully',
+                **track
+            }), 200
         else:
             logging.error("No file or URL part in the request")
             return jsonify({'error': 'No file or URL part in the request'}), 400
 
-    def preprocess_audio(file_path):
+    @app.route('/upload/stream', methods=['POST'])
+    def upload_stream():
+        logging.debug("Received streaming upload request")
+
+        if not model_loader.ready:
+            logging.warning(f"Model is not ready (state: {model_loader.state}).")
+            return not_ready_response()
+
+        admit_request_body(app.config['INGEST_SPOOL_MAX_MEMORY'])
+        with admission.stage('ingest'), stage_metrics.time('ingest'):
+            file = request.files.get('file')
+        data = request.get_json() if request.is_json else request.form
+        url = data.get('url')
+        song_name = data.get('song_name')
+        artist = data.get('artist')
+
+        if not song_name or not artist:
+            logging.error("Song name or artist missing")
+            return jsonify({'error': 'Song name and artist are required'}), 400
+        if file:
+            filename = secure_filename(file.filename)
+            if reserved_upload_name(filename):
+                logging.error(f"Upload name {filename} is reserved for cached downloads")
+                return jsonify({'error': f'Filenames starting with {download_cache.prefix} are reserved.'}), 400
+            if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in app.config['UPLOADED_AUDIO_ALLOW']:
+                logging.error("File type not allowed")
+                return jsonify({'error': 'File type not allowed'}), 400
+        elif not url:
+            logging.error("No file or URL part in the request")
+            return jsonify({'error': 'No file or URL part in the request'}), 400
+
+        # Progressive results need several windows, so the whole track is analysed unless asked otherwise
+        try:
+            options = window_options({**data, 'window_mode': data.get('window_mode') or 'full'})
+        except ValueError as e:
+            logging.error(f"Invalid windowing options: {e}")
+            return jsonify({'error': str(e)}), 400
+        close_uploads = None
+        if file:
+            (file,), close_uploads = detach_uploads([file])
+
+        def generate():
+            # Holds a cached download on disk until the stream ends
+            with ExitStack() as stack:
+                try:
+                    if file:
+                        audio_source, content_hash, track_filename = ingest_upload(file, filename)
+                    else:
+                        started_at = time.perf_counter()
+                        audio_source, content_hash, download_source = stack.enter_context(fetch_audio(url, song_name, artist))
+                        track_filename = os.path.basename(audio_source)
+                        yield sse_event('download', {
+                            'filename': track_filename,
+                            'source': download_source,
+                            'seconds': round(time.perf_counter() - started_at, 3)
+                        })
+
+                    key = prediction_key(content_hash, options) if prediction_cache is not None else None
+                    cached = prediction_cache.get(key) if key is not None else None
+                    if cached is not None:
+                        cached = {**cached, 'track_id': content_hash}
+                        yield sse_event('result', {**track_description(track_filename, song_name, artist, cached, options), 'cached': True})
+                        return
+
+                    version = model_loader.version
+                    with admission.memory(decode_memory(audio_source, options)):
+                        started_at = time.perf_counter()
+                        windows = extract_windows(audio_source, options)
+                        yield sse_event('decode', {'windows': len(windows), 'seconds': round(time.perf_counter() - started_at, 3)})
+
+                        # One forward pass per window so the first provisional result arrives as early as possible;
+                        # if the client disconnects, the remaining windows are never run
+                        outputs = []
+                        for index, window in enumerate(windows):
+                            outputs.append(predict_spectrogram(window))
+                            predictions, _ = split_outputs(np.array(outputs))
+                            yield sse_event('window', {
+                                'index': index,
+                                'windows': len(windows),
+                                'genres': format_predictions(predictions[-1]),
+                                'aggregate': format_predictions(aggregate_predictions(predictions, options['aggregate']))
+                            })
+
+                    result = classification_result(np.array(outputs), options['aggregate'], version)
+                    if key is not None:
+                        prediction_cache.put(key, result)
+                    result['track_id'] = content_hash
+                    yield sse_event('result', {**track_description(track_filename, song_name, artist, result, options), 'cached': False})
+                except GeneratorExit:
+                    streams_cancelled.inc()
+                    logging.info("Client closed the classification stream; remaining work skipped.")
+                    raise
+                except AdmissionRejected as e:
+                    yield sse_event('error', {'error': str(e), 'stage': e.stage, 'retry_after': e.retry_after if e.retryable else None})
+                except DownloadError as e:
+                    logging.exception(f"Download error: {str(e)}")
+                    yield sse_event('error', {'error': f'Failed to download audio: {str(e)}'})
+                except Exception as e:
+                    logging.exception(f"Error during streaming classification: {e}")
+                    yield sse_event('error', {'error': f'Error during prediction: {str(e)}'})
+
+        # An uploaded file belongs to the response now and is closed once it has been sent
+        response = Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        if close_uploads is not None:
+            response.call_on_close(close_uploads)
+        return response
+
+    def sse_event(event, payload):
         """
-        Load an audio file and preprocess it into a spectrogram suitable for the model.
+        Encode one server-sent event with a JSON payload.
         """
-        try:
-            # Load audio using librosa
-            y, sr = librosa.load(file_path, sr=None)
-            # Generate mel spectrogram
-            spectrogram = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128, fmax=8000)
-            spectrogram_db = librosa.power_to_db(spectrogram, ref=np.max)
-            # Resize or pad spectrogram to (128, 1024)
-            target_height = 128
-            target_width = 1024
-            current_height, current_width = spectrogram_db.shape
-
-            # Resize or pad height
-            if current_height < target_height:
-                padding_height = target_height - current_height
-                top_padding = padding_height // 2
-                bottom_padding = padding_height - top_padding
-                padded_spectrogram = np.pad(spectrogram_db, ((top_padding, bottom_padding), (0, 0)), 'constant')
-            elif current_height > target_height:
-                padded_spectrogram = spectrogram_db[:target_height, :]
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def ingest_upload(file, filename):
+        """
+        Hash an uploaded file and save it when configured to. Returns the source to decode from,
+        the content hash and the saved filename (None when the upload was not kept).
+        """
+        # Decode from the request buffer unless the upload has to be read back from disk
+        in_memory = app.config['INGEST_IN_MEMORY']
+        saved_filename = None
+        audio_source = file.stream
+        with stage_metrics.time('save'):
+            content_hash = hash_stream(file.stream)
+            if app.config['PERSIST_UPLOADS'] or not in_memory:
+                filepath = os.path.join(upload_dir, filename)
+                file.save(filepath)
+                file.stream.seek(0)
+                track_saved(filepath, content_hash)
+                saved_filename = filename
+                logging.debug(f"File saved to {filepath}")
+                if not in_memory:
+                    audio_source = filepath
             else:
-                padded_spectrogram = spectrogram_db
-
-            # Resize or pad width
-            current_height, current_width = padded_spectrogram.shape
-            if current_width < target_width:
-                padding_width = target_width - current_width
-                left_padding = padding_width // 2
-                right_padding = padding_width - left_padding
-                padded_spectrogram = np.pad(padded_spectrogram, ((0, 0), (left_padding, right_padding)), 'constant')
-            elif current_width > target_width:
-                padded_spectrogram = padded_spectrogram[:, :target_width]
-
-            # Normalize spectrogram
-            min_val = np.min(padded_spectrogram)
-            max_val = np.max(padded_spectrogram)
-            if max_val - min_val == 0:
-                normalized_spectrogram = np.zeros_like(padded_spectrogram)
+                logging.debug(f"Decoding upload from {'spooled file' if file.stream.rolled_to_disk else 'memory'}")
+        bytes_ingested.labels(source='upload').inc(getattr(file.stream, 'bytes_written', file.content_length or 0))
+        return audio_source, content_hash, saved_filename
+
+    @contextmanager
+    def fetch_audio(url, song_name, artist):
+        """
+        Download the audio behind a URL, through the download cache when enabled. Yields the
+        file path, its content hash and where it came from; a cached file is kept until the block exits.
+        """
+        with ExitStack() as stack:
+            with admission.stage('download'), stage_metrics.time('download'):
+                if download_cache is not None:
+                    final_audio_filepath, content_hash, download_source = stack.enter_context(
+                        download_cache.checkout(url, song_name, artist)
+                    )
+                else:
+                    final_audio_filepath = downloader.download(url, song_name, artist)
+                    content_hash, download_source = file_digest(final_audio_filepath), 'downloaded'
+            logging.debug(f"Audio for {url} ({download_source}): {final_audio_filepath}")
+            if download_source in ('downloaded', 'uncached'):
+                bytes_ingested.labels(source='download').inc(os.path.getsize(final_audio_filepath))
+            track_saved(final_audio_filepath, content_hash)
+            yield final_audio_filepath, content_hash, download_source
+
+    def process_url(url, song_name, artist, options):
+        """
+        Download the audio behind a URL and classify it. Returns the track description
+        sent back to the client.
+        """
+        with fetch_audio(url, song_name, artist) as (final_audio_filepath, content_hash, _):
+            # Preprocess and predict, reusing the cached result for previously seen content
+            result, cache_source = classify_cached(
+                content_hash, options, lambda: classify_file(final_audio_filepath, options)
+            )
+        logging.debug(f"Predictions ({cache_source}): {result['genres']}")
+        return track_description(os.path.basename(final_audio_filepath), song_name, artist, result, options)
+
+    def process_saved_file(file_path, song_name, artist, options):
+        """
+        Classify an uploaded file that was set aside for a background job.
+        """
+        content_hash = file_digest(file_path)
+        result, cache_source = classify_cached(
+            content_hash, options, lambda: classify_file(file_path, options)
+        )
+        logging.debug(f"Predictions ({cache_source}): {result['genres']}")
+        return track_description(None, song_name, artist, result, options)
+
+    def track_description(filename, song_name, artist, result, options=None):
+        """
+        Build the response body describing a classified track.
+        """
+        index_track(result, {'filename': filename, 'song_name': song_name, 'artist': artist})
+        # Optionally, extract or set a cover image
+        cover_image_url = "https://via.placeholder.com/300?text=Cover+Image"
+        return with_embedding({
+            'filename': filename,
+            'song_name': song_name,
+            'artist': artist,
+            'cover_image_url': cover_image_url,
+            'genres': result['genres'],
+            'windows': result['windows'],
+            'model_version': result.get('model_version') or model_loader.version
+        }, result, options)
+
+    @app.route('/classify/batch', methods=['POST'])
+    @ingest_options(archives=True, max_content_length=app.config['BATCH_MAX_CONTENT_LENGTH'])
+    def classify_batch():
+        logging.debug("Received batch classification request")
+
+        if not model_loader.ready:
+            logging.warning(f"Model is not ready (state: {model_loader.state}).")
+            return not_ready_response()
+
+        admit_request_body(app.config['INGEST_SPOOL_MAX_MEMORY'])
+        with admission.stage('ingest'), stage_metrics.time('ingest'):
+            files = [file for key in request.files for file in request.files.getlist(key)]
+        if not files:
+            logging.error("No files in the batch request")
+            return jsonify({'error': 'No files or archives in the request'}), 400
+
+        try:
+            options = window_options(request.form)
+        except ValueError as e:
+            logging.error(f"Invalid windowing options: {e}")
+            return jsonify({'error': str(e)}), 400
+
+        files, close_uploads = detach_uploads(files)
+        tracks = iter_request_tracks(
+            files,
+            app.config['UPLOADED_AUDIO_ALLOW'],
+            max_track_bytes=app.config['INGEST_MAX_FILE_BYTES'] or app.config['MAX_CONTENT_LENGTH']
+        )
+
+        def generate():
+            # One NDJSON line per track, in completion order; `index` gives the position in the request
+            # Tracks of an accepted batch wait for pipeline capacity rather than failing one by one
+            results = bounded_map(
+                functools.partial(run_patiently, classify_batch_track, options=options),
+                tracks,
+                batch_executor,
+                app.config['BATCH_MAX_IN_FLIGHT']
+            )
+            for line in results:
+                yield json.dumps(line) + '\n'
+
+        # The uploads belong to the response now and are closed once it has been sent
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.call_on_close(close_uploads)
+        return response
+
+    def classify_batch_track(index, track, options):
+        """
+        Classify one track of a batch request. Failures are reported in the track's result line.
+        """
+        name, size, read = track
+        try:
+            # The declared size is reserved while the track is read and hashed, then again with the
+            # decode estimate in one step, so a track never holds memory while it waits for more
+            with admission.memory(size):
+                data = read()
+                content_hash = hashlib.sha256(data).hexdigest()
+            bytes_ingested.labels(source='batch').inc(len(data))
+            result, cache_source = classify_cached(
+                content_hash, options, lambda: classify_file(io.BytesIO(data), options, input_bytes=len(data))
+            )
+        except Exception as e:
+            logging.warning(f"Batch track {name} failed: {e}")
+            return {'index': index, 'name': name, 'error': str(e)}
+        index_track(result, {'name': name})
+        return with_embedding({
+            'index': index,
+            'name': name,
+            'genres': result['genres'],
+            'windows': result['windows'],
+            'model_version': result.get('model_version') or model_loader.version,
+            'cache': cache_source
+        }, result, options)
+
+    @app.route('/classify/spectrogram', methods=['POST'])
+    def classify_spectrogram():
+        logging.debug("Received spectrogram classification request")
+
+        if not model_loader.ready:
+            logging.warning(f"Model is not ready (state: {model_loader.state}).")
+            return not_ready_response()
+
+        try:
+            options = window_options(request.args)
+        except ValueError as e:
+            logging.error(f"Invalid windowing options: {e}")
+            return jsonify({'error': str(e)}), 400
+
+        # The body is read into one buffer and the arrays are parsed as views of it, without further copies
+        admit_request_body()
+        with admission.stage('ingest'), stage_metrics.time('ingest'):
+            payload = request.get_data(cache=False)
+            bytes_ingested.labels(source='spectrogram').inc(len(payload))
+            try:
+                spectrograms = load_spectrograms(
+                    payload, app.config['SPECTROGRAM_MAX_ARRAYS'], app.config['SPECTROGRAM_MAX_FRAMES']
+                )
+            except SpectrogramPayloadError as e:
+                logging.error(f"Invalid spectrogram payload: {e}")
+                return jsonify({'error': str(e)}), 400
+
+        results = []
+        for name, spectrogram in spectrograms:
+            # Shape and dtype are part of the key so arrays with the same bytes never share predictions
+            digest = hashlib.sha256(f"{spectrogram.dtype.str}{spectrogram.shape}".encode())
+            digest.update(np.ascontiguousarray(spectrogram))
+            content_hash = digest.hexdigest()
+            result, cache_source = classify_cached(
+                content_hash, options, lambda spectrogram=spectrogram: classify_spectrogram_db(spectrogram, options)
+            )
+            index_track(result, {'name': name})
+            results.append(with_embedding({
+                'name': name,
+                'genres': result['genres'],
+                'windows': result['windows'],
+                'model_version': result.get('model_version') or model_loader.version,
+                'cache': cache_source
+            }, result, options))
+        return jsonify({'results': results}), 200
+
+    def classify_spectrogram_db(spectrogram_db, options):
+        """
+        Classify a submitted mel spectrogram of shape (128, frames) through the same windowing,
+        pad/normalize and inference path as decoded audio.
+        """
+        version = model_loader.version
+        with admission.memory((options['max_windows'] if options['mode'] == 'full' else 1) * WINDOW_BYTES):
+            with stage_metrics.time('preprocess'):
+                spectrogram_db = np.asarray(spectrogram_db, dtype=np.float32)
+                if options['mode'] == 'full':
+                    windows = split_windows(spectrogram_db, hop=options['hop'], max_windows=options['max_windows'])
+                else:
+                    windows = np.expand_dims(fit_spectrogram(spectrogram_db), axis=0)
+            return classification_result(predict_batch(windows), options['aggregate'], version)
+
+    @app.route('/jobs', methods=['POST'])
+    def create_job():
+        logging.debug("Received job request")
+
+        if not model_loader.ready:
+            logging.warning(f"Model is not ready (state: {model_loader.state}).")
+            return not_ready_response()
+
+        admit_request_body(app.config['INGEST_SPOOL_MAX_MEMORY'])
+        with admission.stage('ingest'):
+            file = request.files.get('file')
+        data = request.get_json() if request.is_json else request.form
+        url = data.get('url')
+        song_name = data.get('song_name')
+        artist = data.get('artist')
+
+        if not song_name or not artist:
+            logging.error("Song name or artist missing")
+            return jsonify({'error': 'Song name and artist are required'}), 400
+
+        try:
+            options = window_options(data)
+        except ValueError as e:
+            logging.error(f"Invalid windowing options: {e}")
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            if file:
+                filename = secure_filename(file.filename)
+                if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in app.config['UPLOADED_AUDIO_ALLOW']:
+                    logging.error("File type not allowed")
+                    return jsonify({'error': 'File type not allowed'}), 400
+                # The request buffer is released when the request ends, so keep a copy for the worker
+                fd, job_path = tempfile.mkstemp(dir=jobs_dir, suffix='.' + filename.rsplit('.', 1)[1].lower())
+                os.close(fd)
+                try:
+                    file.save(job_path)
+                    job_id = job_manager.submit(
+                        run_patiently, process_saved_file, job_path, song_name, artist, options,
+                        cleanup=lambda: os.remove(job_path)
+                    )
+                except BaseException:
+                    # Nothing will run the job's cleanup, whether the copy or the submission failed
+                    os.remove(job_path)
+                    raise
+            elif url:
+                job_id = job_manager.submit(run_patiently, process_url, url, song_name, artist, options)
             else:
-                normalized_spectrogram = (padded_spectrogram - min_val) / (max_val - min_val)
+                logging.error("No file or URL part in the request")
+                return jsonify({'error': 'No file or URL part in the request'}), 400
+        except JobQueueFull as e:
+            logging.warning(str(e))
+            return jsonify({'error': str(e)}), 429, {'Retry-After': str(app.config['JOBS_RETRY_AFTER'])}
+
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('get_job', job_id=job_id)
+        }), 202
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found or expired.'}), 404
+        return jsonify(job), 200
 
-            # Add channel dimension
-            normalized_spectrogram = np.expand_dims(normalized_spectrogram, axis=-1)
-            # Replicate the single channel to create 3 channels
-            normalized_spectrogram = np.repeat(normalized_spectrogram, 3, axis=-1)
+    def window_options(params):
+        """
+        Resolve the windowing mode, hop, window cap and aggregation for a request.
+        Requests may lower the configured window cap but never raise it.
+        """
+        mode = params.get('window_mode') or app.config['WINDOW_MODE']
+        if mode not in ('first', 'full'):
+            raise ValueError(f"window_mode must be 'first' or 'full', got {mode!r}")
+        aggregate = params.get('aggregate') or app.config['WINDOW_AGGREGATION']
+        if aggregate not in AGGREGATION_METHODS:
+            raise ValueError(f"aggregate must be one of {', '.join(AGGREGATION_METHODS)}, got {aggregate!r}")
+        max_windows = app.config['WINDOW_MAX_COUNT']
+        if params.get('max_windows'):
+            max_windows = min(int(params.get('max_windows')), max_windows)
+            if max_windows < 1:
+                raise ValueError("max_windows must be at least 1")
+        return {
+            'mode': mode,
+            'hop': app.config['WINDOW_HOP'],
+            'max_windows': max_windows,
+            'aggregate': aggregate,
+            'embedding': str(params.get('embedding') or '').lower() in ('1', 'true', 'yes')
+        }
+
+    def classify_file(source, options, input_bytes=0):
+        """
+        Preprocess an audio file or stream and return its formatted genre predictions
+        together with the number of windows analysed. `input_bytes` of the caller's
+        buffered input are reserved along with the decode estimate.
+        """
+        # Recorded up front; a swap during this track is picked up by the next one
+        version = model_loader.version
+        with admission.memory(decode_memory(source, options) + input_bytes):
+            windows = extract_windows(source, options)
+            if options['mode'] == 'full':
+                return classification_result(predict_batch(windows), options['aggregate'], version)
+
+            spectrogram = windows[0]
+            if spectrogram.shape != (128, 1024, 3):
+                raise ValueError(f"Preprocessed spectrogram has incorrect shape: {spectrogram.shape}")
+            return classification_result(np.expand_dims(predict_spectrogram(spectrogram), axis=0), None, version)
+
+    def split_outputs(outputs):
+        """
+        Split model output rows into class probabilities and, for models built with
+        EMBEDDINGS, the embedding columns that follow them (None otherwise).
+        """
+        outputs = np.asarray(outputs)
+        if outputs.shape[-1] > NUM_CLASSES:
+            return outputs[..., :NUM_CLASSES], outputs[..., NUM_CLASSES:]
+        return outputs, None
+
+    def classification_result(outputs, aggregate, version):
+        """
+        Build the classification result for a track from the model outputs of its windows.
+        A single window's probabilities are used as is when `aggregate` is None.
+        """
+        predictions, embeddings = split_outputs(outputs)
+        scores = predictions[0] if aggregate is None else aggregate_predictions(predictions, aggregate)
+        result = {'genres': format_predictions(scores), 'windows': len(predictions), 'model_version': version}
+        if embeddings is not None:
+            # Windows are averaged into one unit-length track embedding
+            embedding = embeddings.mean(axis=0)
+            embedding = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+            result['embedding'] = np.round(embedding, 6).tolist()
+        return result
+
+    def extract_windows(source, options):
+        """
+        Decode an audio file or stream into model-ready windows: one in 'first' mode,
+        overlapping windows over the track in 'full' mode.
+        """
+        with admission.stage('decode'):
+            if preprocess_pool is not None:
+                # In-memory uploads are copied into shared memory for the worker; decode_memory counted the copy
+                try:
+                    return preprocess_pool.extract(source, options['mode'], options['hop'], options['max_windows'])
+                except Exception:
+                    stage_metrics.error('preprocess')  # The worker does not say whether decode or mel failed
+                    raise
+            if options['mode'] == 'full':
+                return preprocess_audio_windows(source, options['hop'], options['max_windows'])
+            return np.expand_dims(preprocess_audio(source), axis=0)
+
+    def prediction_key(content_hash, options):
+        """
+        Build the prediction cache key for audio content under the current model and analysis settings.
+        """
+        variant = f"{model_loader.version}:{decode_options['sample_rate']}:{decode_options['offset']}:{options['mode']}"
+        if options['mode'] == 'full':
+            variant += f":{options['hop']}:{options['max_windows']}:{options['aggregate']}"
+        if app.config['EMBEDDINGS']:
+            variant += ":embedding"  # Entries cached without an embedding are not reused
+        return prediction_cache.make_key(content_hash, variant)
+
+    def classify_cached(content_hash, options, compute_fn):
+        """
+        Look up predictions for audio content in the prediction cache, computing them once on a miss.
+        Returns the classification result, tagged with the content hash as its track id, and where it came from.
+        """
+        if prediction_cache is None:
+            result, source = compute_fn(), 'computed'
+        else:
+            result, source = prediction_cache.get_or_compute(prediction_key(content_hash, options), compute_fn)
+        return {**result, 'track_id': content_hash}, source
+
+    def predict_spectrogram(spectrogram):
+        """
+        Run a single preprocessed spectrogram through the model, sharing the forward pass
+        with concurrent requests when batching is enabled.
+        """
+        with admission.stage('inference'):
+            if batch_scheduler is not None:
+                return batch_scheduler.submit(spectrogram)
+            return run_model(np.expand_dims(spectrogram, axis=0))[0]
+
+    def predict_batch(spectrograms):
+        """
+        Run a group of preprocessed spectrograms through the model in one forward pass.
+        """
+        with admission.stage('inference'):
+            if batch_scheduler is not None:
+                return batch_scheduler.submit_batch(spectrograms)
+            return run_model(spectrograms)
+
+    def audio_to_spectrogram_db(source, mode):
+        """
+        Decode the part of an audio file or stream needed for `mode` into a mel spectrogram in dB.
+        """
+        # Load audio using librosa, directly from memory for streams
+        with stage_metrics.time('decode'):
+            y, sr = decode_for_model(source, mode, **decode_options)
+        audio_seconds_decoded.inc(len(y) / sr)
+        with stage_metrics.time('mel'):
+            return compute_spectrogram_db(y, sr)
 
-            return normalized_spectrogram
+    def preprocess_audio(source):
+        """
+        Load an audio file or stream and preprocess it into a spectrogram suitable for the model.
+        """
+        try:
+            return fit_spectrogram(audio_to_spectrogram_db(source, 'first'))
+        except Exception as e:
+            logging.exception(f"Failed to preprocess audio {source}: {e}")
+            raise e
+
+    def preprocess_audio_windows(source, hop, max_windows):
+        """
+        Load an audio file or stream and cut the whole track into overlapping model-sized windows.
+        """
+        try:
+            return split_windows(audio_to_spectrogram_db(source, 'full'), hop=hop, max_windows=max_windows)
         except Exception as e:
-            logging.exception(f"Failed to preprocess audio file {file_path}: {e}")
+            logging.exception(f"Failed to preprocess audio windows {source}: {e}")
             raise e
 
     def format_predictions(predictions):
@@ -344,10 +1424,172 @@ def create_app():
             logging.exception(f"Failed to format predictions: {e}")
             raise e
 
+    @app.route('/livez', methods=['GET'])
+    def livez():
+        return jsonify({'status': 'alive', 'state': model_loader.state}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        status = model_loader.status()
+        if status['ready']:
+            return jsonify(status), 200
+        return jsonify(status), 503, {'Retry-After': str(app.config['MODEL_RETRY_AFTER'])}
+
+    def process_stats():
+        """
+        Collect the stats of this process's components.
+        """
+        return {
+            'batching': batch_scheduler.stats() if batch_scheduler is not None else None,
+            'prediction_cache': prediction_cache.stats() if prediction_cache is not None else None,
+            'download_cache': download_cache.stats() if download_cache is not None else None,
+            'upload_janitor': upload_janitor.stats() if upload_janitor is not None else None,
+            'previews': {
+                **preview_renditions.stats(),
+                'janitor': preview_janitor.stats() if preview_janitor is not None else None
+            } if preview_renditions is not None else None,
+            'jobs': job_manager.stats(),
+            'admission': admission.stats(),
+            'model_watcher': model_watcher.stats() if model_watcher is not None else None,
+            'model_registry': model_registry.stats() if model_registry is not None else None,
+            'embedding_index': embedding_index.stats() if embedding_index is not None else None,
+            'stages': {
+                'preprocess': preprocess_pool.stats() if preprocess_pool is not None else None,
+                'inference': inference_utilization.stats()
+            }
+        }
+
+    # With several serving processes, each publishes its metrics and stats so any of them can report the whole server
+    worker_snapshots = None
+    if app.config['SERVING_WORKERS'] > 1:
+        worker_snapshots = WorkerSnapshots(
+            os.path.abspath(app.config['METRICS_DIR']),
+            metrics,
+            process_stats,
+            interval=app.config['METRICS_PUBLISH_INTERVAL']
+        )
+        worker_snapshots.start()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        if worker_snapshots is not None:
+            return Response(worker_snapshots.render(), content_type=METRICS_CONTENT_TYPE)
+        return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        if worker_snapshots is not None:
+            return jsonify({'workers': worker_snapshots.stats()}), 200
+        return jsonify(process_stats()), 200
+
+    def similar_k():
+        """
+        Read and bound the number of similar tracks requested.
+        """
+        k = int(request.args.get('k') or 10)
+        if not 1 <= k <= app.config['SIMILAR_MAX_K']:
+            raise ValueError(f"k must be between 1 and {app.config['SIMILAR_MAX_K']}")
+        return k
+
+    @app.route('/similar/<track_id>', methods=['GET'])
+    def similar_to_track(track_id):
+        if embedding_index is None:
+            return jsonify({'error': 'Similarity search is not enabled.'}), 404
+        try:
+            k = similar_k()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        embedding = embedding_index.get(track_id)
+        if embedding is None:
+            return jsonify({'error': 'Track is not in the similarity index.'}), 404
+        return jsonify({'track_id': track_id, 'similar': embedding_index.search(embedding, k, exclude=[track_id])[0]}), 200
+
+    @app.route('/similar', methods=['POST'])
+    def similar_to_embeddings():
+        if embedding_index is None:
+            return jsonify({'error': 'Similarity search is not enabled.'}), 404
+        data = request.get_json(silent=True) or {}
+        embeddings = data.get('embeddings') or ([data['embedding']] if data.get('embedding') else None)
+        try:
+            k = similar_k()
+            if not embeddings:
+                raise ValueError("Provide 'embedding' or 'embeddings' in the JSON body")
+            queries = np.asarray(embeddings, dtype=np.float32)
+            if queries.ndim != 2 or queries.shape[1] != embedding_index.dim:
+                raise ValueError(f"Embeddings must have {embedding_index.dim} values each")
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+        # All queries are scored together, one matrix multiply per block of the index
+        return jsonify({'results': embedding_index.search(queries, k)}), 200
+
+    def admin_authorized():
+        """
+        Check the admin token sent as a Bearer token or in the X-Admin-Token header.
+        """
+        token = app.config['ADMIN_TOKEN']
+        if not token:
+            return False
+        authorization = request.headers.get('Authorization', '')
+        supplied = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+        return hmac.compare_digest(supplied.encode(), token.encode())
+
+    @app.route('/admin/model', methods=['GET'])
+    def admin_model():
+        if not admin_authorized():
+            return jsonify({'error': 'Admin token required.'}), 403
+        return jsonify({
+            **model_loader.status(),
+            'watcher': model_watcher.stats() if model_watcher is not None else None
+        }), 200
+
+    @app.route('/admin/model/rollback', methods=['POST'])
+    def admin_model_rollback():
+        if not admin_authorized():
+            return jsonify({'error': 'Admin token required.'}), 403
+        if app.config['SERVING_WORKERS'] > 1:
+            return jsonify({
+                'error': "Rollback is not available with several serving workers: it would only roll back the worker "
+                         "handling this request. Restart the server with the previous MODEL_VERSION instead."
+            }), 409
+        if not model_loader.ready:
+            return not_ready_response()
+        previous_version = model_loader.version
+        version = model_loader.rollback()
+        if version is None:
+            return jsonify({'error': 'No previous model version to roll back to.'}), 409
+        logging.warning(f"Model rolled back from {previous_version} to {version} by admin request")
+        return jsonify({'model_version': version, 'previous_version': previous_version}), 200
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def upload_too_large(e):
+        return jsonify({'error': e.description}), 413
+
+    @app.errorhandler(UnsupportedMediaType)
+    def unsupported_upload(e):
+        return jsonify({'error': e.description}), 415
+
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
         logging.debug(f"Serving uploaded file: {filename}")
-        return send_from_directory(app.config['UPLOADED_AUDIO_DEST'], filename)
+        file_path = safe_join(upload_dir, filename)
+        if file_path is None or not os.path.isfile(file_path):
+            # Let Flask produce its usual 404
+            return send_from_directory(upload_dir, filename)
+        if upload_janitor is not None:
+            upload_janitor.touch(filename)
+
+        # Range requests, If-None-Match and If-Range are handled by send_file against the strong ETag
+        max_age = app.config['UPLOADS_CACHE_MAX_AGE']
+        if preview_renditions is not None and preview_renditions.available and request.args.get('rendition') != 'original':
+            try:
+                preview_path, digest = preview_renditions.get(file_path)
+                if preview_janitor is not None:
+                    preview_janitor.touch(os.path.basename(preview_path))
+                return send_file(preview_path, mimetype='audio/mpeg', etag=preview_renditions.etag(digest),
+                                 max_age=max_age, conditional=True)
+            except Exception as e:
+                logging.warning(f"Serving the original {filename}; preview unavailable: {e}")
+        return send_file(file_path, etag=file_digests.get(file_path), max_age=max_age, conditional=True)
 
     @app.route('/delete/<filename>', methods=['DELETE'])
     def delete_file(filename):
@@ -358,6 +1600,8 @@ def create_app():
         if os.path.exists(file_path):
             try:
                 os.remove(file_path)
+                if upload_janitor is not None:
+                    upload_janitor.discard(safe_filename)
                 logging.debug(f"File {safe_filename} deleted successfully.")
                 return jsonify({'message': f'File {safe_filename} deleted successfully.'}), 200
             except Exception as e:
@@ -371,7 +1615,5 @@ def create_app():
 
 if __name__ == '__main__':
     app = create_app()
-    if model is not None:
-        app.run(debug=True, port=5001)  # Changed port to 5001 as per your frontend request
-    else:
-        logging.error("Application will not start without the model. Please ensure the model is available.")
\ No newline at end of file
+    # The model loads in the background; /readyz reports when it can serve predictions
+    app.run(debug=True, port=5001)  # Changed port to 5001 as per your frontend request
\ No newline at end of file
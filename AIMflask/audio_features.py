@@ -0,0 +1,204 @@
+# audio_features.py
+
+import logging
+
+import librosa
+import numpy as np
+
+from aim_common.spectrogram_batch import TARGET_HEIGHT, TARGET_WIDTH, fit_batch
+
+logger = logging.getLogger(__name__)
+
+AGGREGATION_METHODS = ('mean', 'max', 'vote')
+
+# Rate every upload is decoded to. librosa's default STFT settings (n_fft=2048,
+# hop_length=512) are defined at this rate, so one frame always covers the same time.
+CANONICAL_SAMPLE_RATE = 22050
+HOP_SECONDS = 512 / CANONICAL_SAMPLE_RATE
+FMAX = 8000
+
+
+def mel_params(sr):
+    """
+    Derives STFT and mel settings for a sample rate so frames keep a fixed duration.
+
+    Parameters:
+        sr (int): Sample rate of the audio.
+
+    Returns:
+        dict: n_fft, hop_length and fmax keyword arguments for librosa.feature.melspectrogram.
+    """
+    hop_length = max(1, int(round(sr * HOP_SECONDS)))
+    return {
+        'n_fft': 4 * hop_length,
+        'hop_length': hop_length,
+        'fmax': min(FMAX, sr / 2),
+    }
+
+
+def input_duration(sr, frames=TARGET_WIDTH):
+    """
+    Returns the length of audio, in seconds, that yields `frames` spectrogram frames.
+
+    Parameters:
+        sr (int): Sample rate the audio is decoded at.
+        frames (int): Number of spectrogram frames required.
+
+    Returns:
+        float: Duration in seconds.
+    """
+    return frames * mel_params(sr)['hop_length'] / sr
+
+
+def compute_spectrogram_db(y, sr):
+    """
+    Computes the log-scaled mel spectrogram of an audio time series.
+
+    Parameters:
+        y (np.ndarray): Audio time series.
+        sr (int): Sample rate of `y`.
+
+    Returns:
+        np.ndarray: Mel spectrogram in dB with shape (128, frames).
+    """
+    spectrogram = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=TARGET_HEIGHT, **mel_params(sr))
+    return librosa.power_to_db(spectrogram, ref=np.max)
+
+
+def fit_spectrogram_2d(spectrogram_db, target_height=TARGET_HEIGHT, target_width=TARGET_WIDTH):
+    """
+    Pads or crops a spectrogram to the model input size and min-max normalizes it.
+
+    Parameters:
+        spectrogram_db (np.ndarray): Spectrogram of shape (height, width).
+        target_height (int): Height of the model input.
+        target_width (int): Width of the model input.
+
+    Returns:
+        np.ndarray: Single-channel spectrogram with shape (target_height, target_width).
+    """
+    return fit_batch([spectrogram_db], target_height=target_height, target_width=target_width)[0]
+
+
+def replicate_channels(spectrograms, channels=3):
+    """
+    Adds a trailing channel axis and replicates the single channel for ResNet50.
+
+    Parameters:
+        spectrograms (np.ndarray): Single-channel spectrogram(s) of shape (..., height, width).
+        channels (int): Number of channels required by the model.
+
+    Returns:
+        np.ndarray: Spectrogram(s) of shape (..., height, width, channels).
+    """
+    return np.repeat(np.expand_dims(spectrograms, axis=-1), channels, axis=-1)
+
+
+def fit_spectrogram(spectrogram_db, target_height=TARGET_HEIGHT, target_width=TARGET_WIDTH):
+    """
+    Pads or crops a spectrogram to the model input size, min-max normalizes it and
+    replicates it to 3 channels.
+
+    Parameters:
+        spectrogram_db (np.ndarray): Spectrogram of shape (height, width).
+        target_height (int): Height of the model input.
+        target_width (int): Width of the model input.
+
+    Returns:
+        np.ndarray: Spectrogram with shape (target_height, target_width, 3).
+    """
+    return fit_batch([spectrogram_db], channels=3, target_height=target_height, target_width=target_width)[0]
+
+
+def window_starts(total_width, window_width=TARGET_WIDTH, hop=TARGET_WIDTH // 2, max_windows=None):
+    """
+    Computes the start frames of overlapping windows covering a whole spectrogram.
+
+    The last window is aligned to the end of the track so the tail is never dropped.
+    When more windows than `max_windows` would be needed, an evenly spaced subset is
+    kept so coverage still spans the whole track.
+
+    Parameters:
+        total_width (int): Number of frames in the spectrogram.
+        window_width (int): Number of frames per window.
+        hop (int): Number of frames between consecutive window starts.
+        max_windows (int): Maximum number of windows, or None for no cap.
+
+    Returns:
+        list: Start frame of each window.
+    """
+    if hop < 1:
+        raise ValueError(f"hop must be at least 1, got {hop}")
+    if total_width <= window_width:
+        return [0]
+
+    last_start = total_width - window_width
+    starts = list(range(0, last_start + 1, hop))
+    if starts[-1] != last_start:
+        starts.append(last_start)
+
+    if max_windows is not None and len(starts) > max_windows:
+        keep = np.linspace(0, len(starts) - 1, num=max(max_windows, 1)).round().astype(int)
+        starts = [starts[i] for i in np.unique(keep)]
+    return starts
+
+
+def split_windows_2d(spectrogram_db, hop=TARGET_WIDTH // 2, max_windows=None, out=None, channels=None):
+    """
+    Cuts a full-track spectrogram into overlapping single-channel model-sized windows.
+
+    Parameters:
+        spectrogram_db (np.ndarray): Spectrogram of shape (128, frames).
+        hop (int): Number of frames between consecutive window starts.
+        max_windows (int): Maximum number of windows, or None for no cap.
+        out (np.ndarray): Optional preallocated float32 buffer for the windows (see `window_starts` for the count).
+        channels (int): Channels to replicate into when `out` is not given; None for no channel axis.
+
+    Returns:
+        np.ndarray: Normalized windows with shape (N, 128, 1024), or (N, 128, 1024, channels).
+    """
+    starts = window_starts(spectrogram_db.shape[1], TARGET_WIDTH, hop, max_windows)
+    windows = fit_batch([spectrogram_db[:, start:start + TARGET_WIDTH] for start in starts], out=out, channels=channels)
+    logger.debug(f"Split spectrogram with {spectrogram_db.shape[1]} frames into {len(windows)} windows (hop={hop})")
+    return windows
+
+
+def split_windows(spectrogram_db, hop=TARGET_WIDTH // 2, max_windows=None):
+    """
+    Cuts a full-track spectrogram into overlapping model-sized windows.
+
+    Parameters:
+        spectrogram_db (np.ndarray): Spectrogram of shape (128, frames).
+        hop (int): Number of frames between consecutive window starts.
+        max_windows (int): Maximum number of windows, or None for no cap.
+
+    Returns:
+        np.ndarray: Preprocessed windows with shape (N, 128, 1024, 3).
+    """
+    return split_windows_2d(spectrogram_db, hop, max_windows, channels=3)
+
+
+def aggregate_predictions(predictions, method='mean'):
+    """
+    Combines per-window class probabilities into one track-level distribution.
+
+    Parameters:
+        predictions (np.ndarray): Window probabilities of shape (N, classes).
+        method (str): 'mean' averages probabilities, 'max' takes the per-class maximum,
+            'vote' uses the fraction of windows whose top class is each class.
+
+    Returns:
+        np.ndarray: Track-level scores of shape (classes,) that sum to 1.
+    """
+    predictions = np.asarray(predictions)
+    if method == 'mean':
+        scores = predictions.mean(axis=0)
+    elif method == 'max':
+        scores = predictions.max(axis=0)
+    elif method == 'vote':
+        scores = np.bincount(predictions.argmax(axis=1), minlength=predictions.shape[1]).astype(np.float64)
+    else:
+        raise ValueError(f"Unknown aggregation method: {method}. Expected one of {AGGREGATION_METHODS}")
+
+    total = scores.sum()
+    return scores / total if total > 0 else scores
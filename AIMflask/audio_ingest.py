@@ -0,0 +1,382 @@
+# audio_ingest.py
+
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+import librosa
+import numpy as np
+import soundfile as sf
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from audio_features import CANONICAL_SAMPLE_RATE, input_duration
+
+logger = logging.getLogger(__name__)
+
+# Number of leading bytes needed to recognize every supported container
+SNIFF_BYTES = 12
+
+# Plain tar archives are only recognizable by the 'ustar' magic at offset 257
+ARCHIVE_SNIFF_BYTES = 262
+ARCHIVE_FORMATS = {'zip', 'tar', 'gzip', 'bzip2', 'xz'}
+
+# Containers delivered as-is by streaming sites; libsndfile cannot read them, so they go through ffmpeg
+NATIVE_STREAM_EXTENSIONS = ('.webm', '.weba', '.opus', '.m4a', '.mp4', '.aac')
+
+# Lowest bitrate assumed when a track's duration can't be read from its header, so size-based estimates err high
+MIN_COMPRESSED_BITRATE = 32000
+
+
+def sniff_audio_format(head):
+    """
+    Identifies the audio container from the first bytes of a file.
+
+    Parameters:
+        head (bytes): Leading bytes of the file (at least SNIFF_BYTES for a reliable answer).
+
+    Returns:
+        str: 'wav', 'ogg' or 'mp3', or None if the bytes do not look like a supported format.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[:3] == b'ID3':
+        return 'mp3'
+    # Bare MPEG audio frame sync: 11 set bits
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0:
+        return 'mp3'
+    return None
+
+
+def sniff_archive_format(head):
+    """
+    Identifies an archive container from the first bytes of a file.
+
+    Parameters:
+        head (bytes): Leading bytes of the file (at least ARCHIVE_SNIFF_BYTES to recognize plain tar).
+
+    Returns:
+        str: 'zip', 'tar', 'gzip', 'bzip2' or 'xz', or None if the bytes do not look like an archive.
+    """
+    if head[:4] == b'PK\x03\x04':
+        return 'zip'
+    if head[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if head[:3] == b'BZh':
+        return 'bzip2'
+    if head[:6] == b'\xfd7zXZ\x00':
+        return 'xz'
+    if head[257:262] == b'ustar':
+        return 'tar'
+    return None
+
+
+def ingest_options(archives=False, max_content_length=None):
+    """
+    Decorator marking how IngestRequest buffers uploads for a view.
+
+    Parameters:
+        archives (bool): Accept tar/zip archives in addition to audio files.
+        max_content_length (int): Request size limit for the view, overriding MAX_CONTENT_LENGTH.
+
+    Returns:
+        callable: Decorator returning the view unchanged apart from the marker.
+    """
+    def decorator(view):
+        view.ingest_options = {'archives': archives, 'max_content_length': max_content_length}
+        return view
+    return decorator
+
+
+class _NamedSpooledFile(tempfile.SpooledTemporaryFile):
+    """SpooledTemporaryFile that spills to a named file, so other processes can open the spilled data by path."""
+
+    def rollover(self):
+        if self._rolled:
+            return
+        memory_file = self._file
+        self._file = tempfile.NamedTemporaryFile(**self._TemporaryFileArgs)
+        del self._TemporaryFileArgs
+        position = memory_file.tell()
+        self._file.write(memory_file.getbuffer())
+        self._file.seek(position, 0)
+        memory_file.close()
+        self._rolled = True
+
+
+class SniffingSpool:
+    """
+    Write target for an uploaded file part. Data stays in memory until it passes
+    `max_memory` bytes and then spills to a named temporary file. The container
+    format is checked on the first bytes and the size limit on every write, so bad
+    uploads are rejected before the rest of the body is read.
+    """
+
+    def __init__(self, allowed_formats, max_bytes, max_memory, spool_dir=None, sniff_bytes=SNIFF_BYTES):
+        """
+        Initializes the SniffingSpool.
+
+        Parameters:
+            allowed_formats (set): Container formats accepted, e.g. {'mp3', 'wav', 'ogg'}, plus any of
+                ARCHIVE_FORMATS to accept archives.
+            max_bytes (int): Maximum size of the file part in bytes.
+            max_memory (int): Size above which the buffer spills to disk.
+            spool_dir (str): Directory for the spilled file, or None for the system default.
+            sniff_bytes (int): Leading bytes collected before the format is checked.
+        """
+        self.allowed_formats = allowed_formats
+        self.sniff_archives = bool(ARCHIVE_FORMATS & set(allowed_formats))
+        self.sniff_bytes = sniff_bytes
+        self.max_bytes = max_bytes
+        self.format = None
+        self.bytes_written = 0
+        self._head = b''
+        self._spool = _NamedSpooledFile(max_size=max_memory, dir=spool_dir)
+
+    def _check_format(self):
+        audio_format = sniff_audio_format(self._head)
+        if audio_format is None and self.sniff_archives:
+            audio_format = sniff_archive_format(self._head)
+        if audio_format is None or audio_format not in self.allowed_formats:
+            logger.error(f"Rejected upload with unrecognized content (leading bytes: {self._head[:SNIFF_BYTES]!r})")
+            raise UnsupportedMediaType("Uploaded file is not a supported audio format.")
+        self.format = audio_format
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self.bytes_written > self.max_bytes:
+            logger.error(f"Rejected upload larger than {self.max_bytes} bytes")
+            raise RequestEntityTooLarge(f"Uploaded file exceeds {self.max_bytes} bytes.")
+        if self.format is None:
+            self._head += bytes(data[:self.sniff_bytes - len(self._head)])
+            if len(self._head) >= self.sniff_bytes:
+                self._check_format()
+        return self._spool.write(data)
+
+    def seek(self, *args):
+        # Uploads shorter than SNIFF_BYTES are checked once the parser rewinds them
+        if self.format is None:
+            self._check_format()
+        return self._spool.seek(*args)
+
+    @property
+    def rolled_to_disk(self):
+        return self._spool._rolled
+
+    @property
+    def path(self):
+        """Path of the spilled file, or None while the data is in memory."""
+        return self._spool._file.name if self.rolled_to_disk else None
+
+    def __getattr__(self, name):
+        return getattr(self._spool, name)
+
+
+class IngestRequest(Request):
+    """
+    Request class that buffers uploaded files in a SniffingSpool instead of
+    Werkzeug's default temporary file. Views decorated with `ingest_options` may
+    also accept archives and raise the request size limit.
+    """
+
+    def _ingest_options(self):
+        view = current_app.view_functions.get(self.endpoint) if self.endpoint else None
+        return getattr(view, 'ingest_options', {})
+
+    @property
+    def max_content_length(self):
+        limit = self._ingest_options().get('max_content_length')
+        return limit if limit is not None else super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        allowed_formats = set(config['UPLOADED_AUDIO_ALLOW'])
+        archives = self._ingest_options().get('archives', False)
+        if archives:
+            allowed_formats |= ARCHIVE_FORMATS
+        return SniffingSpool(
+            allowed_formats=allowed_formats,
+            max_bytes=self.max_content_length if archives else config['INGEST_MAX_FILE_BYTES'] or config['MAX_CONTENT_LENGTH'],
+            max_memory=config['INGEST_SPOOL_MAX_MEMORY'],
+            spool_dir=config['INGEST_SPOOL_DIR'],
+            sniff_bytes=ARCHIVE_SNIFF_BYTES if archives else SNIFF_BYTES
+        )
+
+
+def load_audio(source, sr=None, **kwargs):
+    """
+    Decodes audio from a path or a seekable binary stream.
+
+    Streams are decoded in place when libsndfile supports the container. Otherwise
+    the stream is copied to a short-lived temporary file so librosa can fall back
+    to its path-based decoders.
+
+    Parameters:
+        source (str or file-like): Path to the audio file, or a stream positioned at its start.
+        sr (int): Target sample rate, or None to keep the native rate.
+        **kwargs: Additional keyword arguments passed to librosa.load.
+
+    Returns:
+        tuple: (audio time series, sample rate)
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return librosa.load(source, sr=sr, **kwargs)
+
+    try:
+        return librosa.load(source, sr=sr, **kwargs)
+    except Exception as e:
+        logger.debug(f"In-memory decode failed ({e}); falling back to a temporary file")
+
+    source.seek(0)
+    with tempfile.NamedTemporaryFile() as tmp:
+        shutil.copyfileobj(source, tmp)
+        tmp.flush()
+        return librosa.load(tmp.name, sr=sr, **kwargs)
+
+
+@functools.lru_cache(maxsize=1)
+def find_ffmpeg():
+    """
+    Locates an ffmpeg executable.
+
+    Returns:
+        str: Path to the ffmpeg bundled with moviepy (imageio-ffmpeg) or found on PATH, or None.
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which('ffmpeg')
+
+
+def decode_with_ffmpeg(path, sample_rate, offset=0.0, duration=None):
+    """
+    Decodes a time range of a media file straight to mono float32 PCM at `sample_rate`.
+
+    Seeking happens before the input is opened, so only the requested range is
+    demuxed and decoded, and resampling happens inside ffmpeg.
+
+    Parameters:
+        path (str): Path to the media file.
+        sample_rate (int): Rate to decode to.
+        offset (float): Seconds to skip before decoding.
+        duration (float): Seconds to decode, or None to decode to the end.
+
+    Returns:
+        tuple: (audio time series, sample rate)
+    """
+    ffmpeg = find_ffmpeg()
+    if ffmpeg is None:
+        raise RuntimeError(f"ffmpeg is required to decode {path}")
+    command = [ffmpeg, '-nostdin', '-loglevel', 'error']
+    if offset:
+        command += ['-ss', f'{offset:.6f}']
+    if duration is not None:
+        command += ['-t', f'{duration:.6f}']
+    command += ['-i', str(path), '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 'f32le', 'pipe:1']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32), sample_rate
+
+
+def _decode(source, sample_rate, offset, duration, res_type):
+    native_stream = (
+        isinstance(source, (str, os.PathLike))
+        and os.path.splitext(str(source))[1].lower() in NATIVE_STREAM_EXTENSIONS
+    )
+    if native_stream and sample_rate is not None and find_ffmpeg() is not None:
+        return decode_with_ffmpeg(source, sample_rate, offset=offset, duration=duration)
+    return load_audio(source, sr=sample_rate, offset=offset, duration=duration, res_type=res_type)
+
+
+def decode_for_model(source, mode='first', sample_rate=CANONICAL_SAMPLE_RATE, offset=0.0, res_type='kaiser_fast'):
+    """
+    Decodes only the audio the classifier needs, resampled straight to a fixed rate.
+
+    In 'first' mode only the span covering one 1024-frame window is read, starting
+    at `offset`; 'full' mode reads from `offset` to the end of the track. Tracks
+    shorter than `offset` are read from the start instead. Native streaming
+    containers (opus, m4a, webm) on disk are decoded by ffmpeg without an
+    intermediate file.
+
+    Parameters:
+        source (str or file-like): Path to the audio file, or a stream positioned at its start.
+        mode (str): 'first' or 'full'.
+        sample_rate (int): Rate to decode to, or None to keep the native rate.
+        offset (float): Seconds to skip before decoding.
+        res_type (str): librosa resampler used when the native rate differs.
+
+    Returns:
+        tuple: (audio time series, sample rate)
+    """
+    duration = None
+    if mode == 'first' and sample_rate is not None:
+        duration = input_duration(sample_rate)
+    y, sr = _decode(source, sample_rate, offset, duration, res_type)
+
+    if y.size == 0 and offset:
+        logger.debug(f"Track is shorter than the {offset}s decode offset; decoding from the start")
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        y, sr = _decode(source, sample_rate, 0.0, duration, res_type)
+    return y, sr
+
+
+def estimate_duration(source):
+    """
+    Estimates the duration of a track without decoding it.
+
+    The duration is read from the header when libsndfile understands the
+    container. Otherwise it is bounded from the file size, assuming the lowest
+    bitrate a real upload would use.
+
+    Parameters:
+        source (str or file-like): Path to the audio file, or a seekable stream positioned at its start.
+
+    Returns:
+        float: Duration in seconds.
+    """
+    try:
+        return sf.info(source).duration
+    except Exception:
+        pass
+    finally:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+    else:
+        size = source.seek(0, os.SEEK_END)
+        source.seek(0)
+    return size * 8 / MIN_COMPRESSED_BITRATE
+
+
+def decoded_audio_bytes(source, mode='first', sample_rate=CANONICAL_SAMPLE_RATE, offset=0.0):
+    """
+    Estimates the memory taken by the float32 samples `decode_for_model` will produce.
+
+    Parameters:
+        source (str or file-like): Path to the audio file, or a seekable stream positioned at its start.
+        mode (str): 'first' or 'full'.
+        sample_rate (int): Rate the audio is decoded at.
+        offset (float): Seconds skipped before decoding.
+
+    Returns:
+        int: Estimated bytes of decoded audio.
+    """
+    sample_rate = sample_rate or CANONICAL_SAMPLE_RATE
+    if mode == 'first':
+        duration = input_duration(sample_rate)
+    else:
+        duration = estimate_duration(source)
+        # Tracks shorter than the offset are decoded from the start
+        if duration > offset:
+            duration -= offset
+    return int(duration * sample_rate) * np.dtype(np.float32).itemsize
@@ -0,0 +1,134 @@
+# batch_ingest.py
+
+import logging
+import os
+import tarfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from audio_ingest import ARCHIVE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+
+class TrackError(Exception):
+    """Raised for a single track that cannot be read; the rest of the batch carries on."""
+
+
+def _allowed(name, allowed_extensions):
+    base = os.path.basename(name)
+    if not base or base.startswith('.') or '__MACOSX' in name.split('/'):
+        return False
+    return '.' in base and base.rsplit('.', 1)[1].lower() in allowed_extensions
+
+
+def _read_member(name, size, read, max_track_bytes):
+    if size > max_track_bytes:
+        raise TrackError(f"{name} exceeds {max_track_bytes} bytes")
+    return read()
+
+
+def _raise(error):
+    raise error
+
+
+def iter_archive_tracks(fileobj, archive_format, allowed_extensions, max_track_bytes):
+    """
+    Lazily yields the audio files in a tar or zip archive, one at a time.
+
+    Parameters:
+        fileobj (file-like): Seekable binary stream holding the archive.
+        archive_format (str): One of ARCHIVE_FORMATS.
+        allowed_extensions (set): Audio extensions to yield; other members are skipped.
+        max_track_bytes (int): Largest member read into memory.
+
+    Yields:
+        tuple: (member name, declared size in bytes, callable returning its bytes or raising TrackError)
+    """
+    if archive_format == 'zip':
+        archive = zipfile.ZipFile(fileobj)
+        for info in archive.infolist():
+            if not info.is_dir() and _allowed(info.filename, allowed_extensions):
+                yield info.filename, info.file_size, lambda info=info: _read_member(
+                    info.filename, info.file_size, lambda: archive.read(info), max_track_bytes
+                )
+        return
+
+    # Stream mode reads members in order without seeking, so compressed tars never need to be inflated in full
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and _allowed(member.name, allowed_extensions):
+                # In stream mode a member can only be read before moving on to the next one
+                try:
+                    data = _read_member(member.name, member.size, lambda: archive.extractfile(member).read(), max_track_bytes)
+                except TrackError as e:
+                    yield member.name, 0, lambda e=e: _raise(e)
+                else:
+                    yield member.name, len(data), lambda data=data: data
+
+
+def _read_stream(stream):
+    stream.seek(0)
+    return stream.read()
+
+
+def iter_request_tracks(files, allowed_extensions, max_track_bytes):
+    """
+    Yields every audio track in a request's file parts, expanding archives.
+
+    Parameters:
+        files (list): Uploaded FileStorage objects buffered by IngestRequest.
+        allowed_extensions (set): Audio extensions accepted.
+        max_track_bytes (int): Largest track read into memory.
+
+    Yields:
+        tuple: (track name, declared size in bytes, callable returning its bytes or raising TrackError)
+    """
+    for file in files:
+        container = getattr(file.stream, 'format', None)
+        if container in ARCHIVE_FORMATS:
+            logger.debug(f"Expanding {container} archive {file.filename}")
+            try:
+                yield from iter_archive_tracks(file.stream, container, allowed_extensions, max_track_bytes)
+            except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError) as e:
+                yield file.filename, 0, lambda e=e, name=file.filename: _raise(TrackError(f"Unreadable archive {name}: {e}"))
+        elif _allowed(file.filename or '', allowed_extensions):
+            size = getattr(file.stream, 'bytes_written', 0)
+            yield file.filename, size, lambda file=file, size=size: _read_member(
+                file.filename, size, lambda: _read_stream(file.stream), max_track_bytes
+            )
+        else:
+            yield file.filename, 0, lambda name=file.filename: _raise(TrackError(f"File type not allowed: {name}"))
+
+
+def bounded_map(fn, items, executor, max_in_flight):
+    """
+    Applies `fn` to items on an executor with at most `max_in_flight` outstanding,
+    yielding results in completion order. Items are only pulled from the iterator
+    when a slot frees, so memory stays bounded however many items there are.
+    Outstanding work that has not started is cancelled if the consumer stops early.
+
+    Parameters:
+        fn (callable): Called with (index, item).
+        items (iterable): Inputs, consumed lazily.
+        executor (concurrent.futures.Executor): Runs `fn`.
+        max_in_flight (int): Maximum submitted but unconsumed calls.
+
+    Yields:
+        The result of each call as it completes.
+    """
+    in_flight = set()
+    try:
+        for index, item in enumerate(items):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(fn, index, item))
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in in_flight:
+            future.cancel()
@@ -0,0 +1,247 @@
+# batching.py
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    """One or more spectrograms from a single caller waiting in the scheduler queue."""
+
+    __slots__ = ('inputs', 'future', 'enqueued_at')
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+    @property
+    def size(self):
+        return len(self.inputs)
+
+
+class BatchScheduler:
+    """
+    Collects preprocessed spectrograms from concurrent requests and runs them
+    through the model in a single batched forward pass.
+
+    A batch is dispatched as soon as it holds `max_batch_size` spectrograms or
+    the oldest queued spectrogram has waited `max_wait_ms`, whichever comes first.
+    Spectrograms submitted together with `submit_batch` are never split across
+    forward passes; a group larger than `max_batch_size` is dispatched on its own.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10, stats_window=1000):
+        """
+        Initializes the BatchScheduler.
+
+        Parameters:
+            predict_fn (callable): Takes a batch of shape (N, 128, 1024, 3) and returns predictions of shape (N, classes).
+            max_batch_size (int): Maximum number of spectrograms per forward pass.
+            max_wait_ms (float): Maximum time the oldest queued spectrogram waits before dispatch.
+            stats_window (int): Number of recent batches/requests kept for latency percentiles.
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None  # Request that did not fit in the previous batch
+        self._thread = None
+        self._stopped = threading.Event()
+
+        # Statistics
+        self._stats_lock = threading.Lock()
+        self._batch_count = 0
+        self._request_count = 0
+        self._spectrogram_count = 0
+        self._batch_size_counts = {}
+        self._recent_batch_sizes = deque(maxlen=stats_window)
+        self._recent_queue_waits = deque(maxlen=stats_window)
+        self._recent_inference_times = deque(maxlen=stats_window)
+
+    def start(self):
+        """Starts the background dispatch thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Batch scheduler started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.1f})")
+
+    def stop(self, timeout=5.0):
+        """Stops the dispatch thread after draining the current batch."""
+        self._stopped.set()
+        self._queue.put(None)  # Wake up the dispatch thread
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info("Batch scheduler stopped.")
+
+    def submit_batch_async(self, spectrograms):
+        """
+        Queues a group of spectrograms that must share one forward pass.
+
+        Parameters:
+            spectrograms (np.ndarray): Preprocessed spectrograms of shape (N, 128, 1024, 3).
+
+        Returns:
+            concurrent.futures.Future: Resolves to the predictions of shape (N, classes).
+        """
+        if self._stopped.is_set():
+            raise RuntimeError("Batch scheduler is stopped.")
+        pending = _PendingRequest(spectrograms)
+        self._queue.put(pending)
+        return pending.future
+
+    def submit_batch(self, spectrograms, timeout=None):
+        """
+        Queues a group of spectrograms and blocks until their predictions are available.
+
+        Parameters:
+            spectrograms (np.ndarray): Preprocessed spectrograms of shape (N, 128, 1024, 3).
+            timeout (float): Seconds to wait for the result, or None to wait indefinitely.
+
+        Returns:
+            np.ndarray: Predictions of shape (N, classes).
+        """
+        return self.submit_batch_async(spectrograms).result(timeout=timeout)
+
+    def submit(self, spectrogram, timeout=None):
+        """
+        Queues one spectrogram and blocks until its prediction is available.
+
+        Parameters:
+            spectrogram (np.ndarray): Preprocessed spectrogram of shape (128, 1024, 3).
+            timeout (float): Seconds to wait for the result, or None to wait indefinitely.
+
+        Returns:
+            np.ndarray: Prediction row for this spectrogram.
+        """
+        return self.submit_batch(np.expand_dims(spectrogram, axis=0), timeout=timeout)[0]
+
+    def _collect_batch(self):
+        """Blocks for the first request, then gathers more until the batch is full or the wait expires."""
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        rows = first.size
+        deadline = first.enqueued_at + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            if rows + item.size > self.max_batch_size:
+                # Keep groups whole; this one starts the next batch
+                self._carry = item
+                break
+            batch.append(item)
+            rows += item.size
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._dispatch(batch)
+
+        # Fail anything still queued so callers do not hang
+        if self._carry is not None:
+            self._carry.future.set_exception(RuntimeError("Batch scheduler stopped before the request was processed."))
+            self._carry = None
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item.future.set_exception(RuntimeError("Batch scheduler stopped before the request was processed."))
+
+    def _dispatch(self, batch):
+        started_at = time.perf_counter()
+        queue_waits = [started_at - item.enqueued_at for item in batch]
+        try:
+            inputs = np.concatenate([item.inputs for item in batch])
+            predictions = self.predict_fn(inputs)
+        except Exception as e:
+            logger.exception(f"Batched inference failed for batch of size {sum(item.size for item in batch)}: {e}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        inference_time = time.perf_counter() - started_at
+
+        offset = 0
+        for item in batch:
+            item.future.set_result(predictions[offset:offset + item.size])
+            offset += item.size
+
+        self._record_batch(len(inputs), queue_waits, inference_time)
+        logger.debug(
+            f"Dispatched batch of size {len(inputs)} from {len(batch)} requests: "
+            f"max queue wait {max(queue_waits) * 1000:.2f} ms, inference {inference_time * 1000:.2f} ms"
+        )
+
+    def _record_batch(self, batch_size, queue_waits, inference_time):
+        with self._stats_lock:
+            self._batch_count += 1
+            self._request_count += len(queue_waits)
+            self._spectrogram_count += batch_size
+            self._batch_size_counts[batch_size] = self._batch_size_counts.get(batch_size, 0) + 1
+            self._recent_batch_sizes.append(batch_size)
+            self._recent_queue_waits.extend(queue_waits)
+            self._recent_inference_times.append(inference_time)
+
+    def stats(self):
+        """
+        Returns batching statistics for tuning throughput against tail latency.
+
+        Returns:
+            dict: Batch counts, batch size distribution and queue wait / inference percentiles in milliseconds.
+        """
+        with self._stats_lock:
+            batch_sizes = list(self._recent_batch_sizes)
+            queue_waits = np.array(self._recent_queue_waits, dtype=np.float64) * 1000
+            inference_times = np.array(self._recent_inference_times, dtype=np.float64) * 1000
+            stats = {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batch_count,
+                'requests': self._request_count,
+                'spectrograms': self._spectrogram_count,
+                'batch_size_counts': dict(sorted(self._batch_size_counts.items())),
+                'mean_batch_size': float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+            }
+
+        stats['queue_wait_ms'] = _percentiles(queue_waits)
+        stats['inference_ms'] = _percentiles(inference_times)
+        return stats
+
+
+def _percentiles(values):
+    if values.size == 0:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'max': round(float(values.max()), 3),
+    }
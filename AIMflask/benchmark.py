@@ -0,0 +1,474 @@
+# benchmark.py
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import soundfile as sf
+
+from audio_ingest import find_ffmpeg
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Rate the synthetic files are written at; uploads are resampled to the model rate on decode
+SOURCE_SAMPLE_RATE = 44100
+
+# ffmpeg encoders for the compressed formats; opus and m4a stand in for native YouTube streams
+ENCODERS = {
+    'mp3': ['-codec:a', 'libmp3lame', '-b:a', '128k'],
+    'opus': ['-codec:a', 'libopus', '-b:a', '128k'],
+    'm4a': ['-codec:a', 'aac', '-b:a', '128k'],
+}
+
+
+class StandInModel:
+    """
+    Model with the classifier's input and output shapes and a configurable cost,
+    so the serving path can be benchmarked without TensorFlow weights or S3.
+    """
+
+    def __init__(self, num_classes=10, input_shape=(128, 1024, 3), batch_delay_ms=20.0, item_delay_ms=5.0, seed=0):
+        """
+        Initializes the StandInModel.
+
+        Parameters:
+            num_classes (int): Number of output classes.
+            input_shape (tuple): Shape of a single model input.
+            batch_delay_ms (float): Fixed cost of each forward pass.
+            item_delay_ms (float): Additional cost per input in a batch.
+            seed (int): Seed for the projection that turns inputs into scores.
+        """
+        self.input_shape = tuple(input_shape)
+        self.batch_delay_ms = batch_delay_ms
+        self.item_delay_ms = item_delay_ms
+        self._weights = np.random.default_rng(seed).standard_normal((input_shape[0], num_classes)).astype(np.float32)
+
+    def predict(self, batch, verbose=0):
+        """
+        Returns deterministic class probabilities after sleeping for the configured cost.
+
+        Parameters:
+            batch (np.ndarray): Inputs of shape (N, 128, 1024, 3).
+            verbose (int): Accepted for compatibility with Keras `predict`; ignored.
+
+        Returns:
+            np.ndarray: Class probabilities of shape (N, num_classes).
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected inputs of shape (N, {self.input_shape}), got {batch.shape}")
+        time.sleep((self.batch_delay_ms + self.item_delay_ms * len(batch)) / 1000)
+        logits = batch.mean(axis=(2, 3)) @ self._weights
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def synthesize_audio(path, seconds, seed=0):
+    """
+    Writes a WAV file of tones over noise.
+
+    Parameters:
+        path (str): Destination .wav path.
+        seconds (float): Length of the file.
+        seed (int): Seed for the tone frequencies and noise.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SOURCE_SAMPLE_RATE)) / SOURCE_SAMPLE_RATE
+    y = 0.05 * rng.standard_normal(len(t))
+    for frequency in rng.uniform(110, 2000, size=4):
+        y += 0.2 * np.sin(2 * np.pi * frequency * t)
+    sf.write(path, (y / np.abs(y).max()).astype(np.float32), SOURCE_SAMPLE_RATE, subtype='PCM_16')
+
+
+def generate_corpus(dest_dir, durations, formats, seed=0):
+    """
+    Generates one synthetic file per duration and format.
+
+    Parameters:
+        dest_dir (str): Directory for the generated files.
+        durations (list): File lengths in seconds.
+        formats (list): Any of 'wav', 'mp3', 'opus' and 'm4a'.
+        seed (int): Base seed for the generated audio.
+
+    Returns:
+        list: One dict per file with its label, path, format, duration and size. The label
+            doubles as the file's stem, so the local downloader resolves it as a video id.
+    """
+    encoded = [fmt for fmt in formats if fmt in ENCODERS]
+    ffmpeg = find_ffmpeg() if encoded else None
+    if encoded and ffmpeg is None:
+        logger.warning(f"ffmpeg not found; skipping {', '.join(encoded)} files.")
+        encoded = []
+    corpus = []
+    for i, seconds in enumerate(durations):
+        wav_path = os.path.join(dest_dir, f'wav_{seconds:g}s.wav')
+        synthesize_audio(wav_path, seconds, seed=seed + i)
+        paths = {'wav': wav_path}
+        for fmt in encoded:
+            paths[fmt] = os.path.join(dest_dir, f'{fmt}_{seconds:g}s.{fmt}')
+            subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-i', wav_path, *ENCODERS[fmt], paths[fmt]], check=True)
+        for fmt in formats:
+            if fmt in paths:
+                corpus.append({
+                    'label': f'{fmt}_{seconds:g}s',
+                    'path': paths[fmt],
+                    'format': fmt,
+                    'seconds': seconds,
+                    'bytes': os.path.getsize(paths[fmt]),
+                })
+    return corpus
+
+
+def _serve(port, workdir, config, model_options):
+    """Server process entry point: runs the app with a stand-in model."""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    os.chdir(workdir)  # Upload, job and cache directories are relative to the working directory
+    app = create_app(config=config, model_factory=lambda: StandInModel(**model_options))
+    logging.getLogger().setLevel(logging.WARNING)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for current in pids:
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def _status_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssMonitor:
+    """Samples the resident memory of a process and its children to find the combined peak."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_total_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            total = sum(_status_kb(pid, 'VmRSS') for pid in _process_tree(self.pid))
+            self.peak_total_kb = max(self.peak_total_kb, total)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling.
+
+        Returns:
+            dict: Peak RSS of the server process alone and of the server plus its workers, in MB.
+        """
+        self._stop.set()
+        self._thread.join()
+        return {
+            'server': round(_status_kb(self.pid, 'VmHWM') / 1024, 1),
+            'total': round(self.peak_total_kb / 1024, 1),
+        }
+
+
+def _multipart_body(fields, file_field, file_path):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+        f'filename="{os.path.basename(file_path)}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+    )
+    parts.append(content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def build_requests(corpus, base_url, source, window_mode):
+    """
+    Prepares one /upload request per corpus file.
+
+    Parameters:
+        corpus (list): Files from generate_corpus.
+        base_url (str): Server address.
+        source (str): 'upload' posts the file, 'url' submits a YouTube URL served by the local downloader.
+        window_mode (str): Window mode sent with each request.
+
+    Returns:
+        list: (label, url, body, headers) tuples.
+    """
+    fields = {'song_name': 'Benchmark', 'artist': 'Synthetic', 'window_mode': window_mode}
+    prepared = []
+    for item in corpus:
+        if source == 'url':
+            payload = dict(fields, url=f"https://www.youtube.com/watch?v={item['label']}")
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        else:
+            body, content_type = _multipart_body(fields, 'file', item['path'])
+        prepared.append((item['label'], base_url + '/upload', body, {'Content-Type': content_type}))
+    return prepared
+
+
+def _send(url, body, headers, timeout):
+    started_at = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0  # Connection error or timeout
+    return status, (time.perf_counter() - started_at) * 1000
+
+
+def drive(prepared, total_requests, concurrency, timeout=120):
+    """
+    Sends `total_requests` requests, cycling through `prepared`, with `concurrency` in flight.
+
+    Returns:
+        tuple: (list of (label, status, latency_ms), wall time in seconds)
+    """
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            label, url, body, headers = prepared[i % len(prepared)]
+            status, latency_ms = _send(url, body, headers, timeout)
+            with lock:
+                results.append((label, status, latency_ms))
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return results, time.perf_counter() - started_at
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return None
+    return {
+        'p50': round(float(np.percentile(latencies, 50)), 2),
+        'p95': round(float(np.percentile(latencies, 95)), 2),
+        'p99': round(float(np.percentile(latencies, 99)), 2),
+        'mean': round(float(np.mean(latencies)), 2),
+        'max': round(float(np.max(latencies)), 2),
+    }
+
+
+def summarize(results, wall_seconds):
+    """
+    Builds the throughput and latency part of the report.
+
+    Returns:
+        dict: Request counts, requests per second and latency percentiles overall and per file.
+    """
+    ok = [(label, latency) for label, status, latency in results if status == 200]
+    status_counts = {}
+    for _, status, _ in results:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    by_file = {}
+    for label, latency in ok:
+        by_file.setdefault(label, []).append(latency)
+    return {
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'status_counts': status_counts,
+        'duration_seconds': round(wall_seconds, 3),
+        'requests_per_second': round(len(ok) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        'latency_ms': _latency_summary([latency for _, latency in ok]),
+        'by_file': {label: dict(requests=len(latencies), **_latency_summary(latencies))
+                    for label, latencies in sorted(by_file.items())},
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/readyz', timeout=5) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server at {base_url} was not ready after {timeout}s")
+
+
+def _fetch_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return json.loads(response.read())
+    except Exception as e:
+        logger.warning(f"Could not fetch {url}: {e}")
+        return None
+
+
+def run_benchmark(args):
+    """
+    Starts the app in a separate process, drives /upload and returns the report.
+
+    Parameters:
+        args (argparse.Namespace): Parsed command line options.
+
+    Returns:
+        dict: Benchmark report.
+    """
+    workdir = tempfile.mkdtemp(prefix='aim-benchmark-')
+    try:
+        media_dir = os.path.join(workdir, 'media')
+        os.makedirs(media_dir)
+        corpus = generate_corpus(media_dir, args.durations, args.formats, seed=args.seed)
+        if not corpus:
+            raise RuntimeError("No benchmark files could be generated.")
+
+        config = {
+            'AUDIO_DOWNLOADER': 'local',
+            'LOCAL_MEDIA_DIR': media_dir,
+            'PREDICTION_CACHE': args.prediction_cache,
+            'DOWNLOAD_CACHE': args.download_cache,
+            'PREPROCESS_WORKERS': args.preprocess_workers,
+            'INFERENCE_BATCHING': args.batching,
+            'WARMUP_BATCH_SIZES': [1],
+        }
+        model_options = {'batch_delay_ms': args.batch_delay_ms, 'item_delay_ms': args.item_delay_ms}
+
+        port = _free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server = multiprocessing.get_context('spawn').Process(
+            target=_serve, args=(port, workdir, config, model_options), daemon=True
+        )
+        server.start()
+        try:
+            _wait_ready(base_url, args.startup_timeout)
+            prepared = build_requests(corpus, base_url, args.source, args.window_mode)
+
+            if args.warmup:
+                drive(prepared, args.warmup, min(args.concurrency, args.warmup), args.timeout)
+            monitor = RssMonitor(server.pid)
+            monitor.start()
+            results, wall_seconds = drive(prepared, args.requests, args.concurrency, args.timeout)
+            peak_rss = monitor.stop()
+            server_stats = _fetch_json(base_url + '/stats')
+        finally:
+            server.terminate()
+            server.join(timeout=10)
+
+        report = {
+            'commit': _git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'settings': {
+                'source': args.source,
+                'concurrency': args.concurrency,
+                'requests': args.requests,
+                'warmup': args.warmup,
+                'window_mode': args.window_mode,
+                'model': model_options,
+                'app_config': {k: v for k, v in config.items() if k != 'LOCAL_MEDIA_DIR'},
+            },
+            'corpus': [{k: v for k, v in item.items() if k != 'path'} for item in corpus],
+            **summarize(results, wall_seconds),
+            'peak_rss_mb': peak_rss,
+            'server_stats': server_stats,
+        }
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /upload throughput offline with a stand-in model.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once")
+    parser.add_argument('--requests', type=int, default=200, help="Timed requests to send")
+    parser.add_argument('--warmup', type=int, default=10, help="Untimed requests sent first")
+    parser.add_argument('--durations', type=float, nargs='+', default=[10, 30, 180], help="Synthetic file lengths in seconds")
+    parser.add_argument('--formats', nargs='+', choices=('wav', 'mp3', 'opus', 'm4a'), default=['wav', 'mp3'],
+                        help="opus and m4a are only accepted through --source url")
+    parser.add_argument('--source', choices=('upload', 'url'), default='upload',
+                        help="'url' submits YouTube URLs resolved by the local downloader")
+    parser.add_argument('--window-mode', choices=('first', 'full'), default='first')
+    parser.add_argument('--preprocess-workers', type=int, default=2)
+    parser.add_argument('--no-batching', dest='batching', action='store_false')
+    parser.add_argument('--prediction-cache', action='store_true',
+                        help="Leave the prediction cache on (repeated files then measure cache hits)")
+    parser.add_argument('--download-cache', action='store_true',
+                        help="Leave the download cache on (repeated URLs then measure cache hits)")
+    parser.add_argument('--batch-delay-ms', type=float, default=20.0, help="Stand-in model cost per forward pass")
+    parser.add_argument('--item-delay-ms', type=float, default=5.0, help="Stand-in model cost per input")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="Report path (printed to stdout when omitted)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+        logger.info(f"Benchmark report saved to {args.output}")
+    else:
+        print(text)
+    logger.info(
+        f"{report['requests_per_second']} req/s, latency {report['latency_ms']}, peak RSS {report['peak_rss_mb']} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# download_cache.py
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from downloaders import cache_key
+from prediction_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCache:
+    """
+    Keeps downloaded audio keyed by canonical video id (or a hash of the
+    normalized URL for other sites, see `cache_key`), so popular tracks are
+    downloaded and transcoded once instead of on every submission.
+
+    Entries expire after a TTL and the least recently used ones are evicted once
+    the cache exceeds its size bound. Concurrent requests for an id that is still
+    downloading wait for that download instead of starting their own.
+
+    Audio is handed out through `checkout`, which pins the entry while the caller
+    reads the file: pinned entries are skipped by size eviction, and a pinned
+    entry that expires or is replaced leaves the index at once but keeps its file
+    until the last reader releases it. Every download gets a file name of its
+    own, so a replacement never overwrites a file still being read.
+    """
+
+    def __init__(self, downloader, cache_dir, max_bytes=2 * 1024 ** 3, ttl=24 * 3600, prefix='yt_'):
+        """
+        Initializes the DownloadCache.
+
+        Parameters:
+            downloader: Object with a `download(url, song_name, artist)` method returning a file path.
+            cache_dir (str): Directory holding cached audio. Created if missing.
+            max_bytes (int): Total size of cached files before the least recently used are evicted.
+            ttl (float): Seconds a download stays valid.
+            prefix (str): Filename prefix marking cached files, so they can be found again on restart.
+        """
+        self.downloader = downloader
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prefix = prefix
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # Least recently used first
+        self._in_flight = {}
+        self._bytes = 0
+
+        # Counters
+        self._hits = 0
+        self._shared = 0
+        self._misses = 0
+        self._uncached = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._bytes_saved = 0
+
+        self._reconcile()
+        logger.info(f"Download cache initialized with {len(self._entries)} entries ({self._bytes} bytes) in {self.cache_dir}")
+
+    def _reconcile(self):
+        """Indexes cached files left by a previous run, oldest first."""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(self.prefix) and os.path.isfile(path):
+                stat = os.stat(path)
+                # <prefix><key>.<token><ext>; keys never contain dots
+                key = os.path.splitext(name[len(self.prefix):])[0].split('.', 1)[0]
+                found.append((stat.st_mtime, key, path, stat.st_size))
+        with self._lock:
+            for mtime, key, path, size in sorted(found):
+                if key in self._entries:
+                    # An older download of the same key whose removal was interrupted
+                    self._drop(key)
+                self._entries[key] = {'path': path, 'bytes': size, 'digest': None, 'created_at': mtime, 'pins': 0}
+                self._bytes += size
+            self._evict()
+
+    def _drop(self, key):
+        """Removes an entry, and its file once no reader has it pinned. Caller must hold the lock."""
+        entry = self._entries.pop(key)
+        self._bytes -= entry['bytes']
+        entry['dropped'] = True
+        if not entry['pins']:
+            self._remove_file(entry)
+
+    @staticmethod
+    def _remove_file(entry):
+        try:
+            os.remove(entry['path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove cached download {entry['path']}: {e}")
+
+    def _evict(self, keep=None):
+        """Drops expired entries, then least recently used ones until under the size bound. Caller must hold the lock."""
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if now - entry['created_at'] > self.ttl]:
+            self._drop(key)
+            self._expirations += 1
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if key != keep and not self._entries[key]['pins']:
+                self._drop(key)
+                self._evictions += 1
+
+    def _lookup(self, key):
+        """Returns a live entry and marks it recently used. Caller must hold the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['created_at'] > self.ttl:
+            self._drop(key)
+            self._expirations += 1
+            return None
+        if not os.path.exists(entry['path']):
+            # Deleted behind the cache's back, e.g. through /delete
+            self._entries.pop(key)
+            self._bytes -= entry['bytes']
+            entry['dropped'] = True
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _download(self, key, url, song_name, artist):
+        downloaded_path = self.downloader.download(url, song_name, artist)
+        token = uuid.uuid4().hex[:8]
+        path = os.path.join(self.cache_dir, f"{self.prefix}{key}.{token}{os.path.splitext(downloaded_path)[1]}")
+        shutil.move(downloaded_path, path)
+        return {
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'digest': file_digest(path),
+            'created_at': time.time(),
+            'pins': 0,
+        }
+
+    def _acquire(self, key, url, song_name, artist):
+        """Returns a pinned entry for a key and where it came from, downloading it on a miss."""
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    entry['pins'] += 1
+                    self._hits += 1
+                    self._bytes_saved += entry['bytes']
+                    digest_missing = entry['digest'] is None
+                else:
+                    future = self._in_flight.get(key)
+                    leader = future is None
+                    if leader:
+                        future = Future()
+                        self._in_flight[key] = future
+
+            if entry is not None:
+                if digest_missing:
+                    # Files found at startup are hashed on first use
+                    entry['digest'] = file_digest(entry['path'])
+                return entry, 'hit'
+
+            if not leader:
+                entry = future.result()
+                with self._lock:
+                    if entry.get('dropped') and not entry['pins']:
+                        # Evicted and deleted before this waiter got to it
+                        continue
+                    entry['pins'] += 1
+                    self._shared += 1
+                    self._bytes_saved += entry['bytes']
+                return entry, 'shared'
+
+            try:
+                entry = self._download(key, url, song_name, artist)
+            except Exception as e:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                future.set_exception(e)
+                raise
+
+            with self._lock:
+                if key in self._entries:
+                    self._drop(key)
+                entry['pins'] = 1
+                self._entries[key] = entry
+                self._bytes += entry['bytes']
+                self._misses += 1
+                self._evict(keep=key)
+                self._in_flight.pop(key, None)
+            future.set_result(entry)
+            return entry, 'downloaded'
+
+    def _release(self, entry):
+        with self._lock:
+            entry['pins'] -= 1
+            remove = entry['pins'] == 0 and entry.get('dropped')
+            if entry['pins'] == 0 and not remove:
+                # Size eviction skipped this entry while it was in use
+                self._evict()
+        if remove:
+            self._remove_file(entry)
+
+    @contextmanager
+    def checkout(self, url, song_name, artist):
+        """
+        Provides cached audio for a URL, downloading it on a miss. The file stays on
+        disk until the block exits, even if the entry is evicted meanwhile.
+
+        Parameters:
+            url (str): Media URL.
+            song_name (str): Song name, passed to the downloader on a miss.
+            artist (str): Artist, passed to the downloader on a miss.
+
+        Yields:
+            tuple: (path, content digest, source) where source is 'hit', 'shared',
+                'downloaded' or 'uncached' for URLs without a cache key.
+        """
+        key = cache_key(url)
+        if not key:
+            path = self.downloader.download(url, song_name, artist)
+            with self._lock:
+                self._uncached += 1
+            yield path, file_digest(path), 'uncached'
+            return
+
+        entry, source = self._acquire(key, url, song_name, artist)
+        try:
+            yield entry['path'], entry['digest'], source
+        finally:
+            self._release(entry)
+
+    def stats(self):
+        """
+        Returns cache counters.
+
+        Returns:
+            dict: Hits, shared downloads, misses, evictions, size and bytes not re-downloaded.
+        """
+        with self._lock:
+            lookups = self._hits + self._shared + self._misses
+            return {
+                'entries': len(self._entries),
+                'pinned': sum(1 for entry in self._entries.values() if entry['pins']),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'shared': self._shared,
+                'misses': self._misses,
+                'uncached': self._uncached,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'in_flight': len(self._in_flight),
+                'bytes_saved': self._bytes_saved,
+                'hit_ratio': round((self._hits + self._shared) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,248 @@
+# downloaders.py
+
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+from urllib.parse import parse_qs, parse_qsl, unquote, urlencode, urlparse
+
+import yt_dlp
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """Raised when audio for a URL cannot be retrieved."""
+
+
+def video_id(url):
+    """
+    Extracts a stable identifier for the media behind a URL.
+
+    YouTube watch, short and embed URLs map to their video id; other URLs map to
+    their last path segment.
+
+    Parameters:
+        url (str): Media URL.
+
+    Returns:
+        str: Identifier, or None if the URL has none.
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host.endswith('youtube.com') or host.endswith('youtube-nocookie.com'):
+        query_id = parse_qs(parsed.query).get('v')
+        if query_id:
+            return query_id[0]
+        parts = [part for part in parsed.path.split('/') if part]
+        if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+            return parts[1]
+        return None
+    if host == 'youtu.be':
+        parts = [part for part in parsed.path.split('/') if part]
+        return parts[0] if parts else None
+    segment = os.path.basename(unquote(parsed.path).rstrip('/'))
+    return os.path.splitext(segment)[0] or None
+
+
+def cache_key(url):
+    """
+    Builds the key downloads of a URL are cached under.
+
+    YouTube URLs are keyed on their video id, so every form of a video's URL
+    shares one entry. Other URLs are keyed on a hash of the whole normalized
+    URL (host, port, path and sorted query): their last path segment alone is
+    shared by unrelated media on different hosts or paths.
+
+    Parameters:
+        url (str): Media URL.
+
+    Returns:
+        str: Key safe to use in a filename, or None if the URL can't be cached.
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host.endswith(('youtube.com', 'youtube-nocookie.com')) or host == 'youtu.be':
+        media_id = video_id(url)
+        return (secure_filename(media_id) or None) if media_id else None
+    if not host:
+        return None
+
+    scheme = parsed.scheme.lower()
+    netloc = host
+    if parsed.port is not None and (scheme, parsed.port) not in (('http', 80), ('https', 443)):
+        netloc += f':{parsed.port}'
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    normalized = f"{scheme}://{netloc}{parsed.path.rstrip('/') or '/'}" + (f'?{query}' if query else '')
+    return 'url-' + hashlib.sha256(normalized.encode()).hexdigest()[:32]
+
+
+def unique_audio_basename(song_name, artist):
+    """
+    Builds a collision-free base filename for downloaded audio.
+
+    Parameters:
+        song_name (str): Song name supplied by the client.
+        artist (str): Artist supplied by the client.
+
+    Returns:
+        str: Base filename without extension.
+    """
+    unique_id = uuid.uuid4().hex
+    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    return f"{secure_filename(song_name)}-{secure_filename(artist)}_{timestamp}_{unique_id}"
+
+
+class YoutubeDownloader:
+    """
+    Downloads the audio track of a URL with yt-dlp, either transcoded to mp3 or as
+    the best audio stream the site delivers (usually opus or m4a).
+    """
+
+    def __init__(self, dest_dir, transcode=True):
+        """
+        Initializes the YoutubeDownloader.
+
+        Parameters:
+            dest_dir (str): Directory the audio file is written to.
+            transcode (bool): Re-encode the download to mp3. When False the native stream is
+                kept and decoded directly, saving an encode/decode round trip.
+        """
+        self.dest_dir = dest_dir
+        self.transcode = transcode
+
+    def download(self, url, song_name, artist):
+        """
+        Downloads audio for a URL.
+
+        Parameters:
+            url (str): Media URL.
+            song_name (str): Song name, used in the output filename.
+            artist (str): Artist, used in the output filename.
+
+        Returns:
+            str: Path to the downloaded mp3 file, or to the native audio file when not transcoding.
+        """
+        audio_filepath_template = os.path.join(self.dest_dir, f"{unique_audio_basename(song_name, artist)}.%(ext)s")
+
+        # Use yt-dlp to download and extract audio
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': audio_filepath_template,  # Use template with %(ext)s
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+        }
+        if self.transcode:
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192',
+            }]
+
+        logger.debug(f"Downloading audio from URL to {audio_filepath_template}")
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=True)
+                native_filepath = ydl.prepare_filename(info)
+        except yt_dlp.utils.DownloadError as e:
+            raise DownloadError(str(e)) from e
+        if self.transcode:
+            final_audio_filepath = audio_filepath_template.replace('.%(ext)s', '.mp3')
+        else:
+            final_audio_filepath = native_filepath
+
+        # Check if the file exists
+        if not os.path.exists(final_audio_filepath):
+            raise DownloadError(f"Downloaded audio file does not exist at path: {final_audio_filepath}")
+        logger.debug(f"Audio downloaded to {final_audio_filepath}")
+        return final_audio_filepath
+
+
+class LocalDownloader:
+    """
+    Offline stand-in for YoutubeDownloader that serves media from a local directory.
+
+    `file://` URLs are read directly, but only from inside `media_dir`. Any other
+    URL is resolved by its video id to `<media_dir>/<id>.<ext>`, so tests can use
+    real-looking YouTube URLs.
+    """
+
+    def __init__(self, dest_dir, media_dir):
+        """
+        Initializes the LocalDownloader.
+
+        Parameters:
+            dest_dir (str): Directory the audio file is copied to.
+            media_dir (str): Directory holding the stand-in media files.
+        """
+        self.dest_dir = dest_dir
+        self.media_dir = media_dir
+
+    def _confine(self, path):
+        """Returns the resolved path if it is a file inside the media directory, else None."""
+        # Resolve symlinks and '..' first, so neither can lead out of the directory
+        media_dir = os.path.realpath(self.media_dir)
+        path = os.path.realpath(path)
+        if os.path.commonpath([media_dir, path]) != media_dir or not os.path.isfile(path):
+            return None
+        return path
+
+    def _resolve(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme == 'file':
+            path = self._confine(unquote(parsed.path))
+            if path is None:
+                logger.warning(f"Refusing local media outside {self.media_dir}: {url}")
+            return path
+
+        media_id = video_id(url)
+        if not media_id or not os.path.isdir(self.media_dir):
+            return None
+        for entry in sorted(os.listdir(self.media_dir)):
+            if os.path.splitext(entry)[0] == media_id:
+                return self._confine(os.path.join(self.media_dir, entry))
+        return None
+
+    def download(self, url, song_name, artist):
+        """
+        Copies the local media file matching a URL into the destination directory.
+
+        Parameters:
+            url (str): Media URL.
+            song_name (str): Song name, used in the output filename.
+            artist (str): Artist, used in the output filename.
+
+        Returns:
+            str: Path to the copied audio file.
+        """
+        source_path = self._resolve(url)
+        if source_path is None:
+            raise DownloadError(f"No local media found for URL: {url}")
+        extension = os.path.splitext(source_path)[1]
+        final_audio_filepath = os.path.join(self.dest_dir, f"{unique_audio_basename(song_name, artist)}{extension}")
+        shutil.copyfile(source_path, final_audio_filepath)
+        logger.debug(f"Copied local media {source_path} to {final_audio_filepath}")
+        return final_audio_filepath
+
+
+def create_downloader(config, dest_dir):
+    """
+    Creates the downloader selected by the AUDIO_DOWNLOADER setting.
+
+    Parameters:
+        config (dict): Application config.
+        dest_dir (str): Directory downloaded audio is written to.
+
+    Returns:
+        YoutubeDownloader or LocalDownloader
+    """
+    kind = config['AUDIO_DOWNLOADER']
+    if kind == 'youtube':
+        return YoutubeDownloader(dest_dir, transcode=not config['DOWNLOAD_NATIVE_AUDIO'])
+    if kind == 'local':
+        return LocalDownloader(dest_dir, os.path.abspath(config['LOCAL_MEDIA_DIR']))
+    raise ValueError(f"Unknown AUDIO_DOWNLOADER: {kind}")
@@ -0,0 +1,387 @@
+# embedding_index.py
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = 'vectors.f32'
+ITEMS_FILE = 'items.jsonl'
+CENTROIDS_FILE = 'centroids.npy'
+ASSIGNMENTS_FILE = 'assignments.i32'
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalizes each row so dot products are cosine similarities.
+
+    Parameters:
+        vectors (np.ndarray): Array of shape (N, dim).
+
+    Returns:
+        np.ndarray: float32 array of shape (N, dim) with unit-length rows (zero rows stay zero).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def _merge_top_k(best_scores, best_rows, scores, rows, k):
+    """Merges a block of candidate scores of shape (B, n) into the running top-k of each query."""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    rows = np.concatenate([best_rows, np.broadcast_to(rows, (scores.shape[0], len(rows)))], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    return scores, rows
+
+
+class EmbeddingIndex:
+    """
+    Persistent similarity index over track embeddings.
+
+    Vectors are appended to a flat float32 file that is memory-mapped for search,
+    so the catalog does not have to fit in RAM and adds never rewrite it. Exact
+    search scans the file in blocks with one matrix multiply per block for the
+    whole query batch, keeping a running top-k.
+
+    Once the catalog passes `ivf_threshold` vectors, the index partitions it with
+    spherical k-means (IVF) in the background. Queries then only scan the
+    `nprobe` partitions whose centroids are closest. New vectors are assigned to
+    their nearest centroid as they are added, so the partitioning never needs a
+    full rebuild; `train` can be called again if the catalog drifts.
+    """
+
+    def __init__(self, directory, dim, ivf_threshold=1_000_000, nlist=None, nprobe=8, block_rows=65536):
+        """
+        Initializes the EmbeddingIndex, loading any vectors already in `directory`.
+
+        Parameters:
+            directory (str): Directory holding the index files. Created if missing.
+            dim (int): Embedding dimension.
+            ivf_threshold (int): Vector count above which the index is partitioned and searched approximately.
+            nlist (int): Number of partitions; defaults to 4 * sqrt(count) when training.
+            nprobe (int): Partitions scanned per query in approximate mode.
+            block_rows (int): Rows scored per matrix multiply in exact mode.
+        """
+        self.directory = directory
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.block_rows = block_rows
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._items = []  # Metadata per row
+        self._rows = {}  # id -> row
+        self._mapped = None
+        self._centroids = None
+        self._assignments = None  # Partition of each row, in row order
+        self._lists = None  # Partition -> sorted rows, as of the last compaction
+        self._pending = {}  # Partition -> rows added since the last compaction
+        self._pending_count = 0
+        self._training = False
+
+        # Counters
+        self._adds = 0
+        self._duplicates = 0
+        self._exact_searches = 0
+        self._approximate_searches = 0
+        self._last_train_seconds = None
+
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def _load(self):
+        items = []
+        if os.path.exists(self._path(ITEMS_FILE)):
+            with open(self._path(ITEMS_FILE)) as f:
+                items = [json.loads(line) for line in f if line.strip()]
+        vector_bytes = os.path.getsize(self._path(VECTORS_FILE)) if os.path.exists(self._path(VECTORS_FILE)) else 0
+        count = min(len(items), vector_bytes // (self.dim * 4))
+
+        # A crash between the two appends leaves one file ahead of the other; drop the unmatched tail
+        if count != len(items) or count * self.dim * 4 != vector_bytes:
+            logger.warning(f"Embedding index files disagree ({len(items)} items, {vector_bytes} vector bytes); "
+                           f"truncating to {count} entries")
+            items = items[:count]
+            with open(self._path(ITEMS_FILE), 'w') as f:
+                f.writelines(json.dumps(item) + '\n' for item in items)
+            with open(self._path(VECTORS_FILE), 'ab') as f:
+                f.truncate(count * self.dim * 4)
+
+        self._items = items
+        self._rows = {item['id']: row for row, item in enumerate(items)}
+        if os.path.exists(self._path(CENTROIDS_FILE)):
+            self._centroids = np.load(self._path(CENTROIDS_FILE))
+            assignments = np.fromfile(self._path(ASSIGNMENTS_FILE), dtype=np.int32)
+            if len(assignments) > count:
+                assignments = assignments[:count]
+                assignments.tofile(self._path(ASSIGNMENTS_FILE))
+            self._assignments = assignments
+            self._compact()
+            if len(assignments) < count:
+                # Rows added after the last assignment was written
+                self._assign(np.arange(len(assignments), count))
+        logger.info(f"Embedding index loaded {count} vectors from {self.directory} "
+                    f"({'partitioned into ' + str(len(self._centroids)) if self.trained else 'not partitioned'})")
+
+    def _vectors(self):
+        """Returns a memory map of the stored vectors. Caller must hold the lock."""
+        if self._mapped is None or len(self._mapped) != self.count:
+            if self.count == 0:
+                self._mapped = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                self._mapped = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        return self._mapped
+
+    def _compact(self):
+        """Rebuilds the partition lists from the assignments. Caller must hold the lock."""
+        order = np.argsort(self._assignments, kind='stable').astype(np.int64)
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(self._assignments, minlength=len(self._centroids)))])
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        self._pending = {}
+        self._pending_count = 0
+
+    def _nearest_centroids(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _assign(self, rows):
+        """Assigns rows to partitions and appends them to the lists. Caller must hold the lock."""
+        vectors = self._vectors()
+        assignments = np.concatenate([
+            self._nearest_centroids(np.asarray(vectors[start:min(start + self.block_rows, rows[-1] + 1)]))
+            for start in range(rows[0], rows[-1] + 1, self.block_rows)
+        ]) if len(rows) else np.zeros(0, dtype=np.int32)
+        with open(self._path(ASSIGNMENTS_FILE), 'ab') as f:
+            assignments.tofile(f)
+        self._assignments = np.concatenate([self._assignments, assignments])
+        for row, partition in zip(rows, assignments):
+            self._pending.setdefault(int(partition), []).append(int(row))
+        self._pending_count += len(rows)
+        if self._pending_count > max(1024, self.count // 100):
+            self._compact()
+
+    def add(self, ids, vectors, metadata=None):
+        """
+        Appends embeddings to the index. Ids already present are skipped.
+
+        Parameters:
+            ids (list): Unique identifier of each vector.
+            vectors (np.ndarray): Embeddings of shape (N, dim).
+            metadata (list): Optional dict per vector, returned with search results.
+
+        Returns:
+            int: Number of vectors added.
+        """
+        vectors = normalize_rows(np.reshape(vectors, (-1, self.dim)))
+        metadata = metadata or [{}] * len(ids)
+        with self._lock:
+            fresh = []
+            for position, item_id in enumerate(ids):
+                if item_id in self._rows:
+                    self._duplicates += 1
+                else:
+                    self._rows[item_id] = -1  # Reserved so duplicates within the batch are skipped
+                    fresh.append(position)
+            if not fresh:
+                return 0
+
+            first_row = self.count
+            items = [{**metadata[position], 'id': ids[position]} for position in fresh]
+            # Vectors go first: on restart, items without a vector are dropped
+            with open(self._path(VECTORS_FILE), 'ab') as f:
+                vectors[fresh].tofile(f)
+            with open(self._path(ITEMS_FILE), 'a') as f:
+                f.writelines(json.dumps(item) + '\n' for item in items)
+            for offset, item in enumerate(items):
+                self._rows[item['id']] = first_row + offset
+            self._items.extend(items)
+            self._adds += len(items)
+
+            if self.trained:
+                self._assign(np.arange(first_row, self.count))
+            start_training = not self.trained and not self._training and self.count >= self.ivf_threshold
+            if start_training:
+                self._training = True
+        if start_training:
+            threading.Thread(target=self.train, name='embedding-index-train', daemon=True).start()
+        return len(items)
+
+    def get(self, item_id):
+        """
+        Returns the stored (normalized) embedding of an id, or None if it is not indexed.
+        """
+        with self._lock:
+            row = self._rows.get(item_id)
+            if row is None or row < 0:
+                return None
+            return np.array(self._vectors()[row])
+
+    def train(self, nlist=None, sample_size=100_000, iterations=10, seed=0):
+        """
+        Partitions the index with spherical k-means and assigns every vector to its nearest centroid.
+
+        Parameters:
+            nlist (int): Number of partitions; defaults to the configured nlist or 4 * sqrt(count).
+            sample_size (int): Vectors used to fit the centroids.
+            iterations (int): k-means iterations.
+            seed (int): Random seed for the sample and initial centroids.
+        """
+        started_at = time.perf_counter()
+        try:
+            with self._lock:
+                vectors, count = self._vectors(), self.count
+            nlist = min(nlist or self.nlist or int(4 * np.sqrt(count)), count)
+            if nlist < 1:
+                return
+            rng = np.random.default_rng(seed)
+            sample = np.asarray(vectors[np.sort(rng.choice(count, size=min(sample_size, count), replace=False))])
+            nlist = min(nlist, len(sample))
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                empty = np.bincount(labels, minlength=nlist) == 0
+                sums[empty] = centroids[empty]  # Keep centroids that attracted no vectors
+                centroids = normalize_rows(sums)
+
+            assignments = np.concatenate([
+                np.argmax(np.asarray(vectors[start:start + self.block_rows]) @ centroids.T, axis=1).astype(np.int32)
+                for start in range(0, count, self.block_rows)
+            ])
+            tmp_path = self._path(ASSIGNMENTS_FILE) + '.tmp'
+            assignments.tofile(tmp_path)
+
+            with self._lock:
+                np.save(self._path(CENTROIDS_FILE), centroids)
+                os.replace(tmp_path, self._path(ASSIGNMENTS_FILE))
+                self._centroids = centroids
+                self._assignments = assignments
+                self._compact()
+                if self.count > count:
+                    # Catch up with vectors added while training
+                    self._assign(np.arange(count, self.count))
+                self._last_train_seconds = time.perf_counter() - started_at
+            logger.info(f"Partitioned {count} embeddings into {nlist} lists in {self._last_train_seconds:.1f}s")
+        finally:
+            with self._lock:
+                self._training = False
+
+    def search(self, queries, k=10, nprobe=None, exclude=None):
+        """
+        Finds the most similar indexed tracks for a batch of query embeddings.
+
+        Parameters:
+            queries (np.ndarray): Query embeddings of shape (B, dim) or (dim,).
+            k (int): Results per query.
+            nprobe (int): Partitions scanned per query in approximate mode; defaults to the configured nprobe.
+            exclude (list): Optional id per query to leave out of its results, e.g. the query track itself.
+
+        Returns:
+            list: For each query, a list of result dicts with the item's metadata, 'id' and 'score'
+                (cosine similarity), best first.
+        """
+        queries = normalize_rows(np.reshape(queries, (-1, self.dim)))
+        with self._lock:
+            vectors, count = self._vectors(), self.count
+            approximate = self.trained and count >= self.ivf_threshold
+            if approximate:
+                centroids = self._centroids
+                lists = self._lists
+                pending = {partition: np.array(rows) for partition, rows in self._pending.items()}
+            if approximate:
+                self._approximate_searches += 1
+            else:
+                self._exact_searches += 1
+
+        # One extra candidate per query covers an excluded id
+        fetch = min(k + (1 if exclude else 0), count)
+        if fetch == 0:
+            return [[] for _ in queries]
+        if approximate:
+            scores, rows = self._search_partitions(queries, vectors, centroids, lists, pending, fetch, nprobe or self.nprobe)
+        else:
+            scores, rows = self._search_exact(queries, vectors, count, fetch)
+
+        results = []
+        for query_index in range(len(queries)):
+            order = np.argsort(-scores[query_index])
+            excluded = exclude[query_index] if exclude else None
+            matches = []
+            for position in order:
+                row = int(rows[query_index, position])
+                if row < 0 or self._items[row]['id'] == excluded:
+                    continue
+                matches.append({**self._items[row], 'score': round(float(scores[query_index, position]), 6)})
+                if len(matches) == k:
+                    break
+            results.append(matches)
+        return results
+
+    def _search_exact(self, queries, vectors, count, k):
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, count, self.block_rows):
+            block = np.asarray(vectors[start:min(start + self.block_rows, count)])
+            best_scores, best_rows = _merge_top_k(
+                best_scores, best_rows, queries @ block.T, np.arange(start, start + len(block)), k
+            )
+        return best_scores, best_rows
+
+    def _search_partitions(self, queries, vectors, centroids, lists, pending, k, nprobe):
+        nprobe = min(nprobe, len(centroids))
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for query_index, query in enumerate(queries):
+            candidates = np.concatenate(
+                [lists[p] for p in probes[query_index]] + [pending[p] for p in probes[query_index] if p in pending]
+            )
+            if not len(candidates):
+                continue
+            candidates.sort()  # Sequential reads from the memory map
+            scores = np.asarray(vectors[candidates]) @ query
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            best_scores[query_index, :len(top)] = scores[top]
+            best_rows[query_index, :len(top)] = candidates[top]
+        return best_scores, best_rows
+
+    def stats(self):
+        """
+        Returns index size and search counters.
+
+        Returns:
+            dict: Vectors indexed, partitioning state, adds, duplicates skipped and searches by mode.
+        """
+        with self._lock:
+            return {
+                'vectors': self.count,
+                'dim': self.dim,
+                'partitions': len(self._centroids) if self.trained else None,
+                'approximate': self.trained and self.count >= self.ivf_threshold,
+                'training': self._training,
+                'adds': self._adds,
+                'duplicates': self._duplicates,
+                'exact_searches': self._exact_searches,
+                'approximate_searches': self._approximate_searches,
+                'last_train_seconds': round(self._last_train_seconds, 3) if self._last_train_seconds is not None else None,
+            }
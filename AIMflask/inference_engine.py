@@ -0,0 +1,122 @@
+# inference_engine.py
+
+import bisect
+import logging
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+# Alignment at which TensorFlow wraps a numpy array in place instead of copying it (EIGEN_MAX_ALIGN_BYTES is at most 64)
+TENSOR_ALIGNMENT = 64
+
+
+def aligned_zeros(shape, dtype=np.float32, alignment=TENSOR_ALIGNMENT):
+    """
+    Allocates a zeroed array whose data starts on an `alignment`-byte boundary.
+
+    Parameters:
+        shape (tuple): Array shape.
+        dtype (np.dtype): Element type.
+        alignment (int): Required alignment of the first element in bytes.
+
+    Returns:
+        np.ndarray: Zeroed, C-contiguous array.
+    """
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    raw = np.zeros(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+class InferenceEngine:
+    """
+    Wraps a Keras model in concrete functions traced once per padded batch-size
+    bucket, avoiding the data adapter, callback loop and retracing that
+    `model.predict` pays on every call.
+
+    Each batch is copied into a preallocated float32 buffer for the smallest
+    bucket that fits it; batches larger than the biggest bucket are split. The
+    buffers are aligned so the traced function reads them in place rather than
+    through a fresh tensor copied from them on every call.
+    """
+
+    def __init__(self, model, bucket_sizes=(1, 2, 4, 8, 16), input_shape=(128, 1024, 3), jit_compile=False):
+        """
+        Initializes the InferenceEngine.
+
+        Parameters:
+            model (tensorflow.keras.models.Model): Loaded Keras model.
+            bucket_sizes (iterable): Padded batch sizes to trace.
+            input_shape (tuple): Shape of a single model input.
+            jit_compile (bool): Whether to compile the forward pass with XLA.
+        """
+        self.model = model
+        self.bucket_sizes = sorted(set(bucket_sizes))
+        self.input_shape = tuple(input_shape)
+
+        forward = tf.function(lambda inputs: model(inputs, training=False), jit_compile=jit_compile)
+        self._functions = {}
+        self._buffers = {}
+        self._filled = {}  # Rows of each buffer holding the last batch; rows past them are zero
+        self._locks = {}
+        for bucket in self.bucket_sizes:
+            spec = tf.TensorSpec((bucket, *self.input_shape), tf.float32)
+            self._functions[bucket] = forward.get_concrete_function(spec)
+            self._buffers[bucket] = aligned_zeros((bucket, *self.input_shape))
+            self._filled[bucket] = 0
+            self._locks[bucket] = threading.Lock()
+        logger.info(f"Inference engine traced buckets {self.bucket_sizes} (jit_compile={jit_compile})")
+
+    def _bucket_for(self, batch_size):
+        index = bisect.bisect_left(self.bucket_sizes, batch_size)
+        return self.bucket_sizes[min(index, len(self.bucket_sizes) - 1)]
+
+    def _run_bucket(self, batch):
+        bucket = self._bucket_for(len(batch))
+        with self._locks[bucket]:
+            buffer = self._buffers[bucket]
+            buffer[:len(batch)] = batch
+            # Padding rows are discarded but kept deterministic; only rows the last batch used need clearing
+            buffer[len(batch):self._filled[bucket]] = 0.0
+            self._filled[bucket] = len(batch)
+            # Passed as is: the buffer is wrapped without a copy, so keep it locked until the outputs are read back
+            return self._functions[bucket](buffer).numpy()[:len(batch)]
+
+    def predict(self, batch, verbose=0):
+        """
+        Runs a batch through the traced forward pass.
+
+        Parameters:
+            batch (np.ndarray): Inputs of shape (N, 128, 1024, 3).
+            verbose (int): Accepted for compatibility with Keras `predict`; ignored.
+
+        Returns:
+            np.ndarray: Class probabilities of shape (N, classes).
+        """
+        largest = self.bucket_sizes[-1]
+        if len(batch) <= largest:
+            return self._run_bucket(batch)
+        return np.concatenate([self._run_bucket(batch[start:start + largest])
+                               for start in range(0, len(batch), largest)])
+
+
+def with_embedding_output(model):
+    """
+    Extends a classifier so each output row holds the class probabilities followed by
+    the input of the final Dense layer, the pooled track embedding. A single output
+    keeps the model usable by InferenceEngine, the batch scheduler and warm-up as is.
+
+    Parameters:
+        model (tensorflow.keras.models.Model): Classifier ending in a Dense softmax layer.
+
+    Returns:
+        tensorflow.keras.models.Model: Model with outputs of shape (N, classes + embedding size).
+    """
+    embedding = model.layers[-1].input
+    outputs = tf.keras.layers.Concatenate(axis=-1, dtype='float32')(
+        [model.output, tf.keras.layers.Activation('linear', dtype='float32')(embedding)]
+    )
+    return tf.keras.Model(inputs=model.input, outputs=outputs)
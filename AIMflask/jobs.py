@@ -0,0 +1,239 @@
+# jobs.py
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its depth cap."""
+
+
+class JobManager:
+    """
+    Runs slow classification work on a bounded worker pool and keeps each job's
+    status and result for `result_ttl` seconds after it finishes.
+
+    With `store_dir`, every job record is also written to `<store_dir>/<id>.json`
+    whenever it changes, so processes sharing the directory (the workers of a
+    pre-forked server) can answer for each other's jobs. Each record is only
+    written by the process running the job and is replaced atomically, so
+    readers never see a partial record and no locking is needed.
+    """
+
+    def __init__(self, max_workers=2, max_queue_depth=32, result_ttl=600, store_dir=None):
+        """
+        Initializes the JobManager.
+
+        Parameters:
+            max_workers (int): Number of worker threads running jobs.
+            max_queue_depth (int): Maximum number of queued plus running jobs.
+            result_ttl (float): Seconds a finished job stays retrievable.
+            store_dir (str): Optional directory job records are shared through.
+        """
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.result_ttl = result_ttl
+        self.store_dir = store_dir
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+        self._next_sweep = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = 0
+
+        # Counters
+        self._submitted = 0
+        self._rejected = 0
+        self._succeeded = 0
+        self._failed = 0
+        self._expired = 0
+        logger.info(f"Job manager started with {max_workers} workers (max queue depth {max_queue_depth})")
+
+    def submit(self, fn, *args, cleanup=None, **kwargs):
+        """
+        Queues a job.
+
+        Parameters:
+            fn (callable): Work to run; its return value becomes the job result.
+            *args: Positional arguments for `fn`.
+            cleanup (callable): Optional function run after the job finishes, whatever the outcome.
+            **kwargs: Keyword arguments for `fn`.
+
+        Returns:
+            str: Job id.
+        """
+        self.purge_expired()
+        with self._lock:
+            if self._active >= self.max_queue_depth:
+                self._rejected += 1
+                raise JobQueueFull(f"Job queue is full ({self.max_queue_depth} jobs pending).")
+            job_id = uuid.uuid4().hex
+            job = self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+            }
+            self._active += 1
+            self._submitted += 1
+            record = dict(job)
+
+        self._store(record)
+        self._executor.submit(self._run, job_id, fn, args, kwargs, cleanup)
+        logger.debug(f"Queued job {job_id}")
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs, cleanup):
+        with self._lock:
+            self._jobs[job_id].update(status='running', started_at=time.time())
+            record = dict(self._jobs[job_id])
+        self._store(record)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed: {e}")
+            with self._lock:
+                self._jobs[job_id].update(status='failed', error=str(e), finished_at=time.time())
+                self._failed += 1
+                record = dict(self._jobs[job_id])
+        else:
+            with self._lock:
+                self._jobs[job_id].update(status='succeeded', result=result, finished_at=time.time())
+                self._succeeded += 1
+                record = dict(self._jobs[job_id])
+            logger.debug(f"Job {job_id} succeeded")
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._store(record)
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    logger.warning(f"Cleanup for job {job_id} failed: {e}")
+
+    def get(self, job_id):
+        """
+        Returns a snapshot of a job.
+
+        Parameters:
+            job_id (str): Job id returned by `submit`.
+
+        Returns:
+            dict: Job status and result, or None if the job is unknown or expired.
+        """
+        self.purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.store_dir is None:
+            return None
+        # Submitted to another process sharing the store
+        job = self._load(job_id)
+        if job is not None and job['finished_at'] is not None and job['finished_at'] < time.time() - self.result_ttl:
+            self._unlink(job_id)
+            return None
+        return job
+
+    def purge_expired(self):
+        """Drops finished jobs older than the result TTL."""
+        now = time.time()
+        cutoff = now - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._expired += len(expired)
+            sweep = self.store_dir is not None and now >= self._next_sweep
+            if sweep:
+                self._next_sweep = now + self.result_ttl
+        for job_id in expired:
+            self._unlink(job_id)
+        if sweep:
+            self._sweep(cutoff)
+
+    def _path(self, job_id):
+        return os.path.join(self.store_dir, f'{job_id}.json')
+
+    def _store(self, job):
+        if self.store_dir is None:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.store_dir, prefix='.job-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(job, f, default=str)
+            os.replace(temp_path, self._path(job['id']))
+        except Exception as e:
+            logger.warning(f"Could not store job {job['id']}: {e}")
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+    def _load(self, job_id):
+        # Job ids are hex, so anything else can't name a record
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _unlink(self, job_id):
+        if self.store_dir is None:
+            return
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _sweep(self, cutoff):
+        """Removes expired records left by processes that exited before purging them."""
+        for name in os.listdir(self.store_dir):
+            job_id, extension = os.path.splitext(name)
+            if extension != '.json':
+                continue
+            job = self._load(job_id)
+            if job is not None and job['finished_at'] is not None and job['finished_at'] < cutoff:
+                self._unlink(job_id)
+
+    def shutdown(self, wait=True):
+        """Stops accepting jobs and waits for running ones to finish."""
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """
+        Returns queue occupancy and outcome counters.
+
+        Returns:
+            dict: Job counts by state and lifetime counters.
+        """
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+            return {
+                'max_workers': self.max_workers,
+                'max_queue_depth': self.max_queue_depth,
+                'queued': statuses.count('queued'),
+                'running': statuses.count('running'),
+                'retained': len(statuses),
+                'submitted': self._submitted,
+                'rejected': self._rejected,
+                'succeeded': self._succeeded,
+                'failed': self._failed,
+                'expired': self._expired,
+            }
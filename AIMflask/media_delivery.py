@@ -0,0 +1,228 @@
+# media_delivery.py
+
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from audio_ingest import find_ffmpeg
+from prediction_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+
+class FileDigests:
+    """
+    Bounded cache of SHA-256 digests of files, invalidated when a file's size or
+    modification time changes. Used as strong ETags without re-hashing large
+    files on every request.
+    """
+
+    def __init__(self, max_entries=4096):
+        """
+        Initializes the FileDigests.
+
+        Parameters:
+            max_entries (int): Maximum number of files remembered.
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> (size, mtime_ns, digest)
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def remember(self, path, digest):
+        """
+        Records a digest computed elsewhere, e.g. while the upload was hashed for the prediction cache.
+
+        Parameters:
+            path (str): Path to the file.
+            digest (str): Hex digest of its content.
+        """
+        try:
+            signature = self._signature(path)
+        except OSError:
+            return
+        with self._lock:
+            self._entries[path] = (*signature, digest)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, path):
+        """
+        Returns the digest of a file, hashing it only if it is unknown or has changed.
+
+        Parameters:
+            path (str): Path to the file.
+
+        Returns:
+            str: Hex digest of the file content.
+        """
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:2] == signature:
+                self._entries.move_to_end(path)
+                return entry[2]
+        digest = file_digest(path)
+        self.remember(path, digest)
+        return digest
+
+
+class PreviewRenditions:
+    """
+    Creates a small mono mp3 rendition of each audio file once, keyed by content
+    digest, for playback in place of the original (which may be a 200 MB WAV).
+
+    Renditions can be scheduled in the background as soon as a file is saved;
+    requests for a rendition still being created wait for it instead of starting
+    another transcode.
+    """
+
+    def __init__(self, preview_dir, digests, bitrate='64k', sample_rate=22050, workers=1, on_created=None):
+        """
+        Initializes the PreviewRenditions.
+
+        Parameters:
+            preview_dir (str): Directory holding the renditions. Created if missing.
+            digests (FileDigests): Digest cache for the original files.
+            bitrate (str): ffmpeg audio bitrate of the rendition.
+            sample_rate (int): Sample rate of the rendition.
+            workers (int): Background transcodes running at once.
+            on_created (callable): Optional; called with the rendition's filename after it is written.
+        """
+        self.preview_dir = preview_dir
+        self.digests = digests
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.on_created = on_created
+        os.makedirs(self.preview_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+        # Counters
+        self._created = 0
+        self._reused = 0
+        self._failures = 0
+        self._transcode_seconds = 0.0
+
+    @property
+    def available(self):
+        return find_ffmpeg() is not None
+
+    def etag(self, digest):
+        """Strong ETag of the rendition of content with `digest`; changes with the rendition settings."""
+        return f"{digest}-preview-{self.bitrate}-{self.sample_rate}"
+
+    def _path(self, digest):
+        return os.path.join(self.preview_dir, f"{digest}.mp3")
+
+    def _transcode(self, source_path, target_path):
+        started_at = time.perf_counter()
+        # Unique across threads and the processes sharing the directory; dot files are skipped by the janitor
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix='.', suffix='.mp3.tmp')
+        os.close(fd)  # ffmpeg overwrites it
+        command = [
+            find_ffmpeg(), '-nostdin', '-loglevel', 'error', '-y', '-i', source_path, '-vn',
+            '-ac', '1', '-ar', str(self.sample_rate), '-codec:a', 'libmp3lame', '-b:a', self.bitrate,
+            '-f', 'mp3', tmp_path
+        ]
+        try:
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed to create a preview of {source_path}: "
+                                   f"{result.stderr.decode(errors='replace').strip()}")
+            os.replace(tmp_path, target_path)  # Atomic so readers never see a partial rendition
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        elapsed = time.perf_counter() - started_at
+        logger.info(f"Created preview of {os.path.basename(source_path)} in {elapsed:.2f}s")
+        return elapsed
+
+    def get(self, source_path):
+        """
+        Returns the rendition of a file, creating it if it does not exist yet.
+
+        Parameters:
+            source_path (str): Path to the original audio file.
+
+        Returns:
+            tuple: (rendition path, digest of the original)
+        """
+        digest = self.digests.get(source_path)
+        target_path = self._path(digest)
+        with self._lock:
+            future = self._in_flight.get(digest)
+            if future is None and os.path.exists(target_path):
+                self._reused += 1
+                return target_path, digest
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[digest] = future
+
+        if not leader:
+            future.result()
+            return target_path, digest
+
+        try:
+            elapsed = self._transcode(source_path, target_path)
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                self._in_flight.pop(digest, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._created += 1
+            self._transcode_seconds += elapsed
+            self._in_flight.pop(digest, None)
+        future.set_result(target_path)
+        if self.on_created is not None:
+            self.on_created(os.path.basename(target_path))
+        return target_path, digest
+
+    def schedule(self, source_path):
+        """
+        Creates the rendition of a file in the background.
+
+        Parameters:
+            source_path (str): Path to the original audio file.
+        """
+        if not self.available:
+            return
+
+        def create():
+            try:
+                self.get(source_path)
+            except Exception as e:
+                logger.warning(f"Background preview of {source_path} failed: {e}")
+
+        self._executor.submit(create)
+
+    def stats(self):
+        """
+        Returns rendition counters.
+
+        Returns:
+            dict: Renditions created, reused and failed, in-flight transcodes and total transcode time.
+        """
+        with self._lock:
+            return {
+                'created': self._created,
+                'reused': self._reused,
+                'failures': self._failures,
+                'in_flight': len(self._in_flight),
+                'transcode_seconds': round(self._transcode_seconds, 3),
+            }
@@ -0,0 +1,421 @@
+# metrics.py
+
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a few milliseconds up to a long YouTube download
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """Base class holding one child per combination of label values."""
+
+    type_name = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.label_names:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """
+        Returns the child metric for a set of label values.
+
+        Parameters:
+            **labels: One value per label name.
+
+        Returns:
+            The child metric.
+        """
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _unlabelled(self):
+        if self.label_names:
+            raise ValueError(f"{self.name} has labels {self.label_names}; use .labels()")
+        return self._children[()]
+
+    def collect(self, extra_labels=None):
+        """Returns the exposition lines for this metric, with `extra_labels` (name, value) pairs added to every sample."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for label_values, child in children:
+            lines.extend(child.samples(self.name, self.label_names, label_values, extra_labels))
+        return lines
+
+
+class _ValueChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def samples(self, name, label_names, label_values, extra_labels=None):
+        return [f"{name}{_format_labels(label_names, label_values, extra_labels)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount=1.0):
+        if amount < 0:
+            raise ValueError("Counters can only increase.")
+        self._unlabelled().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, label_names, label_values, extra_labels=None):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        extra_labels = list(extra_labels or ())
+        lines = []
+        cumulative = 0
+        for upper, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(label_names, label_values, extra_labels + [('le', _format_value(upper))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(label_names, label_values, extra_labels)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, label_names)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+
+class MetricsRegistry:
+    """Holds the metrics of one app and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self, extra_labels=None):
+        """
+        Renders every registered metric.
+
+        Parameters:
+            extra_labels (list): Optional (name, value) label pairs added to every sample.
+
+        Returns:
+            str: Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect(extra_labels))
+        return '\n'.join(lines) + '\n'
+
+
+def merge_expositions(texts):
+    """
+    Merges expositions of the same metrics from several processes into one, with each
+    metric's HELP and TYPE lines once and the samples of every process under them.
+    Samples must already be told apart by a label such as `worker`.
+
+    Parameters:
+        texts (list): Prometheus text expositions.
+
+    Returns:
+        str: Prometheus text exposition format.
+    """
+    families = {}  # name -> [HELP and TYPE lines, samples]
+    family = None
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                name = line.split(' ', 3)[2]
+                family = families.setdefault(name, [[], []])
+                if len(family[0]) < 2 and line not in family[0]:
+                    family[0].append(line)
+            elif line and family is not None:
+                family[1].append(line)
+    lines = []
+    for name in sorted(families):
+        header, samples = families[name]
+        lines.extend(header)
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class WorkerSnapshots:
+    """
+    Shares the metrics and stats of the processes serving one app through a directory.
+
+    Each process replaces `<directory>/<pid>.json` with its own exposition, labelled
+    with `worker="<pid>"`, and its stats every `interval` seconds, and again whenever
+    it answers for all of them. Any process can then report the whole server, with
+    every worker's counters as separate series that only ever increase. Snapshots of
+    processes that have exited are removed when they are read.
+    """
+
+    def __init__(self, directory, registry, stats_fn, interval=5.0):
+        """
+        Initializes the WorkerSnapshots.
+
+        Parameters:
+            directory (str): Directory shared by the processes.
+            registry (MetricsRegistry): This process's metrics.
+            stats_fn (callable): Returns this process's stats as a JSON-serializable dict.
+            interval (float): Seconds between snapshots.
+        """
+        self.directory = directory
+        self.registry = registry
+        self.stats_fn = stats_fn
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self):
+        """Replaces this process's snapshot."""
+        pid = os.getpid()
+        snapshot = {
+            'pid': pid,
+            'published_at': time.time(),
+            'metrics': self.registry.render([('worker', pid)]),
+            'stats': self.stats_fn(),
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.snapshot-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f, default=str)
+            os.replace(temp_path, os.path.join(self.directory, f'{pid}.json'))
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def snapshots(self):
+        """
+        Publishes this process's snapshot and reads every live process's.
+
+        Returns:
+            list: Snapshots ordered by pid.
+        """
+        self.publish()
+        snapshots = []
+        for name in sorted(os.listdir(self.directory)):
+            pid, extension = os.path.splitext(name)
+            if extension != '.json' or not pid.isdigit():
+                continue
+            path = os.path.join(self.directory, name)
+            if not _process_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return sorted(snapshots, key=lambda snapshot: snapshot['pid'])
+
+    def render(self):
+        """Returns the merged exposition of every live process."""
+        return merge_expositions([snapshot['metrics'] for snapshot in self.snapshots()])
+
+    def stats(self):
+        """Returns the stats of every live process, keyed by pid, with the age of each snapshot."""
+        now = time.time()
+        return {
+            str(snapshot['pid']): {**snapshot['stats'], 'snapshot_age_seconds': max(0.0, now - snapshot['published_at'])}
+            for snapshot in self.snapshots()
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning(f"Could not publish worker snapshot: {e}")
+
+    def start(self):
+        """Publishes a first snapshot and keeps publishing in the background."""
+        self.publish()
+        self._thread = threading.Thread(target=self._run, name='worker-snapshots', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops publishing and removes this process's snapshot."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            os.remove(os.path.join(self.directory, f'{os.getpid()}.json'))
+        except FileNotFoundError:
+            pass
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class StageMetrics:
+    """Latency histogram and error counter shared by the stages of a pipeline."""
+
+    def __init__(self, registry, name='aim_stage'):
+        """
+        Initializes the StageMetrics.
+
+        Parameters:
+            registry (MetricsRegistry): Registry the metrics are added to.
+            name (str): Metric name prefix.
+        """
+        self.latency = registry.histogram(
+            f'{name}_duration_seconds', 'Time spent in each stage of the serving path.', ('stage',)
+        )
+        self.errors = registry.counter(f'{name}_errors_total', 'Errors raised by each stage of the serving path.', ('stage',))
+
+    def observe(self, stage, seconds):
+        self.latency.labels(stage=stage).observe(seconds)
+
+    def error(self, stage):
+        self.errors.labels(stage=stage).inc()
+
+    @contextmanager
+    def time(self, stage):
+        """Times the enclosed block as `stage`, counting an error if it raises."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started_at)
@@ -0,0 +1,192 @@
+# model_loader.py
+
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Loader states, in the order they are reached
+STARTING = 'starting'
+DOWNLOADING = 'downloading'
+LOADING = 'loading'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ModelLoader:
+    """
+    Loads the model on a background thread, then runs a synthetic warm-up batch
+    for each configured batch size so the first real request does not pay for
+    graph tracing. Serving code checks `ready` instead of blocking on startup.
+
+    The loader also holds the active model afterwards: `activate` swaps in a new,
+    already warmed model and keeps the replaced ones for `rollback`. Callers read
+    `model` once per forward pass, so a swap never interrupts a running pass.
+    """
+
+    def __init__(self, load_fn, warmup_fn, warmup_batch_sizes=(1,), input_shape=(128, 1024, 3),
+                 keep_previous=1, on_activate=None):
+        """
+        Initializes the ModelLoader.
+
+        Parameters:
+            load_fn (callable): Called with a `set_state` callback; returns (model, version).
+            warmup_fn (callable): Called with (model, batch) to run one warm-up forward pass.
+            warmup_batch_sizes (iterable): Batch sizes to warm up.
+            input_shape (tuple): Shape of a single model input.
+            keep_previous (int): Replaced models kept in memory for rollback.
+            on_activate (callable): Optional; called with (model, version) whenever a model becomes active.
+        """
+        self.load_fn = load_fn
+        self.warmup_fn = warmup_fn
+        self.warmup_batch_sizes = sorted(set(warmup_batch_sizes))
+        self.input_shape = input_shape
+        self.on_activate = on_activate
+        self.model = None
+        self.version = None
+        self.error = None
+        self._previous = deque(maxlen=keep_previous)
+        self._swaps = 0
+        self._activated_at = None
+        self._state = STARTING
+        self._warmed = []
+        self._timings = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def set_state(self, state):
+        with self._lock:
+            self._state = state
+        logger.info(f"Model loader state: {state}")
+
+    def start(self):
+        """Starts loading in the background."""
+        self._thread = threading.Thread(target=self._run, name='model-loader', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the model is ready.
+
+        Parameters:
+            timeout (float): Seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            bool: True if the model is ready.
+        """
+        return self._ready.wait(timeout)
+
+    def warm(self, model, on_batch=None):
+        """
+        Runs one synthetic batch of each warm-up size through a model.
+
+        Parameters:
+            model: Model to warm up.
+            on_batch (callable): Optional; called with each batch size once it has run.
+        """
+        for batch_size in self.warmup_batch_sizes:
+            batch_started_at = time.perf_counter()
+            self.warmup_fn(model, np.zeros((batch_size, *self.input_shape), dtype=np.float32))
+            logger.info(f"Warmed up batch size {batch_size} in {time.perf_counter() - batch_started_at:.2f}s")
+            if on_batch is not None:
+                on_batch(batch_size)
+
+    def _record_warmed(self, batch_size):
+        with self._lock:
+            self._warmed.append(batch_size)
+
+    def _run(self):
+        started_at = time.perf_counter()
+        try:
+            model, version = self.load_fn(self.set_state)
+            loaded_at = time.perf_counter()
+            self._timings['load_seconds'] = round(loaded_at - started_at, 3)
+
+            self.set_state(WARMING)
+            self.warm(model, on_batch=self._record_warmed)
+            self._timings['warmup_seconds'] = round(time.perf_counter() - loaded_at, 3)
+        except Exception as e:
+            logger.exception(f"Model loading failed: {e}")
+            self.error = str(e)
+            self.set_state(FAILED)
+            return
+
+        self.activate(model, version)
+        self.set_state(READY)
+        self._ready.set()
+
+    def activate(self, model, version):
+        """
+        Makes a loaded and warmed model the active one, keeping the replaced model for rollback.
+
+        Parameters:
+            model: Model to serve.
+            version (str): Its version identifier.
+        """
+        with self._lock:
+            if self.model is not None:
+                self._previous.append((self.model, self.version))
+                self._swaps += 1
+            self.model, self.version = model, version
+            self._activated_at = time.time()
+        logger.info(f"Model version {version} is active")
+        if self.on_activate is not None:
+            self.on_activate(model, version)
+
+    def rollback(self):
+        """
+        Swaps the active model with the most recently replaced one. Rolling back twice rolls forward again.
+
+        Returns:
+            str: Version now active, or None if there is nothing to roll back to.
+        """
+        with self._lock:
+            if not self._previous:
+                return None
+            model, version = self._previous.pop()
+            self._previous.append((self.model, self.version))
+            self.model, self.version = model, version
+            self._swaps += 1
+            self._activated_at = time.time()
+        logger.info(f"Rolled back to model version {version}")
+        if self.on_activate is not None:
+            self.on_activate(model, version)
+        return version
+
+    def status(self):
+        """
+        Returns load state, warm-up progress and model version.
+
+        Returns:
+            dict: Readiness report.
+        """
+        with self._lock:
+            return {
+                'state': self._state,
+                'ready': self._ready.is_set(),
+                'model_version': self.version,
+                'previous_versions': [version for _, version in reversed(self._previous)],
+                'swaps': self._swaps,
+                'activated_at': self._activated_at,
+                'warmup': {
+                    'batch_sizes': self.warmup_batch_sizes,
+                    'completed': list(self._warmed),
+                },
+                'timings': dict(self._timings),
+                'error': self.error,
+            }
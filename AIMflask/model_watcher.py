@@ -0,0 +1,181 @@
+# model_watcher.py
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def s3_fingerprint(s3_client, bucket, key):
+    """
+    Returns a callable fingerprinting an S3 object by version id and ETag.
+
+    Parameters:
+        s3_client (boto3.client): AWS S3 client.
+        bucket (str): Bucket name.
+        key (str): Object key.
+
+    Returns:
+        callable: Returns the current fingerprint string.
+    """
+    def fingerprint():
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        etag = head['ETag'].strip('"')
+        return f"{head.get('VersionId') or ''}:{etag}"
+    return fingerprint
+
+
+def file_fingerprint(path):
+    """
+    Returns a callable fingerprinting a local file by size and modification time,
+    standing in for an S3 object during development and tests.
+
+    Parameters:
+        path (str): Path to the watched file.
+
+    Returns:
+        callable: Returns the current fingerprint string, or None while the file is missing.
+    """
+    def fingerprint():
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+    return fingerprint
+
+
+class ModelWatcher:
+    """
+    Polls the published model for changes and hot-swaps new versions in: the
+    new model is fetched, loaded and warmed beside the active one, and only then
+    activated, so requests keep being served by the old model until the swap.
+
+    A version that fails to load is not retried on every poll: the watcher waits
+    one interval before trying the same fingerprint again, doubling the wait after
+    each further failure up to `max_backoff`. A newly published fingerprint is
+    tried at the next poll.
+    """
+
+    def __init__(self, loader, fingerprint_fn, load_fn, interval=60, baseline=None, max_backoff=3600):
+        """
+        Initializes the ModelWatcher.
+
+        Parameters:
+            loader (ModelLoader): Holder of the active model; used to warm and activate new versions.
+            fingerprint_fn (callable): Returns a string identifying the published model, or None if absent.
+            load_fn (callable): Called with a fingerprint; fetches and loads that model and returns (model, version).
+            interval (float): Seconds between polls.
+            baseline (str or callable): Fingerprint of the model being served at startup, or a callable returning
+                it once the initial model has loaded. Otherwise the first fingerprint seen is assumed to be the one
+                already loaded.
+            max_backoff (float): Longest wait, in seconds, before retrying a fingerprint that failed to load.
+        """
+        self.loader = loader
+        self.fingerprint_fn = fingerprint_fn
+        self.load_fn = load_fn
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.fingerprint = None if callable(baseline) else baseline
+        self._baseline_fn = baseline if callable(baseline) else None
+        self._failed_fingerprint = None
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()  # One check at a time
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self._polls = 0
+        self._swaps = 0
+        self._failures = 0
+        self._last_error = None
+        self._last_swap_seconds = None
+
+    def check(self):
+        """
+        Polls once and swaps in the published model if it changed.
+
+        Returns:
+            bool: True if a new model was activated.
+        """
+        with self._lock:
+            self._polls += 1
+            fingerprint = None
+            try:
+                if self.fingerprint is None and self._baseline_fn is not None and self.loader.model is not None:
+                    self.fingerprint = self._baseline_fn()
+                fingerprint = self.fingerprint_fn()
+                if fingerprint is None or fingerprint == self.fingerprint:
+                    return False
+                if self.fingerprint is None and self.loader.model is not None:
+                    self.fingerprint = fingerprint
+                    return False
+                if fingerprint == self._failed_fingerprint and time.monotonic() < self._retry_at:
+                    return False
+
+                started_at = time.perf_counter()
+                logger.info(f"Published model changed ({fingerprint}); loading it beside the active model")
+                model, version = self.load_fn(fingerprint)
+                self.loader.warm(model)
+                self.loader.activate(model, version)
+            except Exception as e:
+                self._failures += 1
+                self._last_error = str(e)
+                if fingerprint is not None:
+                    if fingerprint == self._failed_fingerprint:
+                        self._backoff = min(self._backoff * 2, self.max_backoff)
+                    else:
+                        self._failed_fingerprint = fingerprint
+                        self._backoff = min(self.interval, self.max_backoff)
+                    self._retry_at = time.monotonic() + self._backoff
+                    logger.exception(f"Model watcher failed to swap in {fingerprint}; retrying in {self._backoff:.0f}s: {e}")
+                else:
+                    logger.exception(f"Model watcher failed to poll the published model: {e}")
+                return False
+
+            self.fingerprint = fingerprint
+            self._failed_fingerprint = None
+            self._backoff = 0.0
+            self._swaps += 1
+            self._last_error = None
+            self._last_swap_seconds = time.perf_counter() - started_at
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Nothing to compare against until the initial model has loaded
+            if self.loader.ready:
+                self.check()
+
+    def start(self):
+        """Starts polling in the background."""
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops polling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        """
+        Returns watcher counters.
+
+        Returns:
+            dict: Polls, swaps, failures, last error, current fingerprint, the fingerprint waiting to be
+                retried after a failed load and the duration of the last swap.
+        """
+        return {
+            'fingerprint': self.fingerprint,
+            'failed_fingerprint': self._failed_fingerprint,
+            'retry_in_seconds': round(max(0.0, self._retry_at - time.monotonic()), 1) if self._failed_fingerprint else None,
+            'polls': self._polls,
+            'swaps': self._swaps,
+            'failures': self._failures,
+            'last_error': self._last_error,
+            'last_swap_seconds': round(self._last_swap_seconds, 3) if self._last_swap_seconds is not None else None,
+        }
@@ -0,0 +1,308 @@
+# prediction_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Computes the SHA-256 digest of a seekable binary stream and rewinds it.
+
+    Parameters:
+        stream (file-like): Binary stream positioned at the start of the content.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Returns:
+        str: Hex digest of the stream content.
+    """
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        hasher.update(chunk)
+    stream.seek(0)
+    return hasher.hexdigest()
+
+
+def file_digest(file_path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Computes the SHA-256 digest of a file on disk.
+
+    Parameters:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    with open(file_path, 'rb') as f:
+        return hash_stream(f, chunk_size)
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of formatted predictions with a bounded in-memory LRU
+    tier in front of a persistent on-disk tier.
+
+    Concurrent lookups for the same key while it is being computed share a single
+    computation instead of racing.
+
+    The disk tier may be shared by several processes. Its entries' modification
+    times record when each was last used, so when the total size passes
+    `max_disk_bytes` the directory is rescanned and the least recently used
+    entries of every process are removed until it is back under a low-water mark.
+    Each process only sees the others' writes when it rescans, so the bound is
+    approximate.
+    """
+
+    # Fraction of max_disk_bytes an eviction brings the disk tier down to, so it doesn't rescan on every write
+    DISK_LOW_WATER = 0.9
+
+    def __init__(self, cache_dir, max_memory_entries=1024, max_disk_bytes=None):
+        """
+        Initializes the PredictionCache.
+
+        Parameters:
+            cache_dir (str): Directory holding the on-disk tier. Created if missing.
+            max_memory_entries (int): Maximum number of entries kept in the in-memory tier.
+            max_disk_bytes (int): Total size of the disk tier before least recently used entries are evicted, or None for no bound.
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+        self._disk_evictions = 0
+
+        # Counters
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._shared = 0
+        self._misses = 0
+        self._evictions = 0
+        logger.info(f"Prediction cache initialized with directory: {self.cache_dir}")
+
+    @staticmethod
+    def make_key(content_hash, model_version):
+        """
+        Builds a cache key from the content hash of the audio and the model version.
+
+        Parameters:
+            content_hash (str): Hex digest of the audio bytes.
+            model_version (str): Identifier of the model that produced the prediction.
+
+        Returns:
+            str: Cache key.
+        """
+        return hashlib.sha256(f"{model_version}:{content_hash}".encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return None  # Never written, or evicted by another process
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            return None
+        try:
+            os.utime(path)  # Mark it recently used for eviction
+        except OSError:
+            pass
+        return value
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique across threads and the processes sharing the directory
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+                size = f.tell()
+            os.replace(tmp_path, path)  # Atomic so readers never see a partial entry
+        except OSError as e:
+            logger.warning(f"Failed to persist cache entry {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._disk_lock:
+            self._disk_bytes += size
+            over_budget = self.max_disk_bytes is not None and self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _scan_disk(self):
+        """Lists (last used, size, path) for every entry on disk."""
+        entries = []
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict_disk(self):
+        """Rescans the disk tier and removes least recently used entries until it is under the low-water mark."""
+        with self._disk_lock:
+            entries = sorted(self._scan_disk())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_disk_bytes * self.DISK_LOW_WATER
+            evicted = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Evicted by another process
+                else:
+                    evicted += 1
+                total -= size
+            self._disk_bytes = total
+            self._disk_evictions += evicted
+        logger.info(f"Evicted {evicted} prediction cache entries from disk; {total} bytes remain")
+
+    def _remember(self, key, value):
+        """Inserts into the memory tier. Caller must hold the lock."""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def get(self, key):
+        """
+        Looks up a key in the memory tier, then the disk tier.
+
+        Parameters:
+            key (str): Cache key.
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return self._memory[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._disk_hits += 1
+                self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a JSON-serializable value in both tiers.
+
+        Parameters:
+            key (str): Cache key.
+            value: JSON-serializable value.
+        """
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def get_or_compute(self, key, compute_fn):
+        """
+        Returns the cached value for a key, computing and storing it on a miss.
+        Callers that ask for a key already being computed wait for that computation.
+
+        Parameters:
+            key (str): Cache key.
+            compute_fn (callable): Produces the JSON-serializable value on a miss.
+
+        Returns:
+            tuple: (value, source) where source is 'memory', 'disk', 'shared' or 'computed'.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return self._memory[key], 'memory'
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._shared += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                leader = True
+
+        if not leader:
+            return future.result(), 'shared'
+
+        try:
+            value = self._read_disk(key)
+            if value is not None:
+                source = 'disk'
+                with self._lock:
+                    self._disk_hits += 1
+                    self._remember(key, value)
+            else:
+                source = 'computed'
+                with self._lock:
+                    self._misses += 1
+                value = compute_fn()
+                self.put(key, value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return value, source
+
+    def stats(self):
+        """
+        Returns hit/miss/eviction counters for both tiers.
+
+        Returns:
+            dict: Cache counters and current sizes.
+        """
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._shared + self._misses
+            hits = self._memory_hits + self._disk_hits + self._shared
+            return {
+                'memory_entries': len(self._memory),
+                'max_memory_entries': self.max_memory_entries,
+                'memory_hits': self._memory_hits,
+                'disk_hits': self._disk_hits,
+                'shared': self._shared,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+                'disk_evictions': self._disk_evictions,
+                'in_flight': len(self._in_flight),
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,306 @@
+# preprocess_pool.py
+
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audio_features import (
+    TARGET_HEIGHT, TARGET_WIDTH, compute_spectrogram_db, fit_batch, replicate_channels, split_windows_2d, window_starts
+)
+from audio_ingest import SniffingSpool, decode_for_model
+
+logger = logging.getLogger(__name__)
+
+# Bytes copied at a time when moving an in-memory upload into shared memory
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class _SharedBufferReader(io.RawIOBase):
+    """Seekable binary stream reading a shared memory buffer in place."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self._buffer[self._position:self._position + len(b)]
+        b[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._buffer.release()
+        super().close()
+
+
+def _input_path(source):
+    """Returns a path a worker can open the input by, or None when it only exists in this process's memory."""
+    if isinstance(source, str):
+        return source
+    if isinstance(source, SniffingSpool) and source.path is not None:
+        source.flush()  # The worker reads the file, not this process's write buffer
+        return source.path
+    return None
+
+
+def _stream_size(source):
+    start = source.tell()
+    size = source.seek(0, io.SEEK_END) - start
+    source.seek(start)
+    return size
+
+
+def shared_input_bytes(source):
+    """
+    Returns the bytes PreprocessPool.extract copies into shared memory for an input,
+    so callers can count them against a memory budget.
+
+    Parameters:
+        source (str or file-like): Input as passed to `extract`.
+
+    Returns:
+        int: Size of the in-memory stream, or 0 for inputs handed over by path.
+    """
+    return 0 if _input_path(source) is not None else _stream_size(source)
+
+
+def _extract_windows(source, mode, hop, max_windows, decode_options):
+    """
+    Worker entry point: decodes audio and writes its normalized single-channel
+    float32 windows into a new shared memory block.
+
+    Parameters:
+        source (str or tuple): Path to the audio file, or (shared memory block name, size) of its bytes.
+        mode (str): 'first' for the first 1024 frames, 'full' for overlapping windows over the track.
+        hop (int): Frames between window starts in 'full' mode.
+        max_windows (int): Maximum number of windows in 'full' mode.
+        decode_options (dict): sample_rate, offset and res_type passed to decode_for_model.
+
+    Returns:
+        dict: Shared memory block name, array shape, per-step timings in seconds and
+            seconds of audio decoded.
+    """
+    started_at = time.perf_counter()
+    if isinstance(source, tuple):
+        name, size = source
+        input_block = shared_memory.SharedMemory(name=name)
+        reader = _SharedBufferReader(input_block.buf[:size])
+        try:
+            y, sr = decode_for_model(reader, mode, **decode_options)
+        finally:
+            reader.close()
+            input_block.close()  # The parent process unlinks the input block
+    else:
+        y, sr = decode_for_model(source, mode, **decode_options)
+    decoded_at = time.perf_counter()
+
+    spectrogram_db = compute_spectrogram_db(y, sr)
+    count = len(window_starts(spectrogram_db.shape[1], hop=hop, max_windows=max_windows)) if mode == 'full' else 1
+    shape = (count, TARGET_HEIGHT, TARGET_WIDTH)
+
+    # Windows are normalized straight into the shared block
+    block = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.float32).itemsize)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=block.buf)
+        if mode == 'full':
+            split_windows_2d(spectrogram_db, hop=hop, max_windows=max_windows, out=out)
+        else:
+            fit_batch([spectrogram_db], out=out)
+        del out
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()  # The parent process attaches, copies and unlinks the block
+    finished_at = time.perf_counter()
+
+    return {
+        'shm_name': block.name,
+        'shape': shape,
+        'timings': {
+            'decode': decoded_at - started_at,
+            'features': finished_at - decoded_at,
+        },
+        'audio_seconds': len(y) / sr,
+    }
+
+
+class StageUtilization:
+    """Accumulates busy time for one pipeline stage to report how saturated it is."""
+
+    def __init__(self, name, workers):
+        """
+        Initializes the StageUtilization.
+
+        Parameters:
+            name (str): Stage name used in reports.
+            workers (int): Number of workers serving the stage.
+        """
+        self.name = name
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self._busy = 0.0
+        self._tasks = 0
+        self._in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def end(self, busy_seconds):
+        with self._lock:
+            self._in_flight -= 1
+            self._busy += busy_seconds
+            self._tasks += 1
+
+    def timed(self, fn, *args, **kwargs):
+        """Runs `fn` and records its wall time as busy time for this stage."""
+        self.begin()
+        started_at = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.end(time.perf_counter() - started_at)
+
+    def stats(self):
+        """
+        Returns the stage's task count and utilization.
+
+        Returns:
+            dict: Workers, tasks, in-flight tasks, busy seconds and busy fraction of available worker time.
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at
+            capacity = elapsed * max(self.workers, 1)
+            return {
+                'workers': self.workers,
+                'tasks': self._tasks,
+                'in_flight': self._in_flight,
+                'busy_seconds': round(self._busy, 3),
+                'utilization': round(self._busy / capacity, 4) if capacity > 0 else 0.0,
+            }
+
+
+class PreprocessPool:
+    """
+    Runs decode and feature extraction in separate processes so this CPU work does
+    not compete with TensorFlow inference for the GIL. Results come back through
+    shared memory as compact single-channel float32 windows.
+
+    Inputs are never pickled to the workers: files, including uploads spilled to
+    disk, are passed by path, and uploads still in memory are copied once into a
+    shared memory block the worker decodes from in place.
+    """
+
+    def __init__(self, workers=2, decode_options=None, observer=None):
+        """
+        Initializes the PreprocessPool.
+
+        Parameters:
+            workers (int): Number of worker processes.
+            decode_options (dict): sample_rate, offset and res_type passed to decode_for_model.
+            observer (callable): Optional; called with (timings, audio_seconds) after each extraction.
+        """
+        self.workers = workers
+        self.decode_options = decode_options or {}
+        self.observer = observer
+        # Spawn rather than fork: forking a process that has TensorFlow threads running is unsafe
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.utilization = StageUtilization('preprocess', workers)
+        self._step_lock = threading.Lock()
+        self._step_seconds = {'decode': 0.0, 'features': 0.0}
+        logger.info(f"Preprocess pool started with {workers} worker processes")
+
+    def extract(self, source, mode='first', hop=512, max_windows=None):
+        """
+        Decodes audio in a worker process and returns model-ready windows.
+
+        Parameters:
+            source (str or file-like): Path to the audio file, or a binary stream positioned at its start.
+            mode (str): 'first' for the first 1024 frames, 'full' for overlapping windows over the track.
+            hop (int): Frames between window starts in 'full' mode.
+            max_windows (int): Maximum number of windows in 'full' mode.
+
+        Returns:
+            np.ndarray: Windows with shape (N, 128, 1024, 3).
+        """
+        input_block = None
+        worker_source = _input_path(source)
+        if worker_source is None:
+            size = _stream_size(source)
+            input_block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            copied = 0
+            while copied < size:
+                chunk = source.read(min(COPY_CHUNK_BYTES, size - copied))
+                if not chunk:
+                    break
+                input_block.buf[copied:copied + len(chunk)] = chunk
+                copied += len(chunk)
+            worker_source = (input_block.name, copied)
+
+        self.utilization.begin()
+        busy = 0.0
+        try:
+            result = self._executor.submit(_extract_windows, worker_source, mode, hop, max_windows, self.decode_options).result()
+            busy = sum(result['timings'].values())
+            with self._step_lock:
+                for step, seconds in result['timings'].items():
+                    self._step_seconds[step] += seconds
+        finally:
+            self.utilization.end(busy)
+            if input_block is not None:
+                input_block.close()
+                input_block.unlink()
+        if self.observer is not None:
+            self.observer(result['timings'], result['audio_seconds'])
+
+        block = shared_memory.SharedMemory(name=result['shm_name'])
+        try:
+            windows = np.ndarray(result['shape'], dtype=np.float32, buffer=block.buf)
+            batch = replicate_channels(windows)  # Copies out of the block
+            del windows
+        finally:
+            block.close()
+            block.unlink()
+        return batch
+
+    def shutdown(self, wait=True):
+        """Stops the worker processes."""
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """
+        Returns pool utilization and cumulative time spent per preprocessing step.
+
+        Returns:
+            dict: Utilization counters plus decode/feature seconds.
+        """
+        stats = self.utilization.stats()
+        with self._step_lock:
+            stats['step_seconds'] = {step: round(seconds, 3) for step, seconds in self._step_seconds.items()}
+        return stats
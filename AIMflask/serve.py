@@ -0,0 +1,459 @@
+# serve.py
+
+import argparse
+import functools
+import gc
+import json
+import logging
+import math
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from werkzeug.serving import make_server
+
+from app import Config, create_app, create_model_registry, fetch_model_artifact
+from aim_common.inference_backends import TFLiteModel
+from upload_janitor import UploadJanitor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s [%(process)d]: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Identifier at bytes 4-8 of every TFLite flatbuffer
+TFLITE_FILE_IDENTIFIER = b'TFL3'
+
+# Seconds a worker must stay up before its exit is treated as a crash rather than a restart
+CRASH_WINDOW = 5.0
+
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def read_smaps_rollup(pid):
+    """
+    Reads the memory totals of a process from /proc/<pid>/smaps_rollup.
+
+    Parameters:
+        pid (int): Process id.
+
+    Returns:
+        dict: rss, pss, shared and private bytes, or None if the process is gone or the kernel lacks smaps_rollup.
+    """
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                field, _, rest = line.partition(':')
+                if field in SMAPS_FIELDS:
+                    values[field] = int(rest.split()[0]) * 1024
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'shared': values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0),
+        'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def memory_report(parent_pid, worker_pids):
+    """
+    Summarizes how much memory the workers share with the parent and each other.
+
+    RSS counts every resident page a worker maps; PSS divides shared pages among
+    the processes mapping them. Their difference summed over the workers is the
+    memory N separately started processes would have needed on top of what the
+    pre-forked ones use.
+
+    Parameters:
+        parent_pid (int): Pid of the supervising process.
+        worker_pids (list): Pids of the ready workers.
+
+    Returns:
+        dict: Per-process figures, worker totals and the bytes saved by sharing.
+    """
+    workers = {}
+    for pid in worker_pids:
+        usage = read_smaps_rollup(pid)
+        if usage is not None:
+            workers[pid] = usage
+    total_rss = sum(usage['rss'] for usage in workers.values())
+    total_pss = sum(usage['pss'] for usage in workers.values())
+    return {
+        'parent': read_smaps_rollup(parent_pid),
+        'workers': workers,
+        'worker_rss_bytes': total_rss,
+        'worker_pss_bytes': total_pss,
+        'saved_bytes': total_rss - total_pss,
+        'saved_bytes_per_worker': (total_rss - total_pss) // len(workers) if workers else 0,
+    }
+
+
+def describe_exit(status):
+    """
+    Describes a wait status from os.waitpid.
+    """
+    if os.WIFSIGNALED(status):
+        return f"was killed by signal {os.WTERMSIG(status)}"
+    if os.WIFEXITED(status):
+        return f"exited with status {os.WEXITSTATUS(status)}"
+    return f"stopped with wait status {status}"
+
+
+def parse_overrides(pairs):
+    """
+    Parses KEY=VALUE settings, reading each value as JSON and falling back to a plain string.
+    """
+    overrides = {}
+    for pair in pairs:
+        key, separator, value = pair.partition('=')
+        if not separator:
+            raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got {pair}")
+        try:
+            overrides[key] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key] = value
+    return overrides
+
+
+class PreforkServer:
+    """
+    Serves the app from several worker processes forked after the model artifact
+    has been fetched once. With the TFLite backend, the flatbuffer is read into
+    memory in the parent, and each worker's interpreter runs on that buffer in
+    place, so the weights stay in pages shared copy-on-write by every worker.
+    Workers accept connections from one listening socket created by the parent,
+    which restarts workers that exit and forwards SIGTERM/SIGINT to them.
+
+    Background job records are shared through JOBS_DIR so any worker can report
+    on any job. State that lives in one process cannot be shared that way: the
+    embedding index is refused with more than one worker, and so is
+    /admin/model/rollback. The download cache is turned off, the upload and
+    preview janitors run once in the parent instead of in every worker, cached
+    predictions are shared through the disk tier only, and the admission limits
+    are divided among the workers so the host as a whole keeps to them. Workers
+    publish their metrics and stats to METRICS_DIR, so /metrics and /stats on any
+    worker report all of them.
+
+    The memory saving applies only to the TFLite backend. TensorFlow's runtime
+    does not survive a fork, so with the Keras backend nothing is loaded or
+    warmed before forking: each worker loads its own copy of the weights from
+    the artifact the parent fetched, and only the Python code is shared. Use
+    INFERENCE_BACKEND=tflite to serve several workers from one copy.
+    """
+
+    def __init__(self, host, port, workers, config=None, threads_per_worker=None, inter_op_threads=1,
+                 report_path=None, ready_timeout=600):
+        """
+        Initializes the PreforkServer.
+
+        Parameters:
+            host (str): Interface to listen on.
+            port (int): Port to listen on.
+            workers (int): Worker processes.
+            config (dict): Settings applied on top of Config in every worker.
+            threads_per_worker (int): Compute threads per worker (cores divided among the workers when None).
+            inter_op_threads (int): TensorFlow ops run concurrently per worker.
+            report_path (str): Optional file the memory report is written to as JSON.
+            ready_timeout (float): Seconds to wait for the workers' models before reporting memory anyway.
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.config = dict(config or {})
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.inter_op_threads = inter_op_threads
+        self.report_path = report_path
+        self.ready_timeout = ready_timeout
+
+        self._overrides = set(self.config)
+        self._janitors = []
+        self._listener = None
+        self._model_factory = None
+        self._backend = None
+        self._children = {}  # pid -> start time
+        self._ready = set()
+        self._ready_reader = None
+        self._ready_writer = None
+        self._stopping = False
+        self._report_requested = False
+        self._restarts = 0
+
+    def settings(self):
+        """Returns Config with the server's overrides applied, as the workers will see it."""
+        settings = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+        settings.update(self.config)
+        return settings
+
+    def prepare(self):
+        """
+        Fetches the model artifact once and, for the TFLite backend, reads it into the
+        buffer the workers will share; Keras workers load the fetched artifact themselves.
+        Runs in the parent before any worker is forked.
+        """
+        self.config['SERVING_WORKERS'] = self.workers
+        settings = self.settings()
+        # Workers on a shared core budget; a preprocessing pool per worker would oversubscribe it
+        self.config.setdefault('PREPROCESS_WORKERS', 0)
+        self.config.setdefault('TFLITE_NUM_THREADS', self.threads_per_worker)
+        # Refuse before forking rather than have every worker fail the same way
+        if settings['EMBEDDING_INDEX'] and self.workers > 1:
+            raise ValueError("EMBEDDING_INDEX keeps its index in one process; serve it with --workers 1")
+        if self.workers > 1:
+            self._share_between_workers(settings)
+
+        model_registry = create_model_registry(settings) if settings['MODEL_REGISTRY'] else None
+        model_path, version = fetch_model_artifact(settings, model_registry=model_registry)
+        self.config['MODEL_VERSION'] = version
+        self._backend = settings['INFERENCE_BACKEND']
+
+        if settings['INFERENCE_BACKEND'] == 'tflite':
+            with open(model_path, 'rb') as f:
+                model_content = f.read()
+            if model_content[4:8] != TFLITE_FILE_IDENTIFIER:
+                raise ValueError(f"{model_path} is not a TFLite flatbuffer")
+            # Default delegates would repack the weights into private memory in every worker
+            self._model_factory = functools.partial(
+                TFLiteModel,
+                model_content=model_content,
+                num_threads=self.config['TFLITE_NUM_THREADS'],
+                default_delegates=False
+            )
+            if settings['MODEL_WATCH']:
+                logger.warning("MODEL_WATCH is ignored for the shared TFLite model; restart the server to serve a new version")
+            logger.info(f"Read TFLite model {version} ({len(model_content)} bytes) to share across {self.workers} workers")
+        else:
+            logger.info(f"Fetched model {version} to {model_path}; each worker loads it into its own TensorFlow runtime")
+            if self.workers > 1:
+                logger.warning(
+                    f"The {self._backend} backend loads a private copy of the weights in each of the {self.workers} workers; "
+                    f"set INFERENCE_BACKEND=tflite to share one copy"
+                )
+
+    def _share_between_workers(self, settings):
+        """
+        Adjusts the settings whose state each worker would otherwise keep to itself over the shared directories.
+        """
+        if settings['DOWNLOAD_CACHE']:
+            if 'DOWNLOAD_CACHE' in self._overrides:
+                raise ValueError("DOWNLOAD_CACHE keeps its index in one process; serve it with --workers 1")
+            # Workers would evict downloads other workers have pinned
+            self.config['DOWNLOAD_CACHE'] = False
+            logger.info("Download cache disabled: its index and pins can't be shared between workers")
+        if settings['UPLOAD_JANITOR']:
+            self.config['UPLOAD_JANITOR'] = False
+            self._janitors = self._create_janitors(settings)
+        # Snapshots of a previous server's workers, whose pids may since have been reused
+        metrics_dir = os.path.abspath(settings['METRICS_DIR'])
+        if os.path.isdir(metrics_dir):
+            for name in os.listdir(metrics_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(metrics_dir, name))
+        # The disk tier is shared; a memory tier per worker would only multiply its footprint
+        self.config.setdefault('PREDICTION_CACHE_MAX_ENTRIES', 0)
+        # Admission is enforced per process, so each worker gets its share of the host's limits
+        if settings['ADMISSION_MEMORY_BUDGET'] is not None:
+            self.config.setdefault('ADMISSION_MEMORY_BUDGET', settings['ADMISSION_MEMORY_BUDGET'] // self.workers)
+        self.config.setdefault('ADMISSION_LIMITS', {
+            stage: tuple(None if limit is None else max(1, math.ceil(limit / self.workers)) for limit in limits)
+            for stage, limits in settings['ADMISSION_LIMITS'].items()
+        })
+
+    def _create_janitors(self, settings):
+        """
+        Creates one janitor per shared directory for the parent to run. Workers can't report the files
+        they add or read, so each sweep rescans the directory and ages files by their access times.
+        """
+        directories = [(settings['UPLOADED_AUDIO_DEST'], settings['UPLOAD_MAX_BYTES'])]
+        if settings['PREVIEW_RENDITIONS']:
+            directories.append((settings['PREVIEW_DIR'], settings['PREVIEW_MAX_BYTES']))
+        janitors = []
+        for directory, max_bytes in directories:
+            directory = os.path.abspath(directory)
+            os.makedirs(directory, exist_ok=True)
+            janitors.append(UploadJanitor(
+                directory,
+                max_age=settings['UPLOAD_MAX_AGE'],
+                max_bytes=max_bytes,
+                interval=settings['UPLOAD_JANITOR_INTERVAL'],
+                reconcile_interval=0
+            ))
+        return janitors
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.monotonic()
+            return pid
+        code = 1
+        try:
+            self._run_worker()
+            code = 0
+        except BaseException:
+            logger.exception("Worker failed")
+        finally:
+            # Skip the parent's atexit handlers and buffered state
+            os._exit(code)
+
+    def _run_worker(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent forwards Ctrl-C as SIGTERM
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        os.close(self._ready_reader)
+
+        # Match TensorFlow's pools to this worker's share of the cores
+        os.environ['OMP_NUM_THREADS'] = str(self.threads_per_worker)
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.threads_per_worker)
+            tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set TensorFlow thread counts: {e}")
+
+        app = create_app(self.config, model_factory=self._model_factory)
+        server = make_server(self.host, self.port, app, threaded=True, fd=self._listener.fileno())
+
+        def report_ready():
+            if app.extensions['model_loader'].wait():
+                os.write(self._ready_writer, f"{os.getpid()}\n".encode())
+        threading.Thread(target=report_ready, name='worker-ready', daemon=True).start()
+
+        # shutdown() waits for serve_forever to return, so it can't run in the handler itself
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        logger.info(f"Worker serving on {self.host}:{self.port} with {self.threads_per_worker} compute threads")
+        server.serve_forever()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_report(self, signum, frame):
+        self._report_requested = True
+
+    def report(self):
+        """
+        Logs the memory the workers share and optionally writes the full report.
+
+        Returns:
+            dict: The memory report.
+        """
+        report = memory_report(os.getpid(), sorted(self._ready))
+        report['restarts'] = self._restarts
+        report['inference_backend'] = self._backend
+        # Only the TFLite flatbuffer is shared; Keras workers each hold their own weights
+        report['shared_model_weights'] = self._model_factory is not None
+        mib = 1024 * 1024
+        logger.info(
+            f"{len(report['workers'])} workers: RSS {report['worker_rss_bytes'] / mib:.1f} MiB, "
+            f"PSS {report['worker_pss_bytes'] / mib:.1f} MiB; sharing saves "
+            f"{report['saved_bytes'] / mib:.1f} MiB ({report['saved_bytes_per_worker'] / mib:.1f} MiB per worker)"
+            + ("" if report['shared_model_weights'] else f"; model weights are not shared with the {self._backend} backend")
+        )
+        if self.report_path:
+            with open(self.report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def _read_ready(self):
+        for line in os.read(self._ready_reader, 4096).decode().split():
+            pid = int(line)
+            if pid in self._children:
+                self._ready.add(pid)
+
+    def _reap(self):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started_at = self._children.pop(pid, None)
+            self._ready.discard(pid)
+            if started_at is None or self._stopping:
+                continue
+            logger.warning(f"Worker {pid} {describe_exit(status)}; starting a replacement")
+            if time.monotonic() - started_at < CRASH_WINDOW:
+                time.sleep(1)  # Don't spin on a worker that fails on startup
+            self._restarts += 1
+            self._spawn()
+
+    def serve(self):
+        """Fetches the model, forks the workers and supervises them until SIGTERM or SIGINT."""
+        self._listener = socket.create_server((self.host, self.port), backlog=1024)
+        self.prepare()
+        self._ready_reader, self._ready_writer = os.pipe()
+
+        # Keep the collector from touching, and so copying, every object the parent loaded
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        # The parent keeps the shared directories bounded for every worker
+        for janitor in self._janitors:
+            janitor.start()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGUSR1, self._handle_report)
+        logger.info(f"Started {self.workers} workers on {self.host}:{self.port}; SIGUSR1 reports their memory")
+
+        started_at = time.monotonic()
+        reported = False
+        while not self._stopping:
+            try:
+                readable, _, _ = select.select([self._ready_reader], [], [], 1.0)
+            except InterruptedError:
+                readable = []
+            if readable:
+                self._read_ready()
+            self._reap()
+
+            all_ready = self._ready and len(self._ready) == len(self._children) == self.workers
+            timed_out = time.monotonic() - started_at > self.ready_timeout
+            if (not reported and (all_ready or timed_out)) or self._report_requested:
+                self.report()
+                reported = True
+                self._report_requested = False
+
+        logger.info("Stopping workers")
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self._children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        for janitor in self._janitors:
+            janitor.stop()
+        self._listener.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the app from pre-forked workers sharing one copy of the model")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads-per-worker', type=int, default=None, help="Compute threads per worker (cores / workers by default)")
+    parser.add_argument('--inter-op-threads', type=int, default=1)
+    parser.add_argument('--memory-report', default=None, help="Write the memory report to this JSON file")
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='KEY=VALUE',
+                        help="Config setting for every worker; VALUE is read as JSON when possible")
+    args = parser.parse_args()
+
+    PreforkServer(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        config=parse_overrides(args.overrides),
+        threads_per_worker=args.threads_per_worker,
+        inter_op_threads=args.inter_op_threads,
+        report_path=args.memory_report
+    ).serve()
@@ -0,0 +1,178 @@
+# spectrogram_ingest.py
+
+import io
+import logging
+import struct
+import zipfile
+import zlib
+
+import numpy as np
+
+from audio_features import TARGET_HEIGHT
+
+logger = logging.getLogger(__name__)
+
+NPY_MAGIC = b'\x93NUMPY'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# numpy refuses headers above 10000 bytes unless asked to, so this always covers the whole header
+NPY_HEADER_MAX_BYTES = 16 * 1024
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')  # Signature, then file name and extra field lengths
+
+# Widest floating point dtype parse_npy accepts, used to bound the size of a valid member
+MAX_FLOAT_ITEMSIZE = np.dtype(np.longdouble).itemsize
+
+
+class SpectrogramPayloadError(ValueError):
+    """Raised when a .npy/.npz payload cannot be read or does not hold valid spectrograms."""
+
+
+def parse_npy(buffer, name='array'):
+    """
+    Reads a .npy payload as an array viewing the buffer, without copying the data.
+
+    Parameters:
+        buffer (bytes or memoryview): The .npy content.
+        name (str): Label used in error messages.
+
+    Returns:
+        np.ndarray: Read-only array backed by `buffer`.
+    """
+    view = memoryview(buffer)
+    if bytes(view[:len(NPY_MAGIC)]) != NPY_MAGIC:
+        raise SpectrogramPayloadError(f"{name} is not a .npy array")
+
+    header = io.BytesIO(bytes(view[:NPY_HEADER_MAX_BYTES]))
+    try:
+        version = np.lib.format.read_magic(header)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+        else:
+            raise SpectrogramPayloadError(f"{name} uses unsupported .npy format version {version}")
+    except ValueError as e:
+        raise SpectrogramPayloadError(f"{name} has an invalid .npy header: {e}") from e
+
+    # Object arrays would need unpickling, which is never done for request data
+    if dtype.hasobject or dtype.kind != 'f':
+        raise SpectrogramPayloadError(f"{name} must hold floating point values, got dtype {dtype}")
+
+    count = int(np.prod(shape))
+    offset = header.tell()
+    if len(view) - offset < count * dtype.itemsize:
+        raise SpectrogramPayloadError(f"{name} is truncated: expected {count * dtype.itemsize} data bytes")
+    array = np.frombuffer(view, dtype=dtype, count=count, offset=offset)
+    if fortran_order:
+        return array.reshape(shape[::-1]).T
+    return array.reshape(shape)
+
+
+def _stored_member(view, info):
+    """Returns the bytes of an uncompressed zip member as a slice of the archive buffer."""
+    signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack_from(view, info.header_offset)
+    if signature != ZIP_MAGIC:
+        raise SpectrogramPayloadError(f"Corrupt .npz member {info.filename}")
+    start = info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+    return view[start:start + info.file_size]
+
+
+def parse_npz(buffer, max_members=None, max_data_bytes=None):
+    """
+    Reads the arrays of a .npz payload. Members written by `np.savez` are stored
+    uncompressed and are viewed in place; members of `np.savez_compressed` are
+    inflated once.
+
+    The member count and the uncompressed sizes the archive declares are checked
+    before anything is inflated, and inflating stops at the declared size, so a
+    small compressed payload cannot expand into an arbitrarily large allocation.
+
+    Parameters:
+        buffer (bytes): The .npz content.
+        max_members (int): Most members accepted, or None for no limit.
+        max_data_bytes (int): Most uncompressed bytes accepted across all members, or None for no limit.
+
+    Returns:
+        list: (name, array) for each member, in archive order.
+    """
+    view = memoryview(buffer)
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(buffer))
+        infos = archive.infolist()
+    except zipfile.BadZipFile as e:
+        raise SpectrogramPayloadError(f"Invalid .npz archive: {e}") from e
+
+    if max_members is not None and len(infos) > max_members:
+        raise SpectrogramPayloadError(f".npz archive holds {len(infos)} arrays, more than {max_members}")
+    declared_bytes = sum(info.file_size for info in infos)
+    if max_data_bytes is not None and declared_bytes > max_data_bytes:
+        raise SpectrogramPayloadError(
+            f".npz archive expands to {declared_bytes} bytes, more than the {max_data_bytes} its spectrograms may use"
+        )
+
+    arrays = []
+    for info in infos:
+        name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+        if info.compress_type == zipfile.ZIP_STORED:
+            data = _stored_member(view, info)
+        else:
+            try:
+                # The declared size was checked above; never inflate past it
+                with archive.open(info) as member:
+                    data = member.read(info.file_size)
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError) as e:
+                raise SpectrogramPayloadError(f"Corrupt .npz member {info.filename}: {e}") from e
+        arrays.append((name, parse_npy(data, name)))
+    return arrays
+
+
+def load_spectrograms(buffer, max_arrays, max_frames):
+    """
+    Reads and validates the spectrograms in a .npy or .npz payload. A 2-D array
+    of shape (128, frames) is one spectrogram; a 3-D array of shape
+    (N, 128, frames) is a batch of N.
+
+    Parameters:
+        buffer (bytes): Request body holding a .npy or .npz payload.
+        max_arrays (int): Maximum number of spectrograms in the payload.
+        max_frames (int): Maximum number of frames per spectrogram.
+
+    Returns:
+        list: (name, spectrogram) for each spectrogram, each of shape (128, frames) and viewing `buffer`.
+    """
+    head = bytes(buffer[:len(NPY_MAGIC)])
+    if head.startswith(NPY_MAGIC):
+        members = [('array', parse_npy(buffer))]
+    elif head.startswith(ZIP_MAGIC):
+        # Every member holds at least one spectrogram of at most max_frames frames
+        spectrogram_bytes = TARGET_HEIGHT * max_frames * MAX_FLOAT_ITEMSIZE
+        members = parse_npz(
+            buffer, max_members=max_arrays, max_data_bytes=max_arrays * (spectrogram_bytes + NPY_HEADER_MAX_BYTES)
+        )
+    else:
+        raise SpectrogramPayloadError("Payload is neither a .npy nor a .npz file")
+
+    spectrograms = []
+    for name, array in members:
+        if array.ndim == 2:
+            batch = [(name, array)]
+        elif array.ndim == 3:
+            batch = [(f"{name}[{index}]", array[index]) for index in range(array.shape[0])]
+        else:
+            raise SpectrogramPayloadError(f"{name} must have shape (128, frames) or (N, 128, frames), got {array.shape}")
+        for spectrogram_name, spectrogram in batch:
+            height, frames = spectrogram.shape
+            if height != TARGET_HEIGHT:
+                raise SpectrogramPayloadError(f"{spectrogram_name} must have {TARGET_HEIGHT} mel bins, got {height}")
+            if not 0 < frames <= max_frames:
+                raise SpectrogramPayloadError(f"{spectrogram_name} must have between 1 and {max_frames} frames, got {frames}")
+            if not np.isfinite(spectrogram).all():
+                raise SpectrogramPayloadError(f"{spectrogram_name} contains NaN or infinite values")
+        spectrograms.extend(batch)
+        if len(spectrograms) > max_arrays:
+            raise SpectrogramPayloadError(f"Payload holds more than {max_arrays} spectrograms")
+
+    if not spectrograms:
+        raise SpectrogramPayloadError("Payload holds no spectrograms")
+    logger.debug(f"Read {len(spectrograms)} spectrograms from a {len(buffer)} byte payload")
+    return spectrograms
@@ -0,0 +1,221 @@
+# upload_janitor.py
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJanitor:
+    """
+    Keeps the upload directory bounded: files unused for longer than `max_age`
+    are deleted, and the least recently used files are evicted whenever the
+    directory exceeds `max_bytes`.
+
+    Sizes and access times live in an in-memory index that the app updates as it
+    saves, serves and deletes files, so sweeps never rescan the directory. The
+    index is built from disk once at startup; periodic rebuilds, to pick up files
+    written behind the app's back, are opt-in through `reconcile_interval`.
+    """
+
+    def __init__(self, directory, max_age=24 * 3600, max_bytes=5 * 1024 ** 3, interval=60,
+                 reconcile_interval=None, exclude_prefixes=()):
+        """
+        Initializes the UploadJanitor.
+
+        Parameters:
+            directory (str): Directory to keep bounded.
+            max_age (float): Seconds since last access before a file is deleted.
+            max_bytes (int): Total size of indexed files before the least recently used are evicted.
+            interval (float): Seconds between sweeps.
+            reconcile_interval (float): Seconds between rebuilds of the index from disk, or None to only build it at startup.
+            exclude_prefixes (tuple): Filename prefixes of files managed elsewhere, e.g. the download cache.
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # name -> [bytes, last access]; least recently used first
+        self._bytes = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_reconcile = 0.0
+
+        # Counters
+        self._expired = 0
+        self._evicted = 0
+        self._bytes_freed = 0
+        self._sweeps = 0
+        self._last_sweep_seconds = None
+
+        self.reconcile()
+
+    def _managed(self, name):
+        return not name.startswith(self.exclude_prefixes) and not name.startswith('.')
+
+    def reconcile(self):
+        """Rebuilds the index from the files currently in the directory."""
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and self._managed(entry.name):
+                    stat = entry.stat()
+                    found.append((max(stat.st_atime, stat.st_mtime), entry.name, stat.st_size))
+        with self._lock:
+            # Access times recorded in memory are more accurate than atime on noatime mounts
+            merged = sorted(
+                (max(accessed_at, self._index[name][1]) if name in self._index else accessed_at, name, size)
+                for accessed_at, name, size in found
+            )
+            self._index = OrderedDict((name, [size, accessed_at]) for accessed_at, name, size in merged)
+            self._bytes = sum(size for _, _, size in merged)
+            self._last_reconcile = time.monotonic()
+        logger.info(f"Upload janitor indexed {len(merged)} files ({self._bytes} bytes) in {self.directory}")
+
+    def add(self, name):
+        """
+        Records a file newly written to the directory.
+
+        Parameters:
+            name (str): Filename within the directory.
+        """
+        if not self._managed(name):
+            return
+        try:
+            size = os.path.getsize(os.path.join(self.directory, name))
+        except OSError:
+            return
+        with self._lock:
+            if name in self._index:
+                self._bytes -= self._index[name][0]
+            self._index[name] = [size, time.time()]
+            self._index.move_to_end(name)
+            self._bytes += size
+            over_quota = self._bytes > self.max_bytes
+        if over_quota:
+            self._wake.set()
+
+    def touch(self, name):
+        """
+        Marks a file as recently used.
+
+        Parameters:
+            name (str): Filename within the directory.
+        """
+        with self._lock:
+            if name in self._index:
+                self._index[name][1] = time.time()
+                self._index.move_to_end(name)
+
+    def discard(self, name):
+        """
+        Forgets a file deleted by someone else.
+
+        Parameters:
+            name (str): Filename within the directory.
+        """
+        with self._lock:
+            entry = self._index.pop(name, None)
+            if entry is not None:
+                self._bytes -= entry[0]
+
+    def _select_victims(self):
+        """Picks expired files, then least recently used files over the quota. Caller must hold the lock."""
+        now = time.time()
+        expired = [name for name, (_, accessed_at) in self._index.items() if now - accessed_at > self.max_age]
+        remaining = self._bytes - sum(self._index[name][0] for name in expired)
+        expired_names = set(expired)
+        evicted = []
+        for name, (size, _) in self._index.items():
+            if remaining <= self.max_bytes:
+                break
+            if name not in expired_names:
+                evicted.append(name)
+                remaining -= size
+        return expired, evicted
+
+    def sweep(self):
+        """
+        Deletes expired files and evicts least recently used ones until under the quota.
+
+        Returns:
+            int: Number of files deleted.
+        """
+        started_at = time.perf_counter()
+        with self._lock:
+            expired, evicted = self._select_victims()
+            victims = [(name, self._index.pop(name)[0]) for name in expired + evicted]
+            self._bytes -= sum(size for _, size in victims)
+
+        freed = 0
+        for name, size in victims:
+            try:
+                os.remove(os.path.join(self.directory, name))
+                freed += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Upload janitor failed to remove {name}: {e}")
+        if victims:
+            logger.info(f"Upload janitor removed {len(expired)} expired and {len(evicted)} evicted files ({freed} bytes)")
+
+        with self._lock:
+            self._expired += len(expired)
+            self._evicted += len(evicted)
+            self._bytes_freed += freed
+            self._sweeps += 1
+            self._last_sweep_seconds = time.perf_counter() - started_at
+        return len(victims)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                if self.reconcile_interval is not None and time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+                    self.reconcile()
+                self.sweep()
+            except Exception as e:
+                logger.exception(f"Upload janitor sweep failed: {e}")
+
+    def start(self):
+        """Starts sweeping in the background."""
+        self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background sweeps."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        """
+        Returns index size and cleanup counters.
+
+        Returns:
+            dict: Indexed files and bytes, limits, files expired and evicted, bytes freed and sweep timing.
+        """
+        with self._lock:
+            return {
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'expired': self._expired,
+                'evicted': self._evicted,
+                'bytes_freed': self._bytes_freed,
+                'sweeps': self._sweeps,
+                'last_sweep_ms': round(self._last_sweep_seconds * 1000, 2) if self._last_sweep_seconds is not None else None,
+            }
@@ -0,0 +1 @@
+"""Modules shared by the serving app (AIMflask) and the training scripts (src)."""
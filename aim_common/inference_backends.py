@@ -0,0 +1,97 @@
+# inference_backends.py
+
+import logging
+import threading
+
+import numpy as np
+
+try:
+    # The standalone runtime is much smaller than full TensorFlow on CPU-only nodes
+    from tflite_runtime.interpreter import Interpreter, OpResolverType
+except ImportError:
+    from tensorflow.lite import Interpreter
+    from tensorflow.lite.experimental import OpResolverType
+
+logger = logging.getLogger(__name__)
+
+
+class TFLiteModel:
+    """
+    Runs an exported TFLite flatbuffer behind the same `predict` interface as a
+    Keras model, so it can be swapped in for CPU serving.
+
+    Float, float16 and dynamic-range models take float32 input directly; full-int8
+    models with integer input/output are quantized and dequantized here.
+    """
+
+    def __init__(self, model_path=None, num_threads=None, model_content=None, default_delegates=True):
+        """
+        Initializes the TFLiteModel.
+
+        Parameters:
+            model_path (str): Path to the .tflite flatbuffer.
+            num_threads (int): Interpreter threads, or None for the runtime default.
+            model_content (bytes): The flatbuffer itself, instead of `model_path`. The interpreter reads
+                constant tensors from this buffer in place, so interpreters in forked processes share it.
+            default_delegates (bool): Apply the runtime's default delegate (XNNPACK). It repacks weights into
+                private memory, so it is turned off when the weights should stay in a shared buffer.
+        """
+        self.model_path = model_path or '<buffer>'
+        options = {} if default_delegates else {
+            'experimental_op_resolver_type': OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        }
+        self._interpreter = Interpreter(
+            model_path=model_path, model_content=model_content, num_threads=num_threads, **options
+        )
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()  # The interpreter is not safe for concurrent invokes
+        logger.info(
+            f"Loaded TFLite model from {self.model_path} (input {self._input['dtype'].__name__}, "
+            f"output {self._output['dtype'].__name__})"
+        )
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        self._interpreter.resize_tensor_input(
+            self._input['index'], [batch_size, *self._input['shape'][1:]], strict=False
+        )
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def _quantize_input(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize_output(self, output):
+        if self._output['dtype'] == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=0):
+        """
+        Runs a batch through the interpreter.
+
+        Parameters:
+            batch (np.ndarray): Inputs of shape (N, 128, 1024, 3).
+            verbose (int): Accepted for compatibility with Keras `predict`; ignored.
+
+        Returns:
+            np.ndarray: Class probabilities of shape (N, classes).
+        """
+        with self._lock:
+            self._resize(len(batch))
+            self._interpreter.set_tensor(self._input['index'], self._quantize_input(batch))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])
+        return self._dequantize_output(output)
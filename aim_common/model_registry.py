@@ -0,0 +1,489 @@
+# model_registry.py
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024  # S3 requires at least 5 MB for every part but the last
+LATEST = 'latest'
+
+
+class RegistryError(Exception):
+    """Raised when a model version is missing or an artifact fails verification."""
+
+
+class S3Store:
+    """
+    Object storage backed by an S3 bucket. Works with boto3 clients and moto-style stand-ins.
+    """
+
+    def __init__(self, s3_client, bucket):
+        """
+        Initializes the S3Store.
+
+        Parameters:
+            s3_client (boto3.client): AWS S3 client.
+            bucket (str): Bucket name.
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def size(self, key):
+        """Returns the size of an object, or None if it does not exist."""
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def get(self, key):
+        """Returns the content of an object, or None if it does not exist."""
+        try:
+            return self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def get_range(self, key, start, end):
+        """Returns bytes [start, end) of an object."""
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+        return response['Body'].read()
+
+    def put(self, key, data):
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def copy(self, source_key, key):
+        # Managed copy, so objects over the 5 GB single-request limit are copied in parts server-side
+        self.s3_client.copy({'Bucket': self.bucket, 'Key': source_key}, self.bucket, key)
+
+    def find_multipart(self, key):
+        """Returns the id of an unfinished multipart upload of `key`, or None."""
+        response = self.s3_client.list_multipart_uploads(Bucket=self.bucket, Prefix=key)
+        uploads = [upload for upload in response.get('Uploads', []) if upload['Key'] == key]
+        if not uploads:
+            return None
+        return max(uploads, key=lambda upload: upload['Initiated'])['UploadId']
+
+    def list_parts(self, key, upload_id):
+        """Returns {part number: ETag} for the parts already uploaded."""
+        parts = {}
+        paginator = self.s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                parts[part['PartNumber']] = part['ETag']
+        return parts
+
+    def create_multipart(self, key):
+        return self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key, upload_id, part_number, data):
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+        )
+        return response['ETag']
+
+    def complete_multipart(self, key, upload_id, etags):
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': n, 'ETag': etags[n]} for n in sorted(etags)]}
+        )
+
+
+class LocalStore:
+    """
+    Object storage in a local directory with the same interface as S3Store,
+    for development, tests and shared network filesystems.
+    """
+
+    def __init__(self, root):
+        """
+        Initializes the LocalStore.
+
+        Parameters:
+            root (str): Directory holding the objects. Created if missing.
+        """
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def _multipart_dir(self, key):
+        return os.path.join(self.root, '.multipart', hashlib.sha256(key.encode()).hexdigest()[:32])
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_range(self, key, start, end):
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def put(self, key, data):
+        self._write(self._path(key), data)
+
+    def copy(self, source_key, key):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(self._path(source_key), tmp_path)
+        os.replace(tmp_path, path)
+
+    def find_multipart(self, key):
+        directory = self._multipart_dir(key)
+        if not os.path.isdir(directory):
+            return None
+        uploads = sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime)
+        return uploads[-1].name if uploads else None
+
+    def list_parts(self, key, upload_id):
+        parts = {}
+        directory = os.path.join(self._multipart_dir(key), upload_id)
+        for name in os.listdir(directory):
+            if name.isdigit():
+                with open(os.path.join(directory, name), 'rb') as f:
+                    parts[int(name)] = f'"{hashlib.md5(f.read()).hexdigest()}"'
+        return parts
+
+    def create_multipart(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self._multipart_dir(key), upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        self._write(os.path.join(self._multipart_dir(key), upload_id, str(part_number)), data)
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def complete_multipart(self, key, upload_id, etags):
+        directory = os.path.join(self._multipart_dir(key), upload_id)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as out:
+            for part_number in sorted(etags):
+                with open(os.path.join(directory, str(part_number)), 'rb') as part:
+                    shutil.copyfileobj(part, out)
+        os.replace(tmp_path, path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _part_ranges(size, part_size):
+    """Returns (part number, start, end) for each part of a file; part numbers start at 1 as in S3."""
+    return [(index + 1, start, min(start + part_size, size)) for index, start in enumerate(range(0, size, part_size))]
+
+
+def digest_parts(path, part_size):
+    """
+    Computes the SHA-256 digest of a file and of each of its parts in one pass.
+
+    Parameters:
+        path (str): Path to the file.
+        part_size (int): Bytes per part.
+
+    Returns:
+        tuple: (file digest, list of part digests)
+    """
+    file_hash = hashlib.sha256()
+    part_digests = []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(part_size)
+            if not chunk:
+                break
+            file_hash.update(chunk)
+            part_digests.append(hashlib.sha256(chunk).hexdigest())
+    return file_hash.hexdigest(), part_digests
+
+
+class ModelRegistry:
+    """
+    Versioned model artifacts in object storage.
+
+    Artifacts are stored once under their SHA-256 digest, so republishing an
+    unchanged model uploads nothing. Each version has a JSON manifest with the
+    artifact digest and per-part digests; `latest` points at the newest version.
+
+    Uploads and downloads move parts in parallel. An interrupted upload resumes
+    from the parts already in storage, and an interrupted download from the parts
+    already in the local cache. The cache directory may be shared by several
+    processes: a file lock makes sure each artifact is downloaded once.
+    """
+
+    def __init__(self, store, prefix='', cache_dir=None, part_size=DEFAULT_PART_SIZE, workers=8):
+        """
+        Initializes the ModelRegistry.
+
+        Parameters:
+            store (S3Store or LocalStore): Where manifests and artifacts live.
+            prefix (str): Key prefix of the registry within the store.
+            cache_dir (str): Local directory for downloaded artifacts. Required for `fetch`.
+            part_size (int): Bytes per uploaded or downloaded part.
+            workers (int): Parts transferred at once.
+        """
+        self.store = store
+        self.prefix = prefix.strip('/')
+        self.cache_dir = cache_dir
+        self.part_size = part_size
+        self.workers = workers
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+
+        # Counters
+        self._published = 0
+        self._deduplicated = 0
+        self._parts_uploaded = 0
+        self._parts_resumed = 0
+        self._bytes_uploaded = 0
+        self._cache_hits = 0
+        self._downloads = 0
+        self._parts_downloaded = 0
+        self._parts_reused = 0
+        self._bytes_downloaded = 0
+
+    def _key(self, *parts):
+        return '/'.join(part for part in (self.prefix, *parts) if part)
+
+    def blob_key(self, digest):
+        return self._key('blobs', 'sha256', digest)
+
+    def _manifest_key(self, name, version):
+        return self._key('manifests', name, f"{version}.json")
+
+    def _count(self, **increments):
+        with self._lock:
+            for counter, value in increments.items():
+                setattr(self, f"_{counter}", getattr(self, f"_{counter}") + value)
+
+    def publish(self, path, name, version=None, metadata=None, set_latest=True):
+        """
+        Uploads a model file and records it as a new version.
+
+        Parameters:
+            path (str): Path to the model file.
+            name (str): Model name, e.g. 'music_genre_cnn_final.keras'.
+            version (str): Version label. Defaults to the first 12 characters of the digest.
+            metadata (dict): Optional extra fields stored in the manifest.
+            set_latest (bool): Whether `latest` should point at this version.
+
+        Returns:
+            dict: The version's manifest.
+        """
+        size = os.path.getsize(path)
+        digest, part_digests = digest_parts(path, self.part_size)
+        manifest = {
+            'name': name,
+            'version': version or digest[:12],
+            'digest': digest,
+            'size': size,
+            'part_size': self.part_size,
+            'parts': part_digests,
+            'created_at': time.time(),
+            'metadata': metadata or {},
+        }
+
+        key = self.blob_key(digest)
+        if self.store.size(key) == size:
+            logger.info(f"Artifact {digest[:12]} already in the registry; skipping upload")
+            self._count(deduplicated=1)
+        elif len(part_digests) <= 1:
+            with open(path, 'rb') as f:
+                self.store.put(key, f.read())
+            self._count(parts_uploaded=1, bytes_uploaded=size)
+        else:
+            self._upload_multipart(path, key, size)
+
+        self.store.put(self._manifest_key(name, manifest['version']), json.dumps(manifest, indent=2).encode())
+        if set_latest:
+            self.store.put(self._manifest_key(name, LATEST), json.dumps({'version': manifest['version']}).encode())
+        self._count(published=1)
+        logger.info(f"Published {name} version {manifest['version']} ({size} bytes)")
+        return manifest
+
+    def _upload_multipart(self, path, key, size):
+        upload_id = self.store.find_multipart(key)
+        existing = self.store.list_parts(key, upload_id) if upload_id is not None else {}
+        if upload_id is None:
+            upload_id = self.store.create_multipart(key)
+        else:
+            logger.info(f"Resuming upload of {key} with {len(existing)} parts already stored")
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            def upload(part):
+                part_number, start, end = part
+                data = os.pread(fd, end - start, start)
+                etag = existing.get(part_number)
+                # Parts stored by an interrupted upload are kept if their content still matches
+                if etag is not None and etag.strip('"') == hashlib.md5(data).hexdigest():
+                    self._count(parts_resumed=1)
+                    return part_number, etag
+                etag = self.store.upload_part(key, upload_id, part_number, data)
+                self._count(parts_uploaded=1, bytes_uploaded=len(data))
+                return part_number, etag
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='registry-upload') as executor:
+                etags = dict(executor.map(upload, _part_ranges(size, self.part_size)))
+        finally:
+            os.close(fd)
+        self.store.complete_multipart(key, upload_id, etags)
+
+    def resolve(self, name, version=LATEST):
+        """
+        Returns the manifest of a model version.
+
+        Parameters:
+            name (str): Model name.
+            version (str): Version label, or 'latest'.
+
+        Returns:
+            dict: The version's manifest.
+        """
+        if version == LATEST:
+            pointer = self.store.get(self._manifest_key(name, LATEST))
+            if pointer is None:
+                raise RegistryError(f"No published versions of {name}")
+            version = json.loads(pointer)['version']
+        data = self.store.get(self._manifest_key(name, version))
+        if data is None:
+            raise RegistryError(f"Version {version} of {name} not found in the registry")
+        return json.loads(data)
+
+    def cache_path(self, manifest):
+        """Returns where an artifact is cached; the name keeps its extension so loaders recognise the format."""
+        return os.path.join(self.cache_dir, manifest['digest'] + os.path.splitext(manifest['name'])[1])
+
+    def fetch(self, name, version=LATEST):
+        """
+        Returns a local path to a verified copy of a model version, downloading it if it is not cached.
+
+        Parameters:
+            name (str): Model name.
+            version (str): Version label, or 'latest'.
+
+        Returns:
+            tuple: (local path, manifest)
+        """
+        manifest = self.resolve(name, version)
+        path = self.cache_path(manifest)
+        if os.path.exists(path):
+            self._count(cache_hits=1)
+            return path, manifest
+
+        # One process downloads; others wait on the lock and then find the finished file
+        with open(path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(path):
+                    self._count(cache_hits=1)
+                    return path, manifest
+                self._download(manifest, path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return path, manifest
+
+    def _download(self, manifest, path):
+        partial_path, state_path = path + '.partial', path + '.parts'
+        ranges = _part_ranges(manifest['size'], manifest['part_size'])
+        done = set()
+        if os.path.exists(partial_path) and os.path.exists(state_path):
+            with open(state_path) as f:
+                done = {int(line) for line in f if line.strip()}
+            logger.info(f"Resuming download of {manifest['name']} with {len(done)}/{len(ranges)} parts cached")
+        else:
+            with open(partial_path, 'wb') as f:
+                f.truncate(manifest['size'])
+            open(state_path, 'w').close()
+
+        key = self.blob_key(manifest['digest'])
+        started_at = time.perf_counter()
+        fd = os.open(partial_path, os.O_RDWR)
+        state_lock = threading.Lock()
+        try:
+            with open(state_path, 'a') as state:
+                def download(part):
+                    part_number, start, end = part
+                    data = self.store.get_range(key, start, end)
+                    if hashlib.sha256(data).hexdigest() != manifest['parts'][part_number - 1]:
+                        raise RegistryError(f"Part {part_number} of {manifest['name']} failed checksum verification")
+                    os.pwrite(fd, data, start)
+                    # Recorded only once written, so a resumed download never trusts a torn part
+                    with state_lock:
+                        state.write(f"{part_number}\n")
+                        state.flush()
+                    self._count(parts_downloaded=1, bytes_downloaded=len(data))
+
+                pending = [part for part in ranges if part[0] not in done]
+                self._count(parts_reused=len(ranges) - len(pending))
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='registry-download') as executor:
+                    list(executor.map(download, pending))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        file_hash = hashlib.sha256()
+        with open(partial_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(manifest['part_size']), b''):
+                file_hash.update(chunk)
+        digest = file_hash.hexdigest()
+        if digest != manifest['digest']:
+            os.remove(partial_path)
+            os.remove(state_path)
+            raise RegistryError(f"{manifest['name']} failed checksum verification: expected {manifest['digest']}, got {digest}")
+        os.replace(partial_path, path)
+        os.remove(state_path)
+        self._count(downloads=1)
+        logger.info(f"Downloaded {manifest['name']} version {manifest['version']} "
+                    f"in {time.perf_counter() - started_at:.2f}s")
+
+    def stats(self):
+        """
+        Returns transfer counters.
+
+        Returns:
+            dict: Versions published, deduplicated uploads, parts and bytes transferred or resumed, cache hits.
+        """
+        with self._lock:
+            return {
+                'published': self._published,
+                'deduplicated': self._deduplicated,
+                'parts_uploaded': self._parts_uploaded,
+                'parts_resumed': self._parts_resumed,
+                'bytes_uploaded': self._bytes_uploaded,
+                'cache_hits': self._cache_hits,
+                'downloads': self._downloads,
+                'parts_downloaded': self._parts_downloaded,
+                'parts_reused': self._parts_reused,
+                'bytes_downloaded': self._bytes_downloaded,
+            }
@@ -0,0 +1,97 @@
+# spectrogram_batch.py
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TARGET_HEIGHT = 128
+TARGET_WIDTH = 1024
+
+# Added to the value range by the training pipeline's normalization
+TRAINING_EPSILON = 1e-6
+
+
+def _placement(size, target):
+    """Returns (source stop, destination start) for cropping or centre-padding one axis to `target`."""
+    if size >= target:
+        return target, 0
+    return size, (target - size) // 2
+
+
+def fit_batch(spectrograms, out=None, channels=None, normalize=True, epsilon=0.0,
+              target_height=TARGET_HEIGHT, target_width=TARGET_WIDTH):
+    """
+    Crops or centre-pads a batch of spectrograms to the model input size and
+    min-max normalizes each one, writing float32 results into one buffer.
+
+    Spectrograms larger than the target are cropped from the top-left corner;
+    smaller ones are zero-padded evenly on both sides, and the padding counts
+    towards each spectrogram's minimum and maximum. Each spectrogram is copied
+    into the buffer once, casting to float32 on the way; the per-spectrogram
+    minimum, maximum and scaling then run over the whole batch in place.
+
+    Parameters:
+        spectrograms (sequence or np.ndarray): 2-D arrays of shape (height, width), which may differ
+            per spectrogram, or one 3-D array of shape (N, height, width).
+        out (np.ndarray): Optional preallocated float32 buffer of shape (N, target_height, target_width),
+            or (N, target_height, target_width, channels).
+        channels (int): Trailing channels to replicate into when `out` is not given; None for no channel axis.
+        normalize (bool): Min-max normalize each spectrogram to [0, 1].
+        epsilon (float): Added to each value range. With 0, constant spectrograms normalize to zeros.
+        target_height (int): Height of the model input.
+        target_width (int): Width of the model input.
+
+    Returns:
+        np.ndarray: `out`, or a new buffer when it was not given.
+    """
+    count = len(spectrograms)
+    if out is None:
+        shape = (count, target_height, target_width) + ((channels,) if channels else ())
+        out = np.empty(shape, dtype=np.float32)
+    elif out.dtype != np.float32 or out.shape[:3] != (count, target_height, target_width) or out.ndim not in (3, 4):
+        raise ValueError(
+            f"out must be float32 of shape ({count}, {target_height}, {target_width}[, channels]), "
+            f"got {out.dtype} {out.shape}"
+        )
+
+    # Single-channel buffers are worked on in place; replicated channels are filled from one plane at the end
+    replicate = out.ndim == 4 and out.shape[3] > 1
+    if out.ndim == 3:
+        plane = out
+    elif not replicate:
+        plane = out.reshape(out.shape[:3])
+    else:
+        plane = np.empty(out.shape[:3], dtype=np.float32)
+    if count == 0:
+        return out
+
+    uniform = isinstance(spectrograms, np.ndarray) and spectrograms.ndim == 3
+    if uniform and spectrograms.shape[1] >= target_height and spectrograms.shape[2] >= target_width:
+        plane[...] = spectrograms[:, :target_height, :target_width]
+    else:
+        for index, spectrogram in enumerate(spectrograms):
+            if spectrogram.ndim != 2:
+                raise ValueError(f"Spectrogram {index} must be 2-D, got shape {spectrogram.shape}")
+            height, top = _placement(spectrogram.shape[0], target_height)
+            width, left = _placement(spectrogram.shape[1], target_width)
+            if height < target_height or width < target_width:
+                plane[index] = 0
+            plane[index, top:top + height, left:left + width] = spectrogram[:height, :width]
+
+    if normalize:
+        minimum = plane.min(axis=(1, 2), keepdims=True)
+        value_range = plane.max(axis=(1, 2), keepdims=True)
+        value_range -= minimum
+        if epsilon:
+            value_range += np.float32(epsilon)
+        else:
+            # Constant spectrograms are all zeros once the minimum is subtracted
+            value_range[value_range == 0] = 1
+        np.subtract(plane, minimum, out=plane)
+        np.divide(plane, value_range, out=plane)
+
+    if replicate:
+        out[...] = plane[..., np.newaxis]
+    return out
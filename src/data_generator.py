@@ -7,6 +7,9 @@ from io import BytesIO
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import boto3
 
+# Pad/crop/normalize with the batch kernel the serving app uses so training and serving see the same inputs
+from aim_common.spectrogram_batch import TRAINING_EPSILON, fit_batch
+
 Sequence = keras.utils.Sequence  # Ensure keras.utils.Sequence import works
 
 # Initialize logging
@@ -32,44 +35,7 @@ def preprocess_spectrogram(spectrogram, input_channels=3):
     if spectrogram.ndim != 2:
         raise ValueError(f"Spectrogram has unexpected number of dimensions: {spectrogram.ndim}")
 
-    target_height = 128
-    target_width = 1024
-    current_height, current_width = spectrogram.shape
-
-    # Resize or pad height
-    if current_height < target_height:
-        padding_height = target_height - current_height
-        top_padding = padding_height // 2
-        bottom_padding = padding_height - top_padding
-        spectrogram = np.pad(spectrogram, ((top_padding, bottom_padding), (0, 0)), 'constant')
-    elif current_height > target_height:
-        spectrogram = spectrogram[:target_height, :]
-
-    # Resize or pad width
-    current_height, current_width = spectrogram.shape
-    if current_width < target_width:
-        padding_width = target_width - current_width
-        left_padding = padding_width // 2
-        right_padding = padding_width - left_padding
-        spectrogram = np.pad(spectrogram, ((0, 0), (left_padding, right_padding)), 'constant')
-    elif current_width > target_width:
-        spectrogram = spectrogram[:, :target_width]
-
-    # Normalize spectrogram using min-max normalization
-    min_val = np.min(spectrogram)
-    max_val = np.max(spectrogram)
-    normalized_spectrogram = (spectrogram - min_val) / (max_val - min_val + 1e-6)  # Avoid division by zero
-
-    # Replicate channels for ResNet50
-    if input_channels > 1:
-        normalized_spectrogram = np.repeat(normalized_spectrogram[..., np.newaxis], input_channels, axis=-1)
-        logger.debug(f"Replicated spectrogram to {input_channels} channels: {normalized_spectrogram.shape}")
-    else:
-        # Add channel dimension
-        normalized_spectrogram = np.expand_dims(normalized_spectrogram, axis=-1)
-        logger.debug(f"Added single channel to spectrogram: {normalized_spectrogram.shape}")
-
-    return normalized_spectrogram
+    return fit_batch([spectrogram], channels=input_channels, epsilon=TRAINING_EPSILON)[0]
 
 class DataGenerator(Sequence):
     def __init__(self, data_index, s3_client, batch_size, input_shape=(128, 1024, 3), num_classes=10, shuffle=True, cache_dir='/content/drive/MyDrive/ML_Project/spectrogram_cache', augment=False, **kwargs):
@@ -128,7 +94,7 @@ class DataGenerator(Sequence):
         logger.info("Epoch ended. Data shuffled.")
 
     def __data_generation(self, indexes):
-        X_list = []
+        spectrograms = []
         y_list = []
 
         for idx in indexes:
@@ -139,27 +105,32 @@ class DataGenerator(Sequence):
                 spectrogram = self.get_spectrogram(bucket_name, key)
                 logger.debug(f"Loaded spectrogram shape before preprocessing for {file_path}: {spectrogram.shape}")
 
-                processed_spectrogram = preprocess_spectrogram(spectrogram, input_channels=self.input_shape[-1])
-                logger.debug(f"Processed spectrogram shape for {file_path}: {processed_spectrogram.shape}")
-
-                if self.augmenter:
-                    # Apply random transformations
-                    processed_spectrogram = self.augmenter.random_transform(processed_spectrogram)
-                    logger.debug(f"Augmented spectrogram shape for {file_path}: {processed_spectrogram.shape}")
+                # If spectrogram has more than 2 dimensions, squeeze to 2D
+                if spectrogram.ndim > 2:
+                    spectrogram = np.squeeze(spectrogram)
+                if spectrogram.ndim != 2:
+                    raise ValueError(f"Spectrogram has unexpected number of dimensions: {spectrogram.ndim}")
 
-                X_list.append(processed_spectrogram)
+                spectrograms.append(spectrogram)
                 y_list.append(genre_index)
             except Exception as e:
                 logger.error(f"Error loading {file_path}: {e}")
                 continue  # Skip this sample
 
-        if len(X_list) == 0:
+        if len(spectrograms) == 0:
             # If no samples were loaded successfully, raise an error
             logger.error("No data available for this batch.")
             raise ValueError("No data available for this batch.")
 
-        # Convert lists to arrays
-        X = np.array(X_list)
+        # Pad/crop, normalize and replicate channels for the whole batch at once
+        X = fit_batch(spectrograms, channels=self.input_shape[-1], epsilon=TRAINING_EPSILON)
+        logger.debug(f"Processed batch shape: {X.shape}")
+
+        if self.augmenter:
+            # Apply random transformations
+            for i in range(len(X)):
+                X[i] = self.augmenter.random_transform(X[i])
+
         y = keras.utils.to_categorical(y_list, num_classes=self.num_classes)
 
         return X, y
@@ -12,6 +12,9 @@ from sklearn.metrics import classification_report, confusion_matrix, accuracy_sc
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# Pad/crop with the batch kernel the serving app uses
+from aim_common.spectrogram_batch import fit_batch
+
 # Define genre map and list of genres
 genre_map = {
     'Classical': 0,
@@ -32,34 +35,8 @@ TEST_DATA_PREFIX = 'Test data/'  # Adjust the S3 prefix for test data
 
 # Preprocessing functions
 def preprocess_spectrogram(spectrogram):
-    target_height = 128
-    target_width = 1024
-    current_height, current_width = spectrogram.shape
-
-    # Resize or pad height
-    if current_height < target_height:
-        padding_height = target_height - current_height
-        top_padding = padding_height // 2
-        bottom_padding = padding_height - top_padding
-        padded_spectrogram = np.pad(spectrogram, ((top_padding, bottom_padding), (0, 0)), 'constant')
-    elif current_height > target_height:
-        padded_spectrogram = spectrogram[:target_height, :]
-    else:
-        padded_spectrogram = spectrogram
-
-    # Resize or pad width
-    current_height, current_width = padded_spectrogram.shape
-    if current_width < target_width:
-        padding_width = target_width - current_width
-        left_padding = padding_width // 2
-        right_padding = padding_width - left_padding
-        padded_spectrogram = np.pad(padded_spectrogram, ((0, 0), (left_padding, right_padding)), 'constant')
-    elif current_width > target_width:
-        padded_spectrogram = padded_spectrogram[:, :target_width]
-
-    # Add channel dimension
-    padded_spectrogram = np.expand_dims(padded_spectrogram, axis=-1)
-    return padded_spectrogram
+    # Evaluation feeds the model un-normalized single-channel spectrograms
+    return fit_batch([spectrogram], channels=1, normalize=False)[0]
 
 # Data Generator for evaluation
 class TestDataGenerator(Sequence):
@@ -82,17 +59,20 @@ class TestDataGenerator(Sequence):
 
     def __data_generation(self, batch_data):
         current_batch_size = len(batch_data)
-        X = np.empty((current_batch_size, *self.input_shape))
+        X = np.empty((current_batch_size, *self.input_shape), dtype=np.float32)
         y = np.empty((current_batch_size), dtype=int)
 
+        spectrograms = []
         for i, data_point in enumerate(batch_data):
             file_path, genre_label, genre_index = data_point
 
             # Load spectrogram from S3
-            spectrogram = self.load_spectrogram_from_s3(file_path)
-            X[i] = preprocess_spectrogram(spectrogram)
+            spectrograms.append(self.load_spectrogram_from_s3(file_path))
             y[i] = genre_index
 
+        # Pad/crop the whole batch into X in one pass
+        fit_batch(spectrograms, out=X, normalize=False)
+
         return X, keras.utils.to_categorical(y, num_classes=self.num_classes)
 
     def load_spectrogram_from_s3(self, s3_path):
@@ -0,0 +1,208 @@
+# export_model.py
+
+import argparse
+import json
+import os
+import time
+
+import boto3
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import logging
+
+from data_generator import DataGenerator
+
+# Reuse the serving app's TFLite runner so the report measures what production runs
+from aim_common.inference_backends import TFLiteModel
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('none', 'dynamic', 'float16', 'int8')
+
+
+def load_samples(index_csv, s3_client, cache_dir, sample_size, num_classes=10, seed=0):
+    """
+    Loads a random sample of preprocessed spectrograms and labels from a data index.
+
+    Parameters:
+        index_csv (str): Path to a data index CSV (file_path, genre_label, genre_index).
+        s3_client (boto3.client): AWS S3 client used for spectrograms missing from the cache.
+        cache_dir (str): Local spectrogram cache shared with training.
+        sample_size (int): Number of spectrograms to load.
+        num_classes (int): Number of output classes.
+        seed (int): Random seed for the sample.
+
+    Returns:
+        tuple: (X of shape (N, 128, 1024, 3) float32, y class indices of shape (N,))
+    """
+    data = pd.read_csv(index_csv)
+    data = data.sample(n=min(sample_size, len(data)), random_state=seed)
+    data_index = list(zip(data['file_path'], data['genre_label'], data['genre_index']))
+
+    generator = DataGenerator(
+        data_index=data_index,
+        s3_client=s3_client,
+        batch_size=len(data_index),
+        num_classes=num_classes,
+        shuffle=False,
+        cache_dir=cache_dir,
+        augment=False
+    )
+    X, y = generator[0]
+    logger.info(f"Loaded {len(X)} spectrograms from {index_csv}")
+    return X.astype(np.float32), np.argmax(y, axis=1)
+
+
+def export_tflite(model, output_path, quantization='dynamic', calibration_samples=None):
+    """
+    Converts a Keras model into a TFLite flatbuffer for CPU serving.
+
+    Parameters:
+        model (tensorflow.keras.models.Model): Trained model.
+        output_path (str): Where to write the .tflite file.
+        quantization (str): 'none', 'dynamic' (int8 weights), 'float16' (float16 weights)
+            or 'int8' (int8 weights and activations, calibrated on `calibration_samples`).
+        calibration_samples (np.ndarray): Representative inputs, required for 'int8'.
+
+    Returns:
+        int: Size of the exported flatbuffer in bytes.
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantization}. Expected one of {QUANTIZATION_MODES}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization != 'none':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if calibration_samples is None or len(calibration_samples) == 0:
+            raise ValueError("Full-int8 quantization requires calibration samples.")
+
+        def representative_dataset():
+            for sample in calibration_samples:
+                yield [sample[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    flatbuffer = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(flatbuffer)
+    logger.info(f"Exported {quantization} TFLite model to {output_path} ({len(flatbuffer) / 1e6:.1f} MB)")
+    return len(flatbuffer)
+
+
+def measure_latency(predict_fn, samples, runs=20, warmup=3):
+    """
+    Measures single-sample latency of a predict function.
+
+    Parameters:
+        predict_fn (callable): Takes a batch of shape (1, 128, 1024, 3).
+        samples (np.ndarray): Inputs to cycle through.
+        runs (int): Number of timed calls.
+        warmup (int): Number of untimed calls made first.
+
+    Returns:
+        dict: p50/p95/mean latency in milliseconds.
+    """
+    for i in range(warmup):
+        predict_fn(samples[i % len(samples)][np.newaxis])
+    timings = []
+    for i in range(runs):
+        started_at = time.perf_counter()
+        predict_fn(samples[i % len(samples)][np.newaxis])
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 2),
+        'p95_ms': round(float(np.percentile(timings, 95)), 2),
+        'mean_ms': round(float(np.mean(timings)), 2),
+    }
+
+
+def compare_models(keras_model, tflite_model, samples, labels, latency_runs=20):
+    """
+    Reports the accuracy delta and latency of a TFLite export against the Keras model.
+
+    Parameters:
+        keras_model (tensorflow.keras.models.Model): Reference model.
+        tflite_model: Object with a Keras-style `predict(batch)` wrapping the exported flatbuffer.
+        samples (np.ndarray): Evaluation inputs.
+        labels (np.ndarray): True class indices for `samples`.
+        latency_runs (int): Number of timed single-sample calls per model.
+
+    Returns:
+        dict: Accuracy of both models, their top-1 agreement, mean absolute probability
+            difference and latency percentiles.
+    """
+    keras_probs = keras_model.predict(samples, verbose=0)
+    tflite_probs = np.concatenate([tflite_model.predict(sample[np.newaxis]) for sample in samples])
+
+    keras_pred = keras_probs.argmax(axis=1)
+    tflite_pred = tflite_probs.argmax(axis=1)
+    keras_accuracy = float(np.mean(keras_pred == labels))
+    tflite_accuracy = float(np.mean(tflite_pred == labels))
+
+    return {
+        'samples': int(len(samples)),
+        'keras_accuracy': round(keras_accuracy, 4),
+        'tflite_accuracy': round(tflite_accuracy, 4),
+        'accuracy_delta': round(tflite_accuracy - keras_accuracy, 4),
+        'top1_agreement': round(float(np.mean(keras_pred == tflite_pred)), 4),
+        'mean_abs_prob_diff': round(float(np.mean(np.abs(keras_probs - tflite_probs))), 6),
+        'keras_latency': measure_latency(lambda batch: keras_model.predict(batch, verbose=0), samples, latency_runs),
+        'tflite_latency': measure_latency(tflite_model.predict, samples, latency_runs),
+    }
+
+
+def main():
+    # Define the root directory
+    DRIVE_ROOT = '/content/drive/MyDrive/ML_Project'
+
+    parser = argparse.ArgumentParser(description="Export the trained model to an optimized TFLite flatbuffer.")
+    parser.add_argument('--model', default=os.path.join(DRIVE_ROOT, 'models', 'music_genre_cnn_final.keras'))
+    parser.add_argument('--output', default=None, help="Defaults to the model path with a .tflite extension")
+    parser.add_argument('--quantization', choices=QUANTIZATION_MODES, default='dynamic')
+    parser.add_argument('--index-csv', default=os.path.join(DRIVE_ROOT, 'val_data_index.csv'),
+                        help="Data index used for int8 calibration and the accuracy report")
+    parser.add_argument('--cache-dir', default=os.path.join(DRIVE_ROOT, 'spectrogram_cache'))
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    parser.add_argument('--eval-samples', type=int, default=500)
+    parser.add_argument('--report', default=None, help="Defaults to the output path with a .json extension")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.splitext(args.model)[0] + '.tflite'
+    report_path = args.report or os.path.splitext(output_path)[0] + '.json'
+
+    logger.info(f"Loading Keras model from {args.model}")
+    keras_model = tf.keras.models.load_model(args.model)
+    s3_client = boto3.client('s3')
+
+    calibration = None
+    if args.quantization == 'int8':
+        calibration, _ = load_samples(args.index_csv, s3_client, args.cache_dir, args.calibration_samples, seed=0)
+    size_bytes = export_tflite(keras_model, output_path, args.quantization, calibration)
+
+    # Compare against the Keras model on a held-out sample
+    samples, labels = load_samples(args.index_csv, s3_client, args.cache_dir, args.eval_samples, seed=1)
+    report = compare_models(keras_model, TFLiteModel(output_path), samples, labels)
+    report.update({
+        'quantization': args.quantization,
+        'keras_model': args.model,
+        'tflite_model': output_path,
+        'keras_size_bytes': os.path.getsize(args.model),
+        'tflite_size_bytes': size_bytes,
+    })
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Export report saved to {report_path}: {json.dumps(report)}")
+
+
+if __name__ == "__main__":
+    main()
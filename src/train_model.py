@@ -22,6 +22,9 @@ import numpy as np
 from sklearn.utils import class_weight
 import json
 
+# Publish through the serving app's model registry so uploads are versioned and checksummed
+from aim_common.model_registry import ModelRegistry, S3Store
+
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -65,19 +68,27 @@ def plot_training_history(history, save_dir):
     display(Image(filename=accuracy_plot_path))
     display(Image(filename=loss_plot_path))
 
-def upload_to_s3(s3_client, local_file_path, bucket_name, s3_file_path):
+def upload_to_s3(s3_client, local_file_path, bucket_name, s3_file_path, registry_prefix='trained_models/registry'):
     """
     Uploads a file to AWS S3.
 
+    The file is published to the model registry (a parallel multipart upload that
+    resumes after interruption and is skipped if the content is already there),
+    then copied server-side to `s3_file_path` for deployments that read the plain object.
+
     Parameters:
         s3_client (boto3.client): The S3 client.
         local_file_path (str): Path to the local file.
         bucket_name (str): Name of the S3 bucket.
         s3_file_path (str): S3 object name (including prefix if any).
+        registry_prefix (str): Key prefix of the model registry in the bucket.
     """
     try:
-        s3_client.upload_file(local_file_path, bucket_name, s3_file_path)
-        logger.info(f"Successfully uploaded {local_file_path} to s3://{bucket_name}/{s3_file_path}")
+        registry = ModelRegistry(S3Store(s3_client, bucket_name), prefix=registry_prefix)
+        manifest = registry.publish(local_file_path, os.path.basename(s3_file_path))
+        registry.store.copy(registry.blob_key(manifest['digest']), s3_file_path)
+        logger.info(f"Successfully uploaded {local_file_path} to s3://{bucket_name}/{s3_file_path} "
+                    f"(registry version {manifest['version']})")
     except FileNotFoundError:
         logger.error(f"The file {local_file_path} was not found.")
     except NoCredentialsError:
@@ -268,11 +279,13 @@ def main():
 
     # Upload 'best_model.keras' to S3
     best_model_s3_path = os.path.join(MODEL_S3_PREFIX, 'best_model.keras')
-    upload_to_s3(s3_client, checkpoint_path, MODEL_S3_BUCKET, best_model_s3_path)
+    upload_to_s3(s3_client, checkpoint_path, MODEL_S3_BUCKET, best_model_s3_path,
+                 registry_prefix=os.path.join(MODEL_S3_PREFIX, 'registry'))
 
     # Upload 'music_genre_cnn_final.keras' to S3
     final_model_s3_path = os.path.join(MODEL_S3_PREFIX, 'music_genre_cnn_final.keras')
-    upload_to_s3(s3_client, final_model_path, MODEL_S3_BUCKET, final_model_s3_path)
+    upload_to_s3(s3_client, final_model_path, MODEL_S3_BUCKET, final_model_s3_path,
+                 registry_prefix=os.path.join(MODEL_S3_PREFIX, 'registry'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
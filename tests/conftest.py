@@ -0,0 +1,48 @@
+# conftest.py
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Builds the app with a stand-in model, the local downloader and every directory under
+    `tmp_path`, so requests run offline. Skipped when the serving dependencies are missing.
+    """
+    pytest.importorskip('flask')
+    pytest.importorskip('librosa')
+    pytest.importorskip('tensorflow')
+    from app import create_app
+    from benchmark import StandInModel
+
+    def make(**overrides):
+        config = {
+            'UPLOADED_AUDIO_DEST': str(tmp_path / 'uploads'),
+            'MODELS_DIR': str(tmp_path / 'models'),
+            'JOBS_DIR': str(tmp_path / 'jobs'),
+            'PREDICTION_CACHE_DIR': str(tmp_path / 'cache' / 'predictions'),
+            'PREVIEW_DIR': str(tmp_path / 'cache' / 'previews'),
+            'LOCAL_MEDIA_DIR': str(tmp_path / 'media'),
+            'AUDIO_DOWNLOADER': 'local',
+            'PREPROCESS_WORKERS': 0,
+            'PREVIEW_RENDITIONS': False,
+        }
+        config.update(overrides)
+        os.makedirs(config['LOCAL_MEDIA_DIR'], exist_ok=True)
+        app = create_app(config, model_factory=lambda: StandInModel(batch_delay_ms=0, item_delay_ms=0))
+        assert app.extensions['model_loader'].wait(60)
+        return app
+    return make
+
+
+@pytest.fixture
+def wav_file(tmp_path):
+    """Path of a short synthetic WAV file."""
+    pytest.importorskip('soundfile')
+    from benchmark import synthesize_audio
+
+    path = tmp_path / 'track.wav'
+    synthesize_audio(str(path), 5)
+    return path
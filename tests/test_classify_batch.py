@@ -0,0 +1,50 @@
+# test_classify_batch.py
+
+import io
+import json
+import zipfile
+
+
+def post_batch(client, parts):
+    response = client.post('/classify/batch', data={'file': parts}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_streams_results_for_uploaded_files(make_app, wav_file):
+    client = make_app().test_client()
+    audio = wav_file.read_bytes()
+
+    lines = post_batch(client, [(io.BytesIO(audio), 'a.wav'), (io.BytesIO(audio), 'b.wav')])
+
+    assert sorted(line['index'] for line in lines) == [0, 1]
+    for line in lines:
+        assert 'error' not in line, line
+        assert line['genres']
+
+
+def test_streams_results_for_zip_members(make_app, wav_file):
+    client = make_app().test_client()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(wav_file, 'album/one.wav')
+        zf.writestr('album/notes.txt', 'skipped')
+    archive.seek(0)
+
+    lines = post_batch(client, [(archive, 'album.zip')])
+
+    assert [line['name'] for line in lines] == ['album/one.wav']
+    assert 'error' not in lines[0], lines[0]
+
+
+def test_reports_bad_tracks_in_their_line(make_app, wav_file):
+    client = make_app().test_client()
+
+    audio = wav_file.read_bytes()
+
+    lines = post_batch(client, [(io.BytesIO(audio), 'a.wav'), (io.BytesIO(audio), 'b.txt')])
+
+    by_name = {line['name']: line for line in lines}
+    assert 'genres' in by_name['a.wav']
+    assert 'error' in by_name['b.txt']
@@ -0,0 +1,73 @@
+# test_downloads.py
+
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('yt_dlp')  # downloaders imports it at module level
+
+from download_cache import DownloadCache
+
+
+def test_classifies_a_file_url_inside_the_media_dir(make_app, wav_file, tmp_path):
+    client = make_app().test_client()
+    media_path = tmp_path / 'media' / 'track.wav'
+    shutil.copyfile(wav_file, media_path)
+
+    response = client.post('/upload', json={'url': f'file://{media_path}', 'song_name': 'Song', 'artist': 'Artist'})
+
+    assert response.status_code == 200
+    assert response.get_json()['genres']
+
+
+def test_refuses_a_file_url_outside_the_media_dir(make_app, wav_file, tmp_path):
+    client = make_app().test_client()
+    escape = tmp_path / 'media' / '..' / wav_file.name
+
+    for url in (f'file://{wav_file}', f'file://{escape}'):
+        response = client.post('/upload', json={'url': url, 'song_name': 'Song', 'artist': 'Artist'})
+
+        assert response.status_code == 400
+        assert 'No local media found' in response.get_json()['error']
+
+
+class FakeDownloader:
+    """Writes a file of `size` bytes per download and counts the calls."""
+
+    def __init__(self, directory, size=1000):
+        self.directory = directory
+        self.size = size
+        self.downloads = []
+
+    def download(self, url, song_name, artist):
+        self.downloads.append(url)
+        path = os.path.join(self.directory, f'{len(self.downloads)}.mp3')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(self.size))
+        return path
+
+
+def test_cache_hits_pins_and_evicts(tmp_path):
+    downloads_dir = tmp_path / 'downloads'
+    downloads_dir.mkdir()
+    downloader = FakeDownloader(str(downloads_dir))
+    cache = DownloadCache(downloader, str(tmp_path / 'cache'), max_bytes=2500)
+
+    with cache.checkout('https://youtu.be/a', 'Song', 'Artist') as (pinned_path, _, source):
+        assert source == 'downloaded'
+        with cache.checkout('https://www.youtube.com/watch?v=a', 'Song', 'Artist') as (path, _, source):
+            assert (path, source) == (pinned_path, 'hit')
+        with cache.checkout('https://youtu.be/b', 'Song', 'Artist') as (evicted_path, _, _):
+            pass
+        # Over the bound: 'a' is the least recently used but pinned, so 'b' goes instead
+        with cache.checkout('https://youtu.be/c', 'Song', 'Artist'):
+            pass
+        assert os.path.exists(pinned_path)
+        assert not os.path.exists(evicted_path)
+
+    assert downloader.downloads == ['https://youtu.be/a', 'https://youtu.be/b', 'https://youtu.be/c']
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 1)
+    assert stats['bytes'] <= 2500
+    assert stats['pinned'] == 0
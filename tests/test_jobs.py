@@ -0,0 +1,33 @@
+# test_jobs.py
+
+import io
+import os
+
+
+def post_job(client, wav_file):
+    return client.post('/jobs', data={
+        'file': (io.BytesIO(wav_file.read_bytes()), 'track.wav'),
+        'song_name': 'Song',
+        'artist': 'Artist',
+    }, content_type='multipart/form-data')
+
+
+def test_rejected_job_leaves_no_upload_behind(make_app, wav_file, tmp_path):
+    client = make_app(JOBS_MAX_QUEUE_DEPTH=0).test_client()
+
+    response = post_job(client, wav_file)
+
+    assert response.status_code == 429
+    assert [name for name in os.listdir(tmp_path / 'jobs') if name.endswith('.wav')] == []
+
+
+def test_failed_save_leaves_no_upload_behind(make_app, wav_file, tmp_path, monkeypatch):
+    client = make_app().test_client()
+
+    def fail(self, dst, buffer_size=16384):
+        raise OSError("No space left on device")
+    monkeypatch.setattr('werkzeug.datastructures.FileStorage.save', fail)
+    response = post_job(client, wav_file)
+
+    assert response.status_code == 500
+    assert [name for name in os.listdir(tmp_path / 'jobs') if name.endswith('.wav')] == []
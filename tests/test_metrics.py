@@ -0,0 +1,34 @@
+# test_metrics.py
+
+import json
+import os
+
+from metrics import MetricsRegistry, WorkerSnapshots
+
+
+def test_snapshots_report_every_live_worker(tmp_path):
+    registry = MetricsRegistry()
+    requests = registry.counter('aim_requests_total', 'Requests.', ('endpoint',))
+    requests.labels(endpoint='upload').inc(3)
+    snapshots = WorkerSnapshots(str(tmp_path), registry, lambda: {'queued': 1})
+
+    # Another live worker's snapshot, and one left by a worker that has exited
+    other = MetricsRegistry()
+    other.counter('aim_requests_total', 'Requests.', ('endpoint',)).labels(endpoint='upload').inc(5)
+    other_pid = os.getppid()
+    (tmp_path / f'{other_pid}.json').write_text(json.dumps({
+        'pid': other_pid,
+        'published_at': 0,
+        'metrics': other.render([('worker', other_pid)]),
+        'stats': {'queued': 2},
+    }))
+    (tmp_path / '999999999.json').write_text('{}')
+
+    exposition = snapshots.render()
+
+    assert exposition.count('# TYPE aim_requests_total counter') == 1
+    assert f'aim_requests_total{{endpoint="upload",worker="{os.getpid()}"}} 3' in exposition
+    assert f'aim_requests_total{{endpoint="upload",worker="{other_pid}"}} 5' in exposition
+    assert not (tmp_path / '999999999.json').exists()
+    stats = snapshots.stats()
+    assert {pid: worker['queued'] for pid, worker in stats.items()} == {str(os.getpid()): 1, str(other_pid): 2}
@@ -0,0 +1,57 @@
+# test_model_watcher.py
+
+from model_watcher import ModelWatcher
+
+
+class FakeLoader:
+    def __init__(self, version):
+        self.model = object()
+        self.version = version
+        self.ready = True
+
+    def warm(self, model):
+        pass
+
+    def activate(self, model, version):
+        self.model, self.version = model, version
+
+
+def test_failed_version_is_retried_with_backoff(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('model_watcher.time.monotonic', lambda: now[0])
+    published = ['v1']
+    loads = []
+
+    def load(fingerprint):
+        loads.append(fingerprint)
+        if fingerprint == 'v2':
+            raise RuntimeError("corrupt artifact")
+        return object(), fingerprint
+
+    loader = FakeLoader('v1')
+    watcher = ModelWatcher(loader, lambda: published[0], load, interval=60, baseline=lambda: loader.version)
+
+    published[0] = 'v2'
+    assert not watcher.check()
+    assert not watcher.check()  # Within the backoff
+    now[0] += 60
+    assert not watcher.check()  # Retried once, now waits twice as long
+    now[0] += 60
+    assert not watcher.check()
+    assert loads == ['v2', 'v2']
+
+    published[0] = 'v3'  # A new version is tried straight away
+    assert watcher.check()
+    assert loader.version == 'v3'
+    assert watcher.stats()['failed_fingerprint'] is None
+
+
+def test_callable_baseline_is_the_served_version():
+    loads = []
+    loader = FakeLoader('v2')
+    # 'latest' moved on while the initial model was loading
+    watcher = ModelWatcher(loader, lambda: 'v3', lambda fingerprint: loads.append(fingerprint) or (object(), fingerprint),
+                           baseline=lambda: loader.version)
+
+    assert watcher.check()
+    assert loads == ['v3']
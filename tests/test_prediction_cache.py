@@ -0,0 +1,37 @@
+# test_prediction_cache.py
+
+import os
+
+from prediction_cache import PredictionCache
+
+# About 1 KB on disk per entry
+VALUE = {'genres': ['x' * 1000]}
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = PredictionCache(str(tmp_path), max_memory_entries=0, max_disk_bytes=10_000)
+    keys = [cache.make_key(f'{i:064x}', 'v1') for i in range(10)]
+    for age, key in enumerate(keys[:8]):
+        cache.put(key, VALUE)
+        # Written one after another; spread their last use apart
+        os.utime(cache._disk_path(key), (age, age))
+    assert cache.get(keys[0]) == VALUE  # Used again, so now the most recent
+
+    for key in keys[8:]:  # Pushes the tier past its bound once
+        cache.put(key, VALUE)
+
+    stats = cache.stats()
+    assert stats['disk_evictions'] > 0
+    assert stats['disk_bytes'] <= 10_000
+    assert cache.get(keys[0]) == VALUE
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[-1]) == VALUE
+    # Temporary files are all renamed into place
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if not name.endswith('.json')]
+
+
+def test_disk_size_survives_restart(tmp_path):
+    cache = PredictionCache(str(tmp_path))
+    cache.put(cache.make_key('0' * 64, 'v1'), VALUE)
+
+    assert PredictionCache(str(tmp_path)).stats()['disk_bytes'] == cache.stats()['disk_bytes'] > 0
@@ -0,0 +1,93 @@
+# test_spectrogram_batch.py
+
+import numpy as np
+import pytest
+
+from aim_common.spectrogram_batch import TARGET_HEIGHT, TARGET_WIDTH, TRAINING_EPSILON, fit_batch
+
+# Serving, training and evaluation each used their own per-spectrogram pad/crop/normalize before the batch kernel
+SETTINGS = {
+    'serving': {'channels': 3, 'normalize': True, 'epsilon': 0.0},
+    'training': {'channels': 3, 'normalize': True, 'epsilon': TRAINING_EPSILON},
+    'evaluation': {'channels': 1, 'normalize': False, 'epsilon': 0.0},
+}
+
+
+def reference_fit(spectrogram, normalize, epsilon):
+    """The per-spectrogram pad/crop/normalize the batch kernel replaced."""
+    current_height, current_width = spectrogram.shape
+    if current_height < TARGET_HEIGHT:
+        top_padding = (TARGET_HEIGHT - current_height) // 2
+        spectrogram = np.pad(spectrogram, ((top_padding, TARGET_HEIGHT - current_height - top_padding), (0, 0)), 'constant')
+    elif current_height > TARGET_HEIGHT:
+        spectrogram = spectrogram[:TARGET_HEIGHT, :]
+    current_width = spectrogram.shape[1]
+    if current_width < TARGET_WIDTH:
+        left_padding = (TARGET_WIDTH - current_width) // 2
+        spectrogram = np.pad(spectrogram, ((0, 0), (left_padding, TARGET_WIDTH - current_width - left_padding)), 'constant')
+    elif current_width > TARGET_WIDTH:
+        spectrogram = spectrogram[:, :TARGET_WIDTH]
+
+    if not normalize:
+        return spectrogram
+    min_val = np.min(spectrogram)
+    max_val = np.max(spectrogram)
+    if epsilon:
+        return (spectrogram - min_val) / (max_val - min_val + epsilon)
+    if max_val - min_val == 0:
+        return np.zeros_like(spectrogram)
+    return (spectrogram - min_val) / (max_val - min_val)
+
+
+@pytest.fixture
+def spectrograms():
+    """Spectrograms that are cropped, padded, constant and already the right size, plus random ones."""
+    rng = np.random.default_rng(0)
+    spectrograms = [
+        np.full((TARGET_HEIGHT, 700), -40.0),
+        np.zeros((TARGET_HEIGHT, TARGET_WIDTH), dtype=np.float32),
+        rng.uniform(-80, 0, (TARGET_HEIGHT, TARGET_WIDTH)).astype(np.float32),
+        rng.uniform(-80, 0, (100, 1500)),
+        rng.uniform(-80, 0, (150, 10)),
+        rng.uniform(1, 5, (TARGET_HEIGHT, 300)),
+    ]
+    for _ in range(32):
+        height = int(rng.integers(TARGET_HEIGHT - 20, TARGET_HEIGHT + 20))
+        width = int(rng.integers(1, 2 * TARGET_WIDTH))
+        dtype = np.float32 if rng.random() < 0.5 else np.float64
+        spectrograms.append(rng.uniform(-80, 0, (height, width)).astype(dtype))
+    return spectrograms
+
+
+@pytest.mark.parametrize('setting', SETTINGS)
+def test_matches_per_spectrogram_reference(spectrograms, setting):
+    options = SETTINGS[setting]
+    batch = fit_batch(spectrograms, **options)
+
+    expected = np.stack([reference_fit(s, options['normalize'], options['epsilon']) for s in spectrograms])
+    expected = np.repeat(expected[..., np.newaxis], options['channels'], axis=-1)
+    assert batch.dtype == np.float32
+    assert batch.shape == expected.shape
+    np.testing.assert_allclose(batch, expected, rtol=0, atol=1e-5)
+
+
+@pytest.mark.parametrize('setting', SETTINGS)
+def test_writes_into_given_buffer(spectrograms, setting):
+    options = SETTINGS[setting]
+    batch = fit_batch(spectrograms, **options)
+
+    out = np.full(batch.shape, np.nan, dtype=np.float32)
+    result = fit_batch(spectrograms, out=out, **{key: value for key, value in options.items() if key != 'channels'})
+    assert result is out
+    np.testing.assert_array_equal(out, batch)
+
+
+def test_uniform_array_input_matches_list_input():
+    rng = np.random.default_rng(1)
+    stacked = rng.uniform(-80, 0, (4, TARGET_HEIGHT + 8, TARGET_WIDTH + 8)).astype(np.float32)
+    np.testing.assert_array_equal(fit_batch(stacked), fit_batch(list(stacked)))
+
+
+def test_rejects_mismatched_buffer():
+    with pytest.raises(ValueError):
+        fit_batch([np.zeros((TARGET_HEIGHT, TARGET_WIDTH))], out=np.empty((2, TARGET_HEIGHT, TARGET_WIDTH), dtype=np.float32))
@@ -0,0 +1,41 @@
+# test_spectrogram_ingest.py
+
+import io
+
+import numpy as np
+import pytest
+
+pytest.importorskip('librosa')  # audio_features, which spectrogram_ingest takes its constants from, needs it
+
+from spectrogram_ingest import SpectrogramPayloadError, load_spectrograms
+
+
+def npz_payload(compressed=True, **arrays):
+    buffer = io.BytesIO()
+    (np.savez_compressed if compressed else np.savez)(buffer, **arrays)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_reads_every_spectrogram(compressed):
+    payload = npz_payload(compressed, a=np.zeros((128, 100), dtype=np.float32), b=np.ones((2, 128, 50)))
+
+    spectrograms = load_spectrograms(payload, max_arrays=4, max_frames=2000)
+
+    assert [name for name, _ in spectrograms] == ['a', 'b[0]', 'b[1]']
+
+
+def test_rejects_compressed_member_expanding_past_the_limits():
+    # About 1 MB on the wire, 1 GB once inflated
+    payload = npz_payload(a=np.zeros((128, 2_000_000), dtype=np.float32))
+    assert len(payload) < 2 * 1024 * 1024
+
+    with pytest.raises(SpectrogramPayloadError, match='expands to'):
+        load_spectrograms(payload, max_arrays=4, max_frames=2000)
+
+
+def test_rejects_too_many_members_before_reading_them():
+    payload = npz_payload(**{f'x{index}': np.zeros((128, 10)) for index in range(6)})
+
+    with pytest.raises(SpectrogramPayloadError, match='holds 6 arrays'):
+        load_spectrograms(payload, max_arrays=4, max_frames=2000)
@@ -0,0 +1,52 @@
+# test_upload_stream.py
+
+import io
+import json
+
+
+def read_events(response):
+    """Parses a server-sent event stream into (event, payload) pairs."""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        if not block.strip():
+            continue
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_streams_decode_window_and_result_events(make_app, wav_file):
+    client = make_app(PREDICTION_CACHE=False).test_client()
+
+    response = client.post('/upload/stream', data={
+        'file': (io.BytesIO(wav_file.read_bytes()), 'track.wav'),
+        'song_name': 'Song',
+        'artist': 'Artist',
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = read_events(response)
+    names = [event for event, _ in events]
+    assert names[0] == 'decode'
+    assert names[-1] == 'result'
+    assert set(names[1:-1]) == {'window'}
+    assert len(names) - 2 == events[0][1]['windows']
+    result = events[-1][1]
+    assert result['song_name'] == 'Song' and result['genres']
+    assert result['cached'] is False
+
+
+def test_streams_a_cached_result_for_a_repeated_upload(make_app, wav_file):
+    client = make_app().test_client()
+    data = wav_file.read_bytes()
+
+    for cached in (False, True):
+        response = client.post('/upload/stream', data={
+            'file': (io.BytesIO(data), 'track.wav'),
+            'song_name': 'Song',
+            'artist': 'Artist',
+        }, content_type='multipart/form-data')
+        events = read_events(response)
+        assert events[-1][0] == 'result', events
+        assert events[-1][1]['cached'] is cached